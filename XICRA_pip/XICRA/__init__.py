@@ -1,11 +1,4 @@
-from pkg_resources import get_distribution
-try:
-	__version__ = get_distribution('XICRA').version
-except:
-	try:
-		__version__ = pkg_resources.resorce_filename('XICRA', VERSION)
-	except:
-		__version__ = 'local'
+import importlib
 
 __all__ = [
 	'modules',
@@ -14,5 +7,17 @@ __all__ = [
 	'other_tools'
 ]
 
-from XICRA import *
+def get_version():
+	from pkg_resources import get_distribution
+	try:
+		return (get_distribution('XICRA').version)
+	except:
+		return ('local')
 
+def __getattr__(name):
+	## retrieve version and import subpackages only when requested
+	if name == '__version__':
+		return (get_version())
+	if name in __all__:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
@@ -1,7 +1,14 @@
+import importlib
+
 __all__ = [
 	'extern_progs',
 	'set_config'	
 ]
 
-from XICRA.config import *
+def __getattr__(name):
+	## import submodules only when requested
+	if name in __all__:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
+
 
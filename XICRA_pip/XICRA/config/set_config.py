@@ -12,6 +12,8 @@ import io
 import sys
 import re
 import shutil
+import json
+import threading
 from io import open
 from sys import argv
 import subprocess
@@ -27,12 +29,112 @@ from XICRA.config import extern_progs
 ## Software
 ################
 
+## executables resolved in this process: {prog: (path, version)}
+_exe_registry = {}
+_exe_registry_lock = threading.RLock()
+
+##################
+def exe_registry_file():
+	"""Return the on-disk registry of executables.
+
+	Versions of the executables checked are saved in :file:`$XDG_CACHE_HOME/XICRA/executables.json`
+	(default: :file:`~/.cache/XICRA/executables.json`) so that they are not checked again in later runs.
+	"""
+	cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+	return (os.path.join(cache_dir, 'XICRA', 'executables.json'))
+
+##################
+def binary_stamp(path):
+	"""Return size and modification time of an executable.
+
+	:param path: Absolute path
+	:type path: string
+	:returns: List with size and modification time (ns) or None if not available.
+	"""
+	try:
+		stat_info = os.stat(path)
+	except OSError:
+		return (None)
+	return ([stat_info.st_size, stat_info.st_mtime_ns])
+
+##################
+def read_exe_registry():
+	"""Return the on-disk registry of executables as a dictionary: {path: {prog, version, stamp}}"""
+	registry_file = exe_registry_file()
+	try:
+		with open(registry_file) as registry_hd:
+			registry = json.load(registry_hd)
+	except (OSError, ValueError):
+		return ({})
+	
+	if not isinstance(registry, dict):
+		return ({})
+	return (registry)
+
+##################
+def save_exe_version(prog, path, version):
+	"""Save version of an executable in the on-disk registry.
+
+	Errors writing the registry are ignored: it is only used to save time.
+
+	:param prog: Software name
+	:param path: Absolute path
+	:param version: Version
+	"""
+	stamp = binary_stamp(path)
+	if not stamp:
+		return ()
+
+	registry_file = exe_registry_file()
+	try:
+		os.makedirs(os.path.dirname(registry_file), exist_ok=True)
+		registry = read_exe_registry()
+		registry[path] = {'prog': prog, 'version': version, 'stamp': stamp}
+
+		## write to a temporary file and rename
+		tmp_file = registry_file + '.' + str(os.getpid()) + '.tmp'
+		with open(tmp_file, 'w') as registry_hd:
+			json.dump(registry, registry_hd, indent=4)
+		os.replace(tmp_file, registry_file)
+	except OSError:
+		pass
+
+##################
+def get_version_cached(prog, path, Debug=False):
+	"""Get version of software, using the on-disk registry if possible.
+
+	The version saved is used if the executable has not changed (same size and 
+	modification time). Otherwise, it is retrieved using :func:`XICRA.config.set_config.get_version`
+	and saved.
+
+	:param prog: Program name
+	:param path: Absolute path
+	:param Debug: True/False
+
+	:returns: String containing version.
+	"""
+	entry = read_exe_registry().get(path)
+	if entry and entry.get('prog') == prog and entry.get('stamp') == binary_stamp(path):
+		if (Debug):
+			print(colored("** Debug: version for %s retrieved from %s" %(path, exe_registry_file()),'yellow'))
+		return (entry['version'])
+
+	prog_ver = get_version(prog, path, Debug=Debug)
+	## save only versions retrieved (e.g. not when the software fails)
+	if prog_ver != 'n.a.' and re.search('[0-9]', prog_ver):
+		save_exe_version(prog, path, prog_ver)
+	return (prog_ver)
+
 ##################
 def get_exe(prog, Debug=False, Return_Version=False):
 	"""Return absolute path of the executable program requested.
 
 	Given a program name it returns its executable to be called. It has to fulfilled a minimum version specified.
 
+	The executable is only resolved once for each process and versions are saved in
+	an on-disk registry (see :func:`XICRA.config.set_config.get_version_cached`), so 
+	calling this function for each sample does not check versions again.
+
 	:param prog: Software name
 	:type prog: string
 	:returns: Absolute path for the executable requested
@@ -44,15 +146,37 @@ def get_exe(prog, Debug=False, Return_Version=False):
 
 		Give them credit accordingly.
 
+	"""
+	with _exe_registry_lock:
+		if prog not in _exe_registry:
+			_exe_registry[prog] = resolve_exe(prog, Debug=Debug)
+		(exe_path, prog_ver) = _exe_registry[prog]
+
+	if (Return_Version):
+		return (exe_path, prog_ver)
+	else:
+		return (exe_path)
+
+##################
+def resolve_exe(prog, Debug=False):
+	"""Return absolute path and version of the executable program requested.
+
+	See :func:`XICRA.config.set_config.get_exe`.
+
+	:param prog: Software name
+	:type prog: string
+	:returns: Tuple with absolute path and version for the executable requested
 	"""
 	exe = ""
 	if prog in os.environ: 
-		exe = os.environ[env_var] ## python environent variables
+		exe = os.environ[prog] ## python environent variables
 	else:
 		exe = extern_progs.return_defatult_soft(prog) ## install in the system
 
 	## get paths
 	exe_path_tmp = my_which(exe)
+	if isinstance(exe_path_tmp, str): ## path with a directory part provided
+		exe_path_tmp = [exe_path_tmp]
 
 	## debug message
 	if (Debug):
@@ -70,26 +194,17 @@ def get_exe(prog, Debug=False, Return_Version=False):
 	## no min version available
 	if min_version == 'na':
 		if exe_path_tmp:
-			if (Return_Version):
-				return (exe_path_tmp[0], '') ## return first item
-			else:
-				return (exe_path_tmp[0]) ## return first item
+			return (exe_path_tmp[0], '') ## return first item
 	
 	## not installed in path
 	if exe_path_tmp is None or len(exe_path_tmp) == 0:
-		if (Return_Version):
-			print(colored("\n**ERROR: Software %s could not be found." % prog,'red'))
-			exit()
-			return('ERROR', 'n.a.')
-		else:
-			print(colored("\n**ERROR: Software %s could not be found." % prog,'red'))
-			exit()
-			return('ERROR')
-		
+		print(colored("\n**ERROR: Software %s could not be found." % prog,'red'))
+		exit()
+		return('ERROR', 'n.a.')
 
 	## Loop for all possibilities
 	for p in exe_path_tmp:
-		prog_ver = get_version(prog, p, Debug=Debug)
+		prog_ver = get_version_cached(prog, p, Debug=Debug)
 
 		if (Debug):
 			print (colored("** Debug: Software: %s\nPath: %s\nVersion: %s" %(prog, p, prog_ver), 'yellow'))
@@ -98,10 +213,7 @@ def get_exe(prog, Debug=False, Return_Version=False):
 			continue
 
 		if LooseVersion(prog_ver) >= LooseVersion(min_version):
-			if (Return_Version):
-				return (p, prog_ver)
-			else:
-				return (p)
+			return (p, prog_ver)
 
 
 	print(colored("\n**ERROR: Software %s version smaller than minimum version expected %s." %(prog,min_version),'red'))
@@ -1,3 +1,5 @@
+import importlib
+
 __all__ = [
 	'biotype',
 	'config',
@@ -12,9 +14,16 @@ __all__ = [
 	'tRNA',
 	'piRNA',
 	'map',
-	'test'
+	'test',
+	'profile',
+	'smallrna'
 	
 ]
 
-from XICRA.modules import *
+def __getattr__(name):
+	## import submodules only when requested
+	if name in __all__:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
+
 
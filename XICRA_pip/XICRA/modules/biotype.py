@@ -16,8 +16,8 @@ from termcolor import colored
 from XICRA import __version__ as pipeline_version
 from XICRA.config import set_config
 from XICRA.modules import help_XICRA, map
-from XICRA.scripts import RNAbiotype, multiQC_report
-from XICRA.other_tools import tools
+from XICRA.scripts import RNAbiotype, multiQC_report, expression_store
+from XICRA.other_tools import tools, intermediate
 
 from HCGB import sampleParser
 import HCGB.functions.aesthetics_functions as HCGB_aes
@@ -108,11 +108,11 @@ def run_biotype(options):
         elif options.noJoin:
             print ('+ Mode: fastq.\n+ Extension: ')
             print ("[ fastq, fq, fastq.gz, fq.gz ]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "trim", ["_trim"], options.debug)
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "trim", ["_trim"], options.debug)
         else:
             print ('+ Mode: join.\n+ Extension: ')
-            print ("[_joined.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "join", ['trim_joined.fastq'], options.debug)
+            print ("[_joined.fastq, _joined.fastq.gz]\n")
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "join", ['trim_joined.fastq', 'trim_joined.fastq.gz'], options.debug)
     else:
         if options.noTrim:
             print ('+ Mode: fastq.\n+ Extension: ')
@@ -121,7 +121,7 @@ def run_biotype(options):
         else:
             print ('+ Mode: trim.\n+ Extension: ')
             print ("[_trim.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "trim", ['_trim'], options.debug)
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "trim", ['_trim'], options.debug)
     
     ## debug message
     if (Debug):
@@ -190,7 +190,8 @@ def run_biotype(options):
 
     ## get RNAbiotype information
     RNAbiotype.RNAbiotype_module_call(mapping_results, biotype_outdir_dict, options.annotation, 
-                                      options.debug, max_workers_int, threads_job, multimapping, options.stranded)
+                                      options.debug, options.threads, threads_job, multimapping, options.stranded, 
+                                      info_dir=HCGB_files.create_subfolder("info", outdir))
 
     # time stamp
     start_time_partial = HCGB_time.timestamp(start_time_partial)
@@ -251,7 +252,15 @@ def run_biotype(options):
         ## copy or link files for each sample analyzed
         abs_csv_outfile = os.path.join(biotype_report, "summary.csv")
         all_data.to_csv(abs_csv_outfile)
-       
+
+        ## sparse store: summary.csv is still required for plotting
+        if options.expression_format != 'csv':
+            if expression_store.parquet_available():
+                abs_store_outfile = os.path.join(biotype_report, "summary.parquet")
+                expression_store.write_store(expression_store.matrix2long(all_data), abs_store_outfile)
+            else:
+                print (colored("** WARNING: pyarrow is not available. No expression store generated.", "yellow"))
+
         ## create plot: call R and XICRA::stats 
         ## outfile_pdf = os.path.join(biotype_report, "RNAbiotypes_summary.pdf") ## creates automatically the name biotypes-plot.pdf
         
@@ -15,11 +15,13 @@ This module downloads data for genome annotation, miRNA, tRNA and piRNA analysis
 import os
 import sys
 import re
+import tempfile
 from io import open
 from termcolor import colored
 
 ## import my modules
 import HCGB.functions.aesthetics_functions as HCGB_aes
+import HCGB.functions.fasta_functions as HCGB_fasta
 import HCGB.functions.files_functions as HCGB_files
 import HCGB.functions.main_functions as HCGB_main
 import HCGB.functions.time_functions as HCGB_time
@@ -256,6 +258,68 @@ def piRNA_db(database, piRNA_db, debug):
     
     return()
 
+####################################################
+def piRNA_gold_index(gold_piRNA, Debug=False):
+    """
+    Given a gold piRNA fasta file it returns a set of sequences to use as an index.
+    
+    The index is saved once, next to the fasta file provided (e.g. hsa.gold.fa.seqs), containing
+    a unique sequence per line. Later calls read this file instead of parsing the fasta file 
+    again. Sequences are returned as a python set, so look ups for each read are O(1).
+    
+    :param gold_piRNA: Absolute path to gold piRNA fasta file (piRBase)
+    :param Debug: True/False for debugging messages
+    
+    :type gold_piRNA: string
+    :type Debug: bool
+    
+    :returns: Set of gold piRNA sequences.
+    """
+    
+    index_file = gold_piRNA + ".seqs"
+    filename_stamp = os.path.join(os.path.dirname(gold_piRNA), "." + os.path.basename(gold_piRNA) + "_index_success")
+    
+    ## the index is only valid for the same fasta file: size and modification time
+    fasta_stat = os.stat(gold_piRNA)
+    index_key = "#%s\t%s" %(fasta_stat.st_size, fasta_stat.st_mtime_ns)
+    
+    ## check if previously generated
+    if os.path.isfile(filename_stamp) and HCGB_files.is_non_zero_file(index_file):
+        with open(index_file, 'r') as index_hd:
+            if index_hd.readline().rstrip("\n") == index_key:
+                if Debug:
+                    stamp = HCGB_time.read_time_stamp(filename_stamp)
+                    HCGB_aes.debug_message("A previous command generated gold piRNA index on: %s [%s]" %(stamp, index_file), "yellow")
+                
+                seq_id = set(line.rstrip() for line in index_hd)
+                return (seq_id)
+        
+        if Debug:
+            HCGB_aes.debug_message("gold piRNA fasta file changed, index will be generated again: " + index_file, "yellow")
+    
+    ## read fasta file and keep sequences: keys are sequences, values are names
+    seq_dict = HCGB_fasta.get_fasta_dict(gold_piRNA, Debug=Debug)
+    seq_id = set(seq_dict.keys())
+    
+    ## debugging messages
+    if Debug:
+        HCGB_aes.debug_message("gold piRNA sequences: " + str(len(seq_id)), "yellow")
+        HCGB_aes.debug_message("gold piRNA index: " + index_file, "yellow")
+    
+    ## save index for later usage: write a temporary file and rename it, so samples 
+    ## running at the same time never read a truncated index
+    tmp_fd, tmp_index = tempfile.mkstemp(prefix=os.path.basename(index_file) + ".", suffix=".tmp", dir=os.path.dirname(index_file))
+    with os.fdopen(tmp_fd, 'w') as index_hd:
+        index_hd.write(index_key + "\n")
+        for seq in sorted(seq_id):
+            index_hd.write(seq + "\n")
+    os.chmod(tmp_index, 0o644)
+    os.replace(tmp_index, index_file)
+    
+    HCGB_time.print_time_stamp(filename_stamp)
+    
+    return (seq_id)
+
 ####################################################
 def piRNA_info(database_folder, species_name="hsa", Debug=False):
     """
@@ -170,6 +170,14 @@ def print_help_adapters():
 
 ###############
 def help_join_reads():
+    print (colored("\n\n***** Join paired-end reads *****\n", 'yellow'))
+    print ("Paired-end reads of small RNA inserts overlap and are joined into a single read. Reads are")
+    print ("joined using fastq-join (--join_software fastqjoin) or a built-in multi-threaded merger")
+    print ("(--join_software XICRA), with the same overlap scoring.\n")
+    print ("For each sample, joined reads (<sample>_trim_joined.fastq), unjoined reads (<sample>_trimmed_unjoin_R1/R2.fastq)")
+    print ("and statistics (<sample>.join_stats.json) are created. Outputs are compressed using --compress gz/zstd.")
+    print ("Merge rate of each sample and histograms of overlap length, mismatches and joined length (XICRA merger)")
+    print ("are summarized in report/join.\n")
     return ()
 
 ###############
@@ -9,20 +9,23 @@ Joins paired-end sequence reads that overlap.
 ## import useful modules
 import os
 import time
+import shutil
 import concurrent.futures
+import pandas as pd
 from termcolor import colored
 
 ## import my modules
 from XICRA import __version__ as pipeline_version
 from XICRA.modules import help_XICRA
 from XICRA.config import set_config
+from XICRA.other_tools import scheduler, step_cache, instrument, intermediate
+from XICRA.scripts import join_reads
 from HCGB import sampleParser
 import HCGB.functions.aesthetics_functions as HCGB_aes
 import HCGB.functions.time_functions as HCGB_time
 import HCGB.functions.files_functions as HCGB_files
 import HCGB.functions.info_functions as HCGB_info
 import HCGB.functions.main_functions as HCGB_main
-import HCGB.functions.system_call_functions as HCGB_system
 
 ##############################################
 def run_join(options):
@@ -88,7 +91,7 @@ def run_join(options):
     else:
         print ('+ Mode: trim.\n+ Extension: ')
         print ("[ _trim_ ]\n")
-        pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "trim", ['_trim_'], options.debug)
+        pd_samples_retrieved = intermediate.get_files(options, input_dir, "trim", ['_trim_'], options.debug)
     
     ## debug message
     if (Debug):
@@ -118,10 +121,18 @@ def run_join(options):
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(fastqjoin_caller, sorted(cluster["sample"].tolist()), 
+    ## send for each sample when CPUs and RAM are available
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
+    
+    ## compression of joined reads: project setting
+    compress = intermediate.get_compression(info_dir, options.compress)
+    
+    with scheduler.ResourceScheduler(options.threads, threads_job, step="join", info_dir=info_dir, Debug=Debug) as executor:
+        commandsSent = { executor.submit(join_caller, sorted(cluster["sample"].tolist()), 
                                          outdir_dict[name[0]], name[0], threads_job, options.perc_diff,
+                                         options.join_software, options.min_overlap, compress,
                                          Debug): name[0] for name, cluster in sample_frame }
 
         for cmd2 in concurrent.futures.as_completed(commandsSent):
@@ -135,8 +146,10 @@ def run_join(options):
 
     print ("\n\n+ Joining reads has finished...")
     
-    ## TODO: create statistics on joined reads
-    ##
+    ## statistics on joined reads
+    outdir_report = HCGB_files.create_subfolder("report", outdir)
+    join_report = HCGB_files.create_subfolder("join", outdir_report)
+    join_statistics(outdir_dict, join_report)
 
     print ("\n*************** Finish *******************")
     HCGB_time.timestamp(start_time_total)
@@ -154,7 +167,8 @@ def run_join(options):
     runInfo = { "module":"join", "time":time.time(),
                 "XICRA version":pipeline_version,
                 'sample_info': samples_info,
-                'outdir_dict': outdir_dict}
+                'outdir_dict': outdir_dict,
+                'join_report': join_report}
     
     HCGB_info.dump_info_run(info_dir, "join", options, runInfo, options.debug)
     
@@ -168,23 +182,116 @@ def run_join(options):
     return()
 
 #############################################
-def fastqjoin_caller(list_reads, sample_folder, name, threads, perc_diff, Debug):
-    ## check if previously joined and succeeded
+def join_caller(list_reads, sample_folder, name, threads, perc_diff, join_software, min_overlap, compress, Debug):
+    """Joins paired-end reads of a sample, if not previously done with same reads and options.
+
+    Reads are joined using fastq-join or XICRA (see :func:`XICRA.scripts.join_reads.join_pairs`).
+    Statistics are saved in ``<sample>.join_stats.json``.
+
+    :param list_reads: paired-end reads of the sample
+    :param sample_folder: output folder
+    :param name: sample name
+    :param threads: threads available
+    :param perc_diff: maximum percentage of mismatches in the overlap
+    :param join_software: fastqjoin or XICRA
+    :param min_overlap: minimum overlap length
+    :param compress: compression of the output: none, gz or zstd
+    :param Debug: display complete log.
+
+    :returns: True/False
+    """
+    ## check if previously joined and succeeded with same reads and options
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    if join_software == 'XICRA':
+        key = step_cache.step_key(list_reads, [perc_diff, min_overlap, compress, 'join_reads'], None, Debug)
+    else:
+        key = step_cache.step_key(list_reads, [perc_diff, min_overlap, compress], 'fastqjoin', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = HCGB_time.read_time_stamp(filename_stamp)
-        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'fastqjoin'), 'yellow'))
+        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, join_software), 'yellow'))
+        return (True)
+    
+    if (len(list_reads) != 2):
+        print ('** Wrong number of files provided for sample: %s...' %name)
+        return (False)
+    
+    stats_file = os.path.join(sample_folder, name + '.join_stats.json')
+    if join_software == 'XICRA':
+        out_files = join_reads.output_names(sample_folder, name, compress)
+        try:
+            stats = join_reads.join_pairs(list_reads[0], list_reads[1], out_files, threads, 
+                                          min_overlap, perc_diff, compress, Debug)
+        except (OSError, ValueError) as err:
+            print (colored("** ERROR: Reads could not be joined for sample %s: %s" %(name, err), 'red'))
+            return (False)
     else:
-        # Call fastqjoin
+        ## fastq-join reads plain and gzip compressed files
+        fastqjoin_reads = list_reads
+        if any(read_file.endswith('.zst') for read_file in list_reads):
+            fastqjoin_reads = [os.path.join(sample_folder, 'tmp_R%s.fastq' %(i+1)) for i in range(len(list_reads))]
+            for read_file, tmp_file in zip(list_reads, fastqjoin_reads):
+                with intermediate.open_reads(read_file, threads) as in_hd, open(tmp_file, 'w') as out_hd:
+                    shutil.copyfileobj(in_hd, out_hd, 1 << 20)
+        
         fastqjoin_exe = set_config.get_exe('fastqjoin')
-        code_returned = fastqjoin(fastqjoin_exe, list_reads, sample_folder, name, threads, perc_diff, Debug)
-        if code_returned:
-            HCGB_time.print_time_stamp(filename_stamp)
-        else:
+        code_returned = fastqjoin(fastqjoin_exe, fastqjoin_reads, sample_folder, name, threads, perc_diff, min_overlap, Debug)
+        for tmp_file in set(fastqjoin_reads) - set(list_reads):
+            os.remove(tmp_file)
+        if code_returned != 'OK':
             print ('** Sample %s failed...' %name)
+            return (False)
+        stats = join_reads.fastqjoin_stats(os.path.join(sample_folder, name + '.fastqjoin.log'))
+        
+        ## compress outputs
+        if compress != 'none':
+            for out_file in join_reads.output_names(sample_folder, name):
+                if not intermediate.compress_file(out_file, compress, threads):
+                    print ('** Sample %s failed...' %name)
+                    return (False)
+    
+    stats['software'] = join_software
+    join_reads.save_stats(stats, stats_file)
+    print ("+ Sample %s: %s of %s read pairs joined (%s %%)" %(name, stats.get('joined'), stats.get('pairs'), stats.get('merge_rate')))
+    step_cache.save_step(filename_stamp, key)
+    return (True)
+
+#############################################
+def join_statistics(outdir_dict, report_folder):
+    """Summarizes statistics of joined reads for all samples.
+
+    Creates in the report folder ``join_statistics.csv`` (pairs, joined and merge rate for each sample)
+    and ``join_histograms.csv`` (overlap length, mismatches and joined length for each sample, if available).
+
+    :param outdir_dict: output folder of each sample
+    :param report_folder: report folder
+    """
+    summary = []
+    histograms = []
+    for name, sample_folder in sorted(outdir_dict.items()):
+        stats_file = os.path.join(sample_folder, name + '.join_stats.json')
+        if not HCGB_files.is_non_zero_file(stats_file):
+            continue
+        stats = HCGB_main.read_json_file(stats_file)
+        summary.append({'sample': name, 'software': stats.get('software'), 'pairs': stats.get('pairs'), 
+                        'joined': stats.get('joined'), 'merge_rate': stats.get('merge_rate')})
+        for hist in ('overlap_length', 'mismatches', 'joined_length'):
+            for value, count in stats.get(hist, {}).items():
+                histograms.append({'sample': name, 'statistic': hist, 'value': int(value), 'count': count})
+    
+    if not summary:
+        return ()
+    
+    summary_df = pd.DataFrame(summary)
+    summary_df.to_csv(os.path.join(report_folder, 'join_statistics.csv'), index=False)
+    if histograms:
+        pd.DataFrame(histograms).to_csv(os.path.join(report_folder, 'join_histograms.csv'), index=False)
+    
+    print ("\n+ Statistics of joined reads:")
+    print (summary_df.to_string(index=False))
+    print ("\n+ Statistics saved in folder: %s" %report_folder)
 
 #############################################
-def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff, Debug):
+def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff, min_overlap, Debug):
     """
     
     :param fastqjoin_exe:
@@ -209,7 +316,7 @@ def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff,
     
     ## check paired-end file
     if (len(reads) == 2):
-        cmd = fastqjoin_exe + ' -p %s %s %s -o %s -o %s -o %s > %s' %(perc_diff, reads[0], 
+        cmd = fastqjoin_exe + ' -p %s -m %s %s %s -o %s -o %s -o %s > %s' %(perc_diff, min_overlap, reads[0], 
                                                                   reads[1], unjoined_1, unjoined_2, 
                                                                   joined_reads, logfile)
     else:
@@ -218,5 +325,5 @@ def fastqjoin (fastqjoin_exe, reads, path, sample_name, num_threads, perc_diff,
     
     
 
-    return(HCGB_system.system_call(cmd))
+    return(instrument.system_call(cmd, step='fastqjoin', sample=sample_name))
     
\ No newline at end of file
@@ -8,12 +8,14 @@ Create RNA biotype analysis using STAR and featureCounts
 """
 ## import useful modules
 import os
+import contextlib
 import concurrent.futures
 from termcolor import colored
 
 ## import my modules
 from XICRA.config import set_config
 from XICRA.scripts import STAR_caller, multiQC_report
+from XICRA.other_tools import tools, scheduler, step_cache, instrument
 
 from HCGB import sampleParser
 import HCGB.functions.time_functions as HCGB_time
@@ -63,17 +65,21 @@ def mapReads_module_STAR(options, pd_samples_retrieved, outdir_dict, Debug,
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
+    ## manifest for the results of each sample
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
+    
     ## options
     STAR_exe = set_config.get_exe("STAR", Debug=Debug)
     cwd_folder = os.path.abspath("./")
     folder=HCGB_files.create_subfolder('STAR_files', cwd_folder)
 
     ## For many samples it will have to load genome index in memory every time.
-    ## For a unique sample it will not matter. Take care genome might stay in memory.
-    ## Use before loop option LoadAndExit and then:
+    ## Load genome once before loop (LoadAndExit) and then:
         ## in loop
         ## Use option LoadAndKeep, set shared memory > 30 Gb
-    ## when finished loop Remove memory        
+    ## when finished loop Remove memory (also if any error occurs)
     
     ## check reference
     if (options.fasta):
@@ -87,42 +93,63 @@ def mapReads_module_STAR(options, pd_samples_retrieved, outdir_dict, Debug,
     elif (options.genomeDir):
         print ("+ genomeDir provided.")
         options.genomeDir = os.path.abspath(options.genomeDir)
-        
-    ## remove previous reference genome from memory
-    print ("+ Remove genome in memory from previous call... (if any)")
-    #STAR_caller.remove_Genome(STAR_exe, options.genomeDir, folder, options.threads)
     
-    ## load reference genome
-    #STAR_caller.load_Genome(folder, STAR_exe, options.genomeDir, options.threads)
-
-    ## functions.time_functions.timestamp
-    start_time_partial = HCGB_time.timestamp(start_time_partial)
+    ## memory available before loading the genome
+    free_RAM = tools.available_RAM()
     
-    print ("+ Mapping sequencing reads for each sample retrieved...")
-
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(mapReads_caller_STAR, sorted(cluster["sample"].tolist()), 
-                                         outdir_dict[name[0]], name[0], threads_job, STAR_exe, 
-                                         options.genomeDir, options.limitRAM, 
-                                         Debug, multimapping): name[0] for name, cluster in sample_frame }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
+    ## load reference genome in shared memory, if any sample to map
+    pending = [name[0] for name, cluster in sample_frame 
+               if not step_cache.previous_results(outdir_dict[name[0]] + '/.success', 
+                                                  mapping_key(sorted(cluster["sample"].tolist()), options.genomeDir, multimapping))]
+    if pending:
+        genome_context = STAR_caller.shared_genome(folder, STAR_exe, options.genomeDir, options.threads)
+    else:
+        genome_context = contextlib.nullcontext(False)
+    
+    with genome_context as shared:
 
-    print ("\n\n+ Mapping reads has finished...")
+        ## functions.time_functions.timestamp
+        start_time_partial = HCGB_time.timestamp(start_time_partial)
+        
+        ## number of samples mapped at the same time according to memory available
+        (job_RAM, max_RAM) = STAR_caller.mapping_RAM(options.genomeDir, options.limitRAM, shared, free_RAM)
+        max_workers_RAM = min(max_workers_int, scheduler.fit_jobs(options.threads, threads_job, job_RAM, max_RAM))
+        if (max_workers_RAM < max_workers_int):
+            print ("+ Memory available allows to map %s samples at the same time" %max_workers_RAM)
+            threads_job = max(threads_job, int(options.threads/max_workers_RAM))
+            max_workers_int = max_workers_RAM
+        
+        ## debug message
+        if (Debug):
+            print (colored("**DEBUG: free_RAM " +  str(free_RAM) + " **", 'yellow'))
+            print (colored("**DEBUG: genome_size " +  str(STAR_caller.genome_size(options.genomeDir)) + " **", 'yellow'))
+            print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
+            print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
+        
+        if shared:
+            genomeLoad = "LoadAndKeep"
+        else:
+            genomeLoad = "NoSharedMemory"
+        
+        print ("+ Mapping sequencing reads for each sample retrieved...")
     
-    ## functions.time_functions.timestamp
-    start_time_partial = HCGB_time.timestamp(start_time_partial)
+        ## send for each sample when CPUs and RAM are available
+        with scheduler.ResourceScheduler(options.threads, threads_job, job_RAM=job_RAM, max_RAM=max_RAM, Debug=Debug) as executor:
+            commandsSent = { executor.submit(mapReads_caller_STAR, sorted(cluster["sample"].tolist()), 
+                                             outdir_dict[name[0]], name[0], threads_job, STAR_exe, 
+                                             options.genomeDir, options.limitRAM, 
+                                             Debug, multimapping, genomeLoad): name[0] for name, cluster in sample_frame }
+    
+            for cmd2 in concurrent.futures.as_completed(commandsSent):
+                details = commandsSent[cmd2]
+                try:
+                    data = cmd2.result()
+                except Exception as exc:
+                    print ('***ERROR:')
+                    print (cmd2)
+                    print('%r generated an exception: %s' % (details, exc))
 
-    ## remove reference genome from memory
-    #STAR_caller.remove_Genome(STAR_exe, options.genomeDir, folder, options.threads)
+    print ("\n\n+ Mapping reads has finished...")
     
     ## functions.time_functions.timestamp
     start_time_partial = HCGB_time.timestamp(start_time_partial)
@@ -170,7 +197,21 @@ def mapReads_module_STAR(options, pd_samples_retrieved, outdir_dict, Debug,
     return(start_time_partial, mapping_results)
 
 #################################
-def mapReads_caller_STAR(files, folder, name, threads, STAR_exe, genomeDir, limitRAM_option, Debug, multimapping):
+def mapping_key(files, genomeDir, multimapping):
+    """Key of the mapping step for a sample. See :func:`XICRA.other_tools.step_cache.step_key`.
+    
+    The genome index is identified by its parameters file, as hashing the whole index is too expensive.
+    
+    :param files: unjoined trimmed files of the sample
+    :param genomeDir: path to the genome directory to do the mappig
+    :param multimapping: Flag to say whether to use multimapping reads or not
+    
+    :returns: key (hexadecimal)
+    """
+    return (step_cache.step_key(files + [os.path.join(genomeDir, 'genomeParameters.txt')], [multimapping], 'STAR'))
+
+#################################
+def mapReads_caller_STAR(files, folder, name, threads, STAR_exe, genomeDir, limitRAM_option, Debug, multimapping, genomeLoad="LoadAndKeep"):
     """Mapping of a given sample with STAR
 
     First, checks if the trimmed unjoined files exist for the sample and also
@@ -187,6 +228,7 @@ def mapReads_caller_STAR(files, folder, name, threads, STAR_exe, genomeDir, limi
     :param limitRAM_option: limit RAM bytes to be used in the computation
     :param Debug: show extra information of the process
     :param multimapping: Flag to say whether to use multimapping reads or not
+    :param genomeLoad: LoadAndKeep if genome loaded in shared memory, NoSharedMemory otherwise
     
     :type folder: string
     :type name: string
@@ -196,13 +238,15 @@ def mapReads_caller_STAR(files, folder, name, threads, STAR_exe, genomeDir, limi
     :type limitRAM_option: int
     :type Debug: boolean
     :type multimapping: boolean
+    :type genomeLoad: string
 
     :returns: None
     """
 
-    ## check if previously joined and succeeded
+    ## check if previously mapped and succeeded with same reads and options
     filename_stamp = folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    key = mapping_key(files, genomeDir, multimapping)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = HCGB_time.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'STAR'), 'yellow'))
     else:
@@ -219,10 +263,10 @@ def mapReads_caller_STAR(files, folder, name, threads, STAR_exe, genomeDir, limi
             print (files)
             
         # Call STAR
-        code_returned = STAR_caller.mapReads("LoadAndKeep", files, folder, name, STAR_exe, genomeDir, limitRAM_option, threads, Debug, multimapping)
+        code_returned = STAR_caller.mapReads(genomeLoad, files, folder, name, STAR_exe, genomeDir, limitRAM_option, threads, Debug, multimapping)
         
-        if (code_returned):
-            HCGB_time.print_time_stamp(filename_stamp)
+        if step_cache.succeeded(code_returned):
+            step_cache.save_step(filename_stamp, key)
         else:
             print ("+ Mapping sample %s failed..." %name)
     
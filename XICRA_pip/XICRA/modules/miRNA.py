@@ -29,9 +29,16 @@ from XICRA.modules import database
 from XICRA.scripts import generate_DE
 
 from XICRA.scripts import mirtop_caller
+from XICRA.scripts import isomir_converter
 from XICRA.scripts import sRNAbench_caller
 from XICRA.scripts import optimir_caller
 from XICRA.scripts import miraligner_caller
+from XICRA.scripts import collapse_reads
+from XICRA.other_tools import scheduler, step_cache, instrument, java_worker, intermediate
+
+## software accepting collapsed reads (unique sequences and counts)
+## OptimiR only accepts fastq files
+collapsed_software = ["sRNAbench", "miraligner"]
 
 
 ##############################################
@@ -43,7 +50,7 @@ def run_miRNA(options):
     - miRNA gff3 annotation, hairpin fasta, mature fasta, miRBase str annotation
     If some is missing it will be downloaded from miRBase. 
 
-    Then, it calls miRNA_analysis() for each sample in parallel.
+    Then, it calls miRNA_analysis() for each sample and software in parallel.
     Gets user software selection: sRNAbench, optimiR, miraligner.
     Standarize results using miRTop.
     Finally, build final matrix comparing all samples.
@@ -107,7 +114,12 @@ def run_miRNA(options):
     
     ## get files
     print ('+ Getting files from input folder... ')
-    if options.pair:
+    if options.collapsed:
+        options.pair = False
+        print ('+ Mode: smallrna.\n+ Extension: ')
+        print ("[ .rc ]\n")
+        pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "smallrna", ["rc"], options.debug)
+    elif options.pair:
         options.pair = False ## set paired-end to false for further prepocessing
         if options.noTrim:
             print ('+ Mode: fastq.\n+ Extension: ')
@@ -115,8 +127,8 @@ def run_miRNA(options):
             pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ["fastq", "fq", "fastq.gz", "fq.gz"], options.debug)
         else:
             print ('+ Mode: join.\n+ Extension: ')
-            print ("[_joined.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "join", ['_joined.fastq'], options.debug)
+            print ("[_joined.fastq, _joined.fastq.gz]\n")
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "join", ['_joined.fastq', '_joined.fastq.gz'], options.debug)
     else:
         if options.noTrim:
             print ('+ Mode: fastq.\n+ Extension: ')
@@ -125,7 +137,7 @@ def run_miRNA(options):
         else:
             print ('+ Mode: join.\n+ Extension: ')
             print ("[_joined.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "trim", ['_trim'], options.debug)
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "trim", ['_trim'], options.debug)
     
     ## debug message
     if (Debug):
@@ -163,9 +175,9 @@ def run_miRNA(options):
     ## for samples
     outdir_dict = HCGB_files.outdir_project(outdir, options.project, pd_samples_retrieved, "miRNA", options.debug)
     
-    ## optimize threads
+    ## optimize threads: a job for each sample and software
     name_list = set(pd_samples_retrieved["new_name"].tolist())
-    threads_job = HCGB_main.optimize_threads(options.threads, len(name_list)) ## threads optimization
+    threads_job = HCGB_main.optimize_threads(options.threads, len(name_list)*len(options.soft_name)) ## threads optimization
     max_workers_int = int(options.threads/threads_job)
 
     ## debug message
@@ -174,31 +186,73 @@ def run_miRNA(options):
         print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
         print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
 
-    print ("+ Create a miRNA analysis for each sample retrieved...")    
+    print ("+ Create a miRNA analysis for each sample and software retrieved...")    
     
-    ## call miRNA_analysis: 
+    ## call miRNA_analysis for each sample and software: 
     ## Get user software selection: sRNAbench, optimir, ...
     ## Standarize using miRTop
     
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
-        commandsSent = { executor.submit(miRNA_analysis, sorted(cluster["sample"].tolist()), 
-                                         outdir_dict[name[0]], name[0], threads_job, options.miRNA_gff,
-                                         options.soft_name, options.matureFasta, options.hairpinFasta, 
-                                         options.miRBase_str, options.species, 
-                                         options.miRNA_db, Debug): name[0] for name, cluster in sample_frame }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
+    ## load miRNA annotation once to convert results of all samples, unless miRTop is requested
+    annotation = None
+    if not options.miRTop:
+        annotation = isomir_converter.load_annotation(options.hairpinFasta, options.miRNA_gff, options.species)
+    
+    ## software using collapsed reads: sent once reads are collapsed for the sample
+    soft_collapsed = [soft for soft in options.soft_name if soft in collapsed_software]
+    soft_reads = [soft for soft in options.soft_name if soft not in collapsed_software]
+    
+    ## send each job when CPUs and RAM are available
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
+    java_worker.enable(options.java_worker)
+    with scheduler.ResourceScheduler(options.threads, threads_job, step="miRNA", info_dir=info_dir, Debug=Debug) as executor:
+        
+        def send_analysis(soft, reads, name):
+            return (executor.submit(miRNA_analysis, reads, outdir_dict[name], name, threads_job, options.miRNA_gff,
+                                    soft, options.matureFasta, options.hairpinFasta, 
+                                    options.miRBase_str, options.species, 
+                                    options.miRNA_db, Debug, annotation))
+        
+        commandsSent = {}
+        for name, cluster in sample_frame:
+            reads = sorted(cluster["sample"].tolist())
+            ## reads collapsed by module smallrna: fastq tools read shards (see XICRA.other_tools.scatter)
+            if reads[0].endswith('.rc'):
+                for soft in options.soft_name:
+                    commandsSent[send_analysis(soft, reads, name[0])] = (name[0], soft, reads)
+                continue
+            if soft_collapsed:
+                collapse_folder = HCGB_files.create_subfolder('collapse', outdir_dict[name[0]])
+                commandsSent[executor.submit(collapse_reads.collapse_caller, reads, collapse_folder, 
+                                             name[0], threads_job, Debug)] = (name[0], 'collapse', reads)
+            for soft in soft_reads:
+                commandsSent[send_analysis(soft, reads, name[0])] = (name[0], soft, reads)
+        
+        while commandsSent:
+            (done, not_done) = concurrent.futures.wait(commandsSent, return_when=concurrent.futures.FIRST_COMPLETED)
+            for cmd2 in done:
+                (name, soft, reads) = commandsSent.pop(cmd2)
+                try:
+                    data = cmd2.result()
+                except Exception as exc:
+                    print ('***ERROR:')
+                    print (cmd2)
+                    print('%r generated an exception: %s' % ((name, soft), exc))
+                    continue
+                
+                ## reads collapsed: send software using them
+                if soft == 'collapse':
+                    if data:
+                        reads = [data]
+                    for soft_sample in soft_collapsed:
+                        commandsSent[send_analysis(soft_sample, reads, name)] = (name, soft_sample, reads)
+    
+    ## close java workers, if any
+    java_worker.shutdown()
 
     print ("\n\n+ miRNA analysis is finished...")
     print ("+ Let's summarize all results...")
@@ -222,7 +276,8 @@ def run_miRNA(options):
     
     ## merge all parse gtf files created
     print ("+ Summarize miRNA analysis for all samples...")
-    generate_DE.generate_DE(results_df, options.debug, expression_folder)
+    generate_DE.generate_DE(results_df, options.debug, expression_folder, expression_format=options.expression_format, 
+                            incremental=options.incremental)
 
     print ("\n*************** Finish *******************")
     HCGB_time.timestamp(start_time_total)
@@ -252,63 +307,67 @@ def run_miRNA(options):
     return()
 
 ###############
-def miRNA_analysis(reads, folder, name, threads, miRNA_gff, soft_list, 
-                   matureFasta, hairpinFasta, miRBase_str, species, database, Debug):
-    """Passes the sample information to be analyzed by the selected softwares
+def miRNA_analysis(reads, folder, name, threads, miRNA_gff, soft, 
+                   matureFasta, hairpinFasta, miRBase_str, species, database, Debug, annotation=None):
+    """Passes the sample information to be analyzed by the selected software
 
-    Checks the introduced softwares and calls them one by one to analyze the given
-    sample. It stores their results in separated folders, which are called as the 
-    used software. Finally, it unifies each software output in miRTop format.
+    Calls the software given to analyze the sample. It stores the results in a separated
+    folder, which is called as the software. Finally, it unifies the software output in 
+    miRTop format (counts/mirtop.tsv).
+    
+    Each sample and software is sent as a separated job (see :func:`XICRA.modules.miRNA.run_miRNA`),
+    so different software can analyze the same sample at the same time.
     
-    :param reads: file with sample reads
+    :param reads: file with sample reads or collapsed reads (see :func:`XICRA.scripts.collapse_reads.collapse_caller`)
     :param folder: output folder
     :param name: sample name
     :param threads: selected threads (by defoult 2)
     :param miRNA_gff: miRNA gff3 annotation file
-    :param soft_list: list with the selected softwares 
+    :param soft: software selected: sRNAbench, optimir or miraligner
     :param matureFasta: mature fasta file 
     :param hairpinFasta: hairpin fasta file
     :param miRBase_str: miRBase str annotation 
     :param species: species tag ID. Default: hsa (Homo sapiens)
     :param database: path to store miRNA annotation files downloaded
     :param Debug: display complete log.
+    :param annotation: miRNA annotation (see :func:`XICRA.scripts.isomir_converter.load_annotation`). 
+        If not provided, miRTop is called to convert results.
 
 
     :returns: None
     """
     
-    for soft in soft_list:
-        if (soft == "sRNAbench"):
-            ## create sRNAbench
-            sRNAbench_folder = HCGB_files.create_subfolder('sRNAbench', folder)
-            code_success = sRNAbench_caller.sRNAbench_caller(reads, sRNAbench_folder, name, threads, species, Debug) ## Any additional sRNAbench parameter?
-                
-            if not code_success:
-                print ('** miRTop would not be executed for sample %s...' %name)
-                return ()
-            
-            ## create folder for sRNAbench results
-            miRTop_folder = HCGB_files.create_subfolder("sRNAbench_miRTop", folder)
-            mirtop_caller.miRTop_caller(sRNAbench_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'sRNAbench', species, Debug)
-            
-        ###
-        if (soft == "optimir"):
-            ## create OptimiR analysis
-            optimir_folder = HCGB_files.create_subfolder('OptimiR', folder)
-            code_success = optimir_caller.optimir_caller(reads, optimir_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff, species, Debug) ## Any additional sRNAbench parameter?
-            
-            ## create folder for Optimir results
-            miRTop_folder = HCGB_files.create_subfolder("OptimiR_miRTop", folder)
-            mirtop_caller.miRTop_caller(optimir_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'optimir', species, Debug)
-            
-        ###
-        if (soft == "miraligner"):
-            
-            ## create OptimiR analysis
-            miraligner_folder = HCGB_files.create_subfolder('miraligner', folder)
-            code_success = miraligner_caller.miraligner_caller(reads, miraligner_folder, name, threads, database, species, Debug) 
+    if (soft == "sRNAbench"):
+        ## create sRNAbench
+        sRNAbench_folder = HCGB_files.create_subfolder('sRNAbench', folder)
+        code_success = sRNAbench_caller.sRNAbench_caller(reads, sRNAbench_folder, name, threads, species, Debug) ## Any additional sRNAbench parameter?
             
-            ## create folder for Optimir results
-            miRTop_folder = HCGB_files.create_subfolder("miraligner_miRTop", folder)
-            mirtop_caller.miRTop_caller(miraligner_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'seqbuster', species, Debug)
+        if not code_success:
+            print ('** miRTop would not be executed for sample %s...' %name)
+            return ()
+        
+        ## create folder for sRNAbench results
+        miRTop_folder = HCGB_files.create_subfolder("sRNAbench_miRTop", folder)
+        mirtop_caller.miRTop_caller(sRNAbench_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'sRNAbench', species, Debug, annotation)
+        
+    ###
+    if (soft == "optimir"):
+        ## create OptimiR analysis
+        optimir_folder = HCGB_files.create_subfolder('OptimiR', folder)
+        code_success = optimir_caller.optimir_caller(reads, optimir_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff, species, Debug) ## Any additional sRNAbench parameter?
+        
+        ## create folder for Optimir results
+        miRTop_folder = HCGB_files.create_subfolder("OptimiR_miRTop", folder)
+        mirtop_caller.miRTop_caller(optimir_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'optimir', species, Debug, annotation)
+        
+    ###
+    if (soft == "miraligner"):
+        
+        ## create miraligner analysis
+        miraligner_folder = HCGB_files.create_subfolder('miraligner', folder)
+        code_success = miraligner_caller.miraligner_caller(reads, miraligner_folder, name, threads, database, species, Debug) 
+        
+        ## create folder for miraligner results
+        miRTop_folder = HCGB_files.create_subfolder("miraligner_miRTop", folder)
+        mirtop_caller.miRTop_caller(miraligner_folder, miRTop_folder, name, threads, miRNA_gff, hairpinFasta, 'seqbuster', species, Debug, annotation)
             
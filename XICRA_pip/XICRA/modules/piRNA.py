@@ -23,6 +23,7 @@ import HCGB.functions.main_functions as HCGB_main
 
 from XICRA.modules import help_XICRA, map, database
 from XICRA.scripts import pilfer_caller
+from XICRA.other_tools import step_cache, instrument, intermediate
 
 ##############################################
 def run_piRNA(options):
@@ -121,8 +122,8 @@ def run_piRNA(options):
                 pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ["fastq", "fq", "fastq.gz", "fq.gz"], options.debug)
             else:
                 print ('+ Mode: join.\n+ Extension: ')
-                print ("[_joined.fastq]\n")
-                pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "join", ['_joined.fastq'], options.debug)
+                print ("[_joined.fastq, _joined.fastq.gz]\n")
+                pd_samples_retrieved = intermediate.get_files(options, input_dir, "join", ['_joined.fastq', '_joined.fastq.gz'], options.debug)
         else:
             if options.noTrim:
                 print ('+ Mode: fastq.\n+ Extension: ')
@@ -131,7 +132,7 @@ def run_piRNA(options):
             else:
                 print ('+ Mode: join.\n+ Extension: ')
                 print ("[_joined.fastq]\n")
-                pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "trim", ['_trim'], options.debug)
+                pd_samples_retrieved = intermediate.get_files(options, input_dir, "trim", ['_trim'], options.debug)
         
         ## debug message
         if (Debug):
@@ -206,6 +207,9 @@ def run_piRNA(options):
     
     ## for samples
     outdir_dict = HCGB_files.outdir_project(outdir, options.project, pd_samples_retrieved, "piRNA", options.debug)
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
     
     ## Mapping is done, process bam files
     print ("+ Create a piRNA analysis for each sample retrieved...")    
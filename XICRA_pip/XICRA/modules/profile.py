@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Summarizes resources employed by external tools in a project
+"""
+## import useful modules
+import os
+import json
+import pandas as pd
+from termcolor import colored
+
+## import my modules
+from XICRA.other_tools import instrument
+
+import HCGB.functions.aesthetics_functions as HCGB_aes
+import HCGB.functions.files_functions as HCGB_files
+
+##############################################
+def read_calls(info_dir):
+    """Reads tool calls recorded for a project.
+
+    See :func:`XICRA.other_tools.instrument.system_call`.
+
+    :param info_dir: Folder of the project containing information (e.g. project/info).
+    :type info_dir: string
+
+    :returns: Dataframe with a row for each call.
+    """
+    calls_file = instrument.calls_file(info_dir)
+    if not HCGB_files.is_non_zero_file(calls_file):
+        return (pd.DataFrame())
+
+    calls = []
+    with open(calls_file) as calls_hd:
+        for line in calls_hd:
+            try:
+                calls.append(json.loads(line))
+            except ValueError:
+                ## incomplete line, e.g. process killed
+                continue
+
+    calls_df = pd.DataFrame(calls)
+    calls_df['sample'] = calls_df['sample'].fillna('-')
+    calls_df['cpu'] = calls_df['user'] + calls_df['sys']
+    return (calls_df)
+
+##############################################
+def summary_calls(calls_df, by):
+    """Summarizes tool calls by step and/or sample.
+
+    :param calls_df: Dataframe returned by :func:`XICRA.modules.profile.read_calls`.
+    :param by: Columns to group by (e.g. ['step'], ['sample'])
+
+    :returns: Dataframe sorted by wall time.
+    """
+    summary_df = calls_df.groupby(by).agg(calls=('cmd', 'size'),
+                                          wall_h=('wall', 'sum'),
+                                          cpu_h=('cpu', 'sum'),
+                                          peak_RSS_GB=('peak_tree_RSS', 'max'),
+                                          read_GB=('read_bytes', 'sum'),
+                                          write_GB=('write_bytes', 'sum'),
+                                          failed=('returncode', lambda x: int((x != 0).sum())))
+
+    summary_df['wall_%'] = (100 * summary_df['wall_h'] / summary_df['wall_h'].sum()).round(1)
+    summary_df['cpu_usage'] = (summary_df['cpu_h'] / summary_df['wall_h'].where(summary_df['wall_h'] > 0)).round(2)
+    for col in ('wall_h', 'cpu_h'):
+        summary_df[col] = (summary_df[col] / 3600).round(3)
+    for col in ('peak_RSS_GB', 'read_GB', 'write_GB'):
+        summary_df[col] = (summary_df[col] / 1024**3).round(3)
+
+    return (summary_df.sort_values('wall_h', ascending=False))
+
+##############################################
+def run_profile(options):
+    """Main function of the module: summarizes resources employed by the tools called for a project.
+
+    Prints and saves in the ``info`` folder of the project a summary of wall time, CPU time,
+    peak memory and bytes read/written for each step and for the samples that dominate
+    runtime and memory.
+
+    :param options: input parameters introduced by the user. See XICRA profile -h.
+
+    :returns: None
+    """
+    HCGB_aes.pipeline_header('XICRA')
+    HCGB_aes.boxymcboxface("Profile of resources")
+
+    info_dir = os.path.join(os.path.abspath(options.input), "info")
+    calls_df = read_calls(info_dir)
+    if calls_df.empty:
+        print (colored("** No tool calls recorded in folder: %s" %info_dir, 'yellow'))
+        return ()
+
+    if options.step:
+        calls_df = calls_df[calls_df['step'].isin(options.step)]
+
+    if (options.debug):
+        print (colored("**DEBUG: calls_df **", 'yellow'))
+        print (calls_df)
+
+    ## summary by step
+    steps_df = summary_calls(calls_df, ['step'])
+    print ("\n+ Resources by step:\n")
+    print (steps_df.to_string())
+
+    ## samples dominating runtime and memory
+    samples_df = summary_calls(calls_df, ['sample'])
+    print ("\n+ Top %s samples by wall time:\n" %options.top)
+    print (samples_df.head(options.top).to_string())
+    print ("\n+ Top %s samples by peak memory:\n" %options.top)
+    print (samples_df.sort_values('peak_RSS_GB', ascending=False).head(options.top).to_string())
+
+    ## save
+    steps_df.to_csv(os.path.join(info_dir, "profile_steps.csv"))
+    summary_calls(calls_df, ['step', 'sample']).to_csv(os.path.join(info_dir, "profile_samples.csv"))
+    print ("\n+ Summary tables saved in folder: %s" %info_dir)
+
+    return ()
@@ -17,7 +17,9 @@ from termcolor import colored
 from XICRA import __version__ as pipeline_version
 from XICRA.scripts import multiQC_report
 from XICRA.scripts import fastqc_caller
+from XICRA.scripts import srna_qc
 from XICRA.modules import help_XICRA
+from XICRA.other_tools import step_cache, instrument
 from HCGB import sampleParser
 import HCGB.functions.aesthetics_functions as HCGB_aes
 import HCGB.functions.time_functions as HCGB_time
@@ -78,7 +80,8 @@ def run_QC(options):
         options.project = True
         outdir = input_dir        
     
-    HCGB_aes.boxymcboxface("FASTQC Quality check for samples")
+    if options.qc_software == 'fastqc':
+        HCGB_aes.boxymcboxface("FASTQC Quality check for samples")
     
     ## get files
     print ('+ Getting files from input folder... ')
@@ -86,7 +89,12 @@ def run_QC(options):
     print ("[ fastq, fq, fastq.gz, fq.gz ]\n")
     pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ["fastq", "fq", "fastq.gz", "fq.gz"], options.debug)
 
-    ## create FASTQC call
+    ## create quality check call
+    if not options.project:
+        HCGB_files.create_folder(outdir)
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
     outdir_dict = fastqc(pd_samples_retrieved, outdir, options, "", start_time_total, Debug)
 
     print ("\n*************** Finish *******************")
@@ -117,15 +125,17 @@ def run_QC(options):
     exit()
 
 #######################
-def fastqc(pd_samples_retrieved, outdir, options, name_analysis, time_stamp, Debug):
+def fastqc(pd_samples_retrieved, outdir, options, name_analysis, time_stamp, Debug, adapters=None):
     '''
-    This is a main function to prepare data to call FASTQC.
+    This is a main function to prepare data to call FASTQC or the XICRA quality check 
+    (see :mod:`XICRA.scripts.srna_qc`), according to ``options.qc_software``. 
     
     :param pd_samples_retrieved
     :param outdir
     :param options
     :param name_analysis
     :param Debug
+    :param adapters: adapter sequences to search by the XICRA quality check, if any
     
     :type pd_samples_retrieved
     :type outdir
@@ -176,11 +186,20 @@ def fastqc(pd_samples_retrieved, outdir, options, name_analysis, time_stamp, Deb
         HCGB_aes.debug_message("threads_job: " + str(threads_job), "yellow")
 
     ## send for each sample
-    print ("+ Calling fastqc for samples...")    
+    if options.qc_software == 'fastqc':
+        print ("+ Calling fastqc for samples...")
+        qc_caller = fastqc_caller.run_module_fastqc
+        qc_args = []
+    else:
+        ## files of each sample checked in a process pool
+        print ("+ Calling XICRA quality check for samples...")
+        qc_caller = srna_qc.qc_caller
+        qc_args = [[seq for seq in (adapters or []) if seq], Debug]
+    
     with concurrent.futures.ThreadPoolExecutor(max_workers=int(max_workers_int)) as executor:
-        commandsSent = { executor.submit(fastqc_caller.run_module_fastqc, 
+        commandsSent = { executor.submit(qc_caller, 
                                          outdir_dict[name[0]], sorted( cluster["sample"].tolist() ), 
-                                         name[0], threads_job): name[0] for name, cluster in sample_frame }
+                                         name[0], threads_job, *qc_args): name[0] for name, cluster in sample_frame }
         
         for cmd2 in concurrent.futures.as_completed(commandsSent):
             details = commandsSent[cmd2]
@@ -191,7 +210,7 @@ def fastqc(pd_samples_retrieved, outdir, options, name_analysis, time_stamp, Deb
                 print (cmd2)
                 print('%r generated an exception: %s' % (details, exc))
 
-    print ("+ FASTQC for samples has finished...")    
+    print ("+ Quality check for samples has finished...")    
     
     ## functions.timestamp
     start_time_partial = HCGB_time.timestamp(start_time_partial)
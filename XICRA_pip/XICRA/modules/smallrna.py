@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Trims, joins and collapses small RNA reads in a single streaming pass.
+
+Reads trimmed by cutadapt are sent through a pipe to the paired-end merger and joined reads
+are collapsed into unique sequences and counts in memory: only the collapsed reads
+(``<sample>.rc``), statistics and logs are saved. Outputs of each step are saved with option
+``--keep_intermediate`` for debugging purposes.
+"""
+## import useful modules
+import os
+import time
+import subprocess
+import concurrent.futures
+from termcolor import colored
+
+## import my modules
+from XICRA import __version__ as pipeline_version
+from XICRA.modules import help_XICRA, join
+from XICRA.config import set_config
+from XICRA.other_tools import scheduler, step_cache, instrument, intermediate
+from XICRA.scripts import cutadapt_caller, join_reads, collapse_reads
+from HCGB import sampleParser
+import HCGB.functions.aesthetics_functions as HCGB_aes
+import HCGB.functions.time_functions as HCGB_time
+import HCGB.functions.files_functions as HCGB_files
+import HCGB.functions.info_functions as HCGB_info
+import HCGB.functions.main_functions as HCGB_main
+
+##############################################
+def run_smallrna(options):
+    """Main function of the module: trims, joins and collapses reads of each sample.
+
+    :param options: input parameters introduced by the user. See XICRA smallrna -h.
+
+    :returns: None
+    """
+    ## init time
+    start_time_total = time.time()
+
+    ##################################
+    ### show help messages if desired
+    ##################################
+    if (options.help_format):
+        ## help_format option
+        help_XICRA.help_fastq_format()
+    elif (options.help_trimm_adapters):
+        ## help on trimm adapters
+        help_XICRA.print_help_adapters()
+        exit()
+    elif (options.help_project):
+        ## information for project
+        help_XICRA.project_help()
+        exit()
+    elif (options.help_join_reads):
+        ## information for join reads
+        help_XICRA.help_join_reads()
+        exit()
+
+    ## debugging messages
+    global Debug
+    if (options.debug):
+        Debug = True
+    else:
+        Debug = False
+
+    ### set as default paired_end mode
+    if (options.single_end):
+        options.pair = False
+    else:
+        options.pair = True
+
+    HCGB_aes.pipeline_header('XICRA')
+    HCGB_aes.boxymcboxface("Small RNA reads: trim, join & collapse")
+    print ("--------- Starting Process ---------")
+    HCGB_time.print_time()
+
+    ## absolute path for in & out
+    input_dir = os.path.abspath(options.input)
+    outdir=""
+
+    ## set mode: project/detached
+    if (options.detached):
+        outdir = os.path.abspath(options.output_folder)
+        options.project = False
+    else:
+        options.project = True
+        outdir = input_dir
+
+    ## adapters provided
+    if not options.adapters_a or (options.pair and not options.adapters_A):
+        print (colored("** ERROR: No adapter trimming options provided...", 'red'))
+        print ("Please provide --adapters_a (and --adapters_A for paired-end reads)")
+        exit()
+    adapters_dict = {'adapter_a': options.adapters_a, 'adapter_A': options.adapters_A}
+
+    ## get files
+    print ('+ Getting files from input folder... ')
+    print ('+ Mode: fastq.\n+ Extension: ')
+    print ("[ fastq, fq, fastq.gz, fq.gz ]\n")
+    pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ["fastq", "fq", "fastq.gz", "fq.gz"], options.debug)
+
+    ## debug message
+    if (Debug):
+        print (colored("**DEBUG: pd_samples_retrieve **", 'yellow'))
+        print (pd_samples_retrieved)
+
+    ## generate output folder, if necessary
+    print ("\n+ Create output folder(s):")
+    if not options.project:
+        HCGB_files.create_folder(outdir)
+    ## for samples
+    outdir_dict = HCGB_files.outdir_project(outdir, options.project, pd_samples_retrieved, "smallrna", options.debug)
+
+    ## optimize threads
+    name_list = set(pd_samples_retrieved["new_name"].tolist())
+    threads_job = HCGB_main.optimize_threads(options.threads, len(name_list)) ## threads optimization
+    max_workers_int = int(options.threads/threads_job)
+
+    ## debug message
+    if (Debug):
+        print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
+        print (colored("**DEBUG: max_workers " +  str(max_workers_int) + " **", 'yellow'))
+        print (colored("**DEBUG: cpu_here " +  str(threads_job) + " **", 'yellow'))
+
+    print ("+ Trimming, joining and collapsing reads for each sample retrieved...")
+
+    # Group dataframe by sample name
+    sample_frame = pd_samples_retrieved.groupby(["new_name"])
+
+    ## send for each sample when CPUs and RAM are available
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
+
+    ## compression of intermediate files saved: project setting
+    compress = intermediate.get_compression(info_dir)
+
+    with scheduler.ResourceScheduler(options.threads, threads_job, step="smallrna", info_dir=info_dir, Debug=Debug) as executor:
+        commandsSent = { executor.submit(smallrna_caller, sorted(cluster["sample"].tolist()),
+                                         outdir_dict[name[0]], name[0], threads_job, options.min_read_len,
+                                         adapters_dict, options.extra, options.perc_diff, options.min_overlap,
+                                         options.keep_intermediate, compress,
+                                         Debug): name[0] for name, cluster in sample_frame }
+
+        for cmd2 in concurrent.futures.as_completed(commandsSent):
+            details = commandsSent[cmd2]
+            try:
+                data = cmd2.result()
+            except Exception as exc:
+                print ('***ERROR:')
+                print (cmd2)
+                print('%r generated an exception: %s' % (details, exc))
+
+    print ("\n\n+ Small RNA reads processing has finished...")
+
+    ## statistics on joined reads
+    outdir_report = HCGB_files.create_subfolder("report", outdir)
+    smallrna_report = HCGB_files.create_subfolder("smallrna", outdir_report)
+    join.join_statistics(outdir_dict, smallrna_report)
+
+    print ("\n*************** Finish *******************")
+    HCGB_time.timestamp(start_time_total)
+
+    ## samples information dictionary
+    samples_info = {}
+    samples_frame = pd_samples_retrieved.groupby('new_name')
+    for name_tuple, grouped in samples_frame:
+        samples_info[name_tuple] = grouped['sample'].to_list()
+
+    ## dump information and parameters
+    print("+ Dumping information and parameters")
+    runInfo = { "module":"smallrna", "time":time.time(),
+                "XICRA version":pipeline_version,
+                'sample_info': samples_info,
+                'outdir_dict': outdir_dict,
+                'smallrna_report': smallrna_report}
+
+    HCGB_info.dump_info_run(info_dir, "smallrna", options, runInfo, options.debug)
+
+    ## dump conda details
+    HCGB_info.dump_info_conda(info_dir, "smallrna", package_name="XICRA", debug=options.debug)
+
+    print ("\n+ Exiting smallrna module.")
+    return()
+
+#############################################
+def smallrna_caller(list_reads, sample_folder, name, threads, min_read_len, adapters, extra,
+                    perc_diff, min_overlap, keep_intermediate, compress, Debug):
+    """Trims, joins (paired-end) and collapses reads of a sample, if not previously done with same reads and options.
+
+    Trimmed reads are streamed from cutadapt (interleaved if paired-end) to
+    :func:`XICRA.scripts.join_reads.join_pairs` and joined reads are counted by a
+    :class:`XICRA.scripts.collapse_reads.Collapser`. If ``keep_intermediate``, trimmed, joined
+    and unjoined reads are saved as generated by modules trim and join.
+
+    :param list_reads: reads of the sample
+    :param sample_folder: output folder
+    :param name: sample name
+    :param threads: threads available
+    :param min_read_len: minimum read length after trimming
+    :param adapters: dictionary with the adapters (adapter_a, adapter_A)
+    :param extra: extra options for cutadapt trimming process
+    :param perc_diff: maximum percentage of mismatches in the overlap
+    :param min_overlap: minimum overlap length
+    :param keep_intermediate: save outputs of each step
+    :param compress: compression of outputs of each step: none, gz or zstd
+    :param Debug: display complete log.
+
+    :returns: Collapsed reads file or None if failed.
+    """
+    collapsed_file = os.path.join(sample_folder, name + '.rc')
+
+    ## check if previously generated and succeeded with same reads and options
+    filename_stamp = sample_folder + '/.success'
+    key = step_cache.step_key(list_reads, [min_read_len, adapters, extra, perc_diff, min_overlap,
+                                           keep_intermediate, compress, 'smallrna'], 'cutadapt', Debug)
+    if step_cache.previous_results(filename_stamp, key) and os.path.isfile(collapsed_file):
+        stamp = HCGB_time.read_time_stamp(filename_stamp)
+        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'smallrna'), 'yellow'))
+        return (collapsed_file)
+
+    if len(list_reads) not in (1, 2):
+        print ('** Wrong number of files provided for sample: %s...' %name)
+        return (None)
+
+    cutadapt_exe = set_config.get_exe('cutadapt')
+    collapser = collapse_reads.Collapser(sample_folder)
+    stats = None
+    try:
+        if keep_intermediate:
+            stats = _disk_steps(cutadapt_exe, list_reads, sample_folder, name, threads, min_read_len,
+                                adapters, extra, perc_diff, min_overlap, compress, collapser, Debug)
+        else:
+            stats = _stream_steps(cutadapt_exe, list_reads, sample_folder, name, threads, min_read_len,
+                                  adapters, extra, perc_diff, min_overlap, collapser, Debug)
+        unique_seqs = collapser.save(collapsed_file)
+    except (OSError, ValueError) as err:
+        print (colored("** ERROR: Reads could not be processed for sample %s: %s" %(name, err), 'red'))
+        return (None)
+
+    if stats:
+        stats['software'] = 'XICRA'
+        join_reads.save_stats(stats, os.path.join(sample_folder, name + '.join_stats.json'))
+        print ("+ Sample %s: %s of %s read pairs joined (%s %%)" %(name, stats.get('joined'), stats.get('pairs'), stats.get('merge_rate')))
+    print ("+ Sample %s: %s reads collapsed into %s unique sequences" %(name, collapser.total_reads, unique_seqs))
+
+    step_cache.save_step(filename_stamp, key)
+    return (collapsed_file)
+
+def _stream_steps(cutadapt_exe, list_reads, sample_folder, name, threads, min_read_len,
+                  adapters, extra, perc_diff, min_overlap, collapser, Debug):
+    ## cutadapt writes trimmed reads to a pipe (interleaved if paired-end): a single pipe
+    ## avoids blocking cutadapt writing one read file while the other is read
+    logfile = os.path.join(sample_folder, name + '.cutadapt.log')
+    cmd = cutadapt_caller.trim_cmd(cutadapt_exe, list_reads, None, logfile, max(1, threads // 2),
+                                   min_read_len, adapters, extra)
+    if Debug:
+        print (colored("**DEBUG: smallrna command: %s **" %cmd, 'yellow'))
+
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1 << 20)
+    stats = None
+    try:
+        if len(list_reads) == 2:
+            stats = join_reads.join_pairs(proc.stdout, None, [None, None, None], max(1, threads - threads // 2),
+                                          min_overlap, perc_diff, 'none', Debug, collapser)
+        else:
+            collapser.add(line.rstrip() for line_number, line in enumerate(proc.stdout) if line_number % 4 == 1)
+    finally:
+        proc.stdout.close()
+        code = proc.wait()
+
+    ## report of cutadapt: check both commands (extra options) finished
+    if not cutadapt_caller.check_logs(logfile) or code:
+        raise OSError("adapter trimming failed (exit code %s). See %s" %(code, logfile))
+    return (stats)
+
+def _disk_steps(cutadapt_exe, list_reads, sample_folder, name, threads, min_read_len,
+                adapters, extra, perc_diff, min_overlap, compress, collapser, Debug):
+    ## outputs of each step saved as modules trim and join
+    code = cutadapt_caller.cutadapt(cutadapt_exe, list_reads, sample_folder, name, threads,
+                                    min_read_len, Debug, adapters, extra, compress)
+    if code != 'OK':
+        raise OSError("adapter trimming failed. See %s" %os.path.join(sample_folder, name + '.cutadapt.log'))
+
+    ext = '.fastq' + intermediate.compress_ext[compress]
+    if len(list_reads) == 1:
+        reads_hd = intermediate.open_reads(os.path.join(sample_folder, name + '_trim' + ext), threads)
+        try:
+            collapser.add(line.rstrip() for line_number, line in enumerate(reads_hd) if line_number % 4 == 1)
+        finally:
+            reads_hd.close()
+        return (None)
+
+    trimmed = [os.path.join(sample_folder, name + '_trim_R%s' %i + ext) for i in (1, 2)]
+    return (join_reads.join_pairs(trimmed[0], trimmed[1], join_reads.output_names(sample_folder, name, compress),
+                                  threads, min_overlap, perc_diff, compress, Debug, collapser))
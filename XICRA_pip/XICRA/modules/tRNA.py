@@ -26,6 +26,7 @@ import HCGB.functions.main_functions as HCGB_main
 from XICRA.modules import help_XICRA
 from XICRA.scripts import generate_DE
 from XICRA.scripts import MINTMap_caller
+from XICRA.other_tools import scheduler, step_cache, instrument, intermediate
 
 ##############################################
 def run_tRNA(options):
@@ -94,8 +95,8 @@ def run_tRNA(options):
             pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "fastq", ["fastq", "fq", "fastq.gz", "fq.gz"], options.debug)
         else:
             print ('+ Mode: join.\n+ Extension: ')
-            print ("[_joined.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "join", ['_joined.fastq'], options.debug)
+            print ("[_joined.fastq, _joined.fastq.gz]\n")
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "join", ['_joined.fastq', '_joined.fastq.gz'], options.debug)
     else:
         if options.noTrim:
             print ('+ Mode: fastq.\n+ Extension: ')
@@ -104,7 +105,7 @@ def run_tRNA(options):
         else:
             print ('+ Mode: join.\n+ Extension: ')
             print ("[_joined.fastq]\n")
-            pd_samples_retrieved = sampleParser.files.get_files(options, input_dir, "trim", ['_trim'], options.debug)
+            pd_samples_retrieved = intermediate.get_files(options, input_dir, "trim", ['_trim'], options.debug)
     
     ## debug message
     if (Debug):
@@ -148,9 +149,6 @@ def run_tRNA(options):
     threads_job = HCGB_main.optimize_threads(options.threads, len(name_list)) ## threads optimization
     max_workers_int = int(options.threads/threads_job)
 
-    ## to FIX: MINTmap requires to chdir to folder to create results
-    max_workers_int = 1
-
     ## debug message
     if (Debug):
         print (colored("**DEBUG: options.threads " +  str(options.threads) + " **", 'yellow'))
@@ -169,8 +167,11 @@ def run_tRNA(options):
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
+    ## send for each sample when CPUs and RAM are available
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
+    with scheduler.ResourceScheduler(options.threads, threads_job, step="tRNA", info_dir=info_dir, Debug=Debug) as executor:
         commandsSent = { executor.submit(tRNA_analysis, 
                                          sorted(cluster["sample"].tolist()), 
                                          outdir_dict[name[0]], name[0], threads_job, 
@@ -207,14 +208,17 @@ def run_tRNA(options):
         ## exclusive tRFs
         print ("\n\n+ Parsing exclusive tRNA analysis for all samples...")
         generate_DE.generate_DE(results_df.filter(like="amb", axis=0).set_index('name'), 
-                                options.debug, expression_folder,  type_analysis="tRF-amb")
+                                options.debug, expression_folder,  type_analysis="tRF-amb", expression_format=options.expression_format, 
+                                incremental=options.incremental)
         
         ## amb tRFs
         print ("\n\n+ Parsing ambiguous tRNA analysis for all samples...")
         generate_DE.generate_DE(results_df.filter(like="exc", axis=0).set_index('name'), 
-                                options.debug, expression_folder,  type_analysis="tRF-exc")
+                                options.debug, expression_folder,  type_analysis="tRF-exc", expression_format=options.expression_format, 
+                                incremental=options.incremental)
     else:
-        generate_DE.generate_DE(results_df, options.debug, expression_folder,  type_analysis="tRNA")
+        generate_DE.generate_DE(results_df, options.debug, expression_folder,  type_analysis="tRNA", expression_format=options.expression_format, 
+                                incremental=options.incremental)
 
     print ("\n*************** Finish *******************")
     HCGB_time.timestamp(start_time_total)
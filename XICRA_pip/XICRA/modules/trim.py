@@ -17,6 +17,7 @@ from termcolor import colored
 from XICRA import __version__ as pipeline_version
 from XICRA.scripts import multiQC_report
 from XICRA.scripts import cutadapt_caller
+from XICRA.other_tools import scheduler, step_cache, instrument, intermediate
 from XICRA.modules import help_XICRA
 from XICRA.modules import qc
 from HCGB import sampleParser
@@ -166,12 +167,21 @@ def run_trim(options):
     # Group dataframe by sample name
     sample_frame = pd_samples_retrieved.groupby(["new_name"])
     
-    ## send for each sample
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
+    ## send for each sample when CPUs and RAM are available
+    info_dir = HCGB_files.create_subfolder("info", outdir)
+    step_cache.set_manifest(info_dir)
+    instrument.set_info_dir(info_dir)
+    
+    ## compression of trimmed reads: project setting
+    compress = intermediate.get_compression(info_dir, options.compress)
+    if compress != 'none':
+        print ("+ Trimmed reads are %s compressed" %compress)
+    
+    with scheduler.ResourceScheduler(options.threads, threads_job, step="trim", info_dir=info_dir, Debug=Debug) as executor:
         commandsSent = { executor.submit(cutadapt_caller.caller, sorted(cluster["sample"].tolist()), 
                                          outdir_dict[name[0]], name[0], threads_job, 
                                          options.min_read_len, Debug, 
-                                         adapters_dict, options.extra): name[0] for name, cluster in sample_frame }
+                                         adapters_dict, options.extra, compress): name[0] for name, cluster in sample_frame }
 
         for cmd2 in concurrent.futures.as_completed(commandsSent):
             details = commandsSent[cmd2]
@@ -238,8 +248,9 @@ def run_trim(options):
         start_time_partial = HCGB_time.timestamp(start_time_partial)
 
     ## create FASTQC calling for trimmed reads
-    pd_samples_retrieved_trimmed = sampleParser.files.get_files(options, input_dir, "trim", ['_trim'], options.debug)
-    outdir_dict_trimmed = qc.fastqc(pd_samples_retrieved_trimmed, outdir, options, "trimmed", start_time_partial, Debug)
+    pd_samples_retrieved_trimmed = intermediate.get_files(options, input_dir, "trim", ['_trim'], options.debug)
+    outdir_dict_trimmed = qc.fastqc(pd_samples_retrieved_trimmed, outdir, options, "trimmed", start_time_partial, Debug,
+                                     adapters=[options.adapters_a, options.adapters_A])
         
     print ("\n*************** Finish *******************")
     start_time_partial = HCGB_time.timestamp(start_time_total)
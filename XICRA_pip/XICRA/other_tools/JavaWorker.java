@@ -0,0 +1,195 @@
+//##########################################################
+//## Jose F. Sanchez                                        ##
+//## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+//##########################################################
+//
+// Long-lived JVM for java tools called by XICRA (see XICRA/other_tools/java_worker.py).
+//
+// Launched as a single-file source program (java 11 or later) or compiled with javac:
+//     java -Xmx<heap> JavaWorker.java
+//     java -Xmx<heap> -cp <folder> JavaWorker
+//
+// Writes when ready to stdout:
+//     XICRA_WORKER_READY <tab> exit_trap|no_exit_trap
+//
+// Reads one job per line from stdin:
+//     jar <tab> stdout_file <tab> stderr_file <tab> arg1 <tab> arg2 ...
+// and calls the Main-Class of the jar with the arguments given, writing its
+// output into the files provided (empty: discarded / worker stderr). Classes of
+// the jar are loaded by a new class loader for each job, so static fields of
+// the tool never keep values from a previous job.
+//
+// After each job it writes to stdout:
+//     XICRA_JOB_DONE <tab> OK|FAIL
+//
+// If the tool calls System.exit(), the call is trapped and the job finishes with
+// the status given (exit_trap). The trap requires a security manager, which is
+// not supported by java 24 or later (no_exit_trap): the worker finishes with the
+// status given instead.
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.jar.Attributes;
+import java.util.jar.JarFile;
+
+public class JavaWorker {
+
+    private static final String READY = "XICRA_WORKER_READY";
+    private static final String DONE = "XICRA_JOB_DONE";
+
+    // System.exit() called by a tool while running a job
+    static class ExitCalled extends SecurityException {
+        final int status;
+
+        ExitCalled(int status) {
+            super("System.exit(" + status + ") called by the tool");
+            this.status = status;
+        }
+    }
+
+    // Security manager only used to trap System.exit(): any other permission is granted
+    static class ExitTrap extends SecurityManager {
+        volatile boolean trap = false;
+
+        public void checkExit(int status) {
+            if (trap) {
+                throw new ExitCalled(status);
+            }
+        }
+
+        public void checkPermission(Permission perm) {
+        }
+
+        public void checkPermission(Permission perm, Object context) {
+        }
+    }
+
+    private static ExitTrap installExitTrap() {
+        try {
+            ExitTrap exitTrap = new ExitTrap();
+            System.setSecurityManager(exitTrap);
+            return exitTrap;
+        } catch (RuntimeException e) {
+            // java 24 or later, or java 18-23 without -Djava.security.manager=allow
+            return null;
+        }
+    }
+
+    private static String mainClass(String jar) throws Exception {
+        String mainClass;
+        JarFile jarFile = new JarFile(jar);
+        try {
+            mainClass = jarFile.getManifest().getMainAttributes().getValue(Attributes.Name.MAIN_CLASS);
+        } finally {
+            jarFile.close();
+        }
+        if (mainClass == null) {
+            throw new IllegalArgumentException("No Main-Class in manifest of " + jar);
+        }
+        return mainClass.trim();
+    }
+
+    private static void runJar(String jar, String[] args, ExitTrap exitTrap) throws Exception {
+        // new class loader for each job: static fields are initialized again
+        URLClassLoader loader = new URLClassLoader(new URL[] {new File(jar).toURI().toURL()},
+                                                   JavaWorker.class.getClassLoader());
+        try {
+            Method main = Class.forName(mainClass(jar), true, loader).getMethod("main", new Class[] {String[].class});
+            if (exitTrap != null) {
+                exitTrap.trap = true;
+            }
+            try {
+                main.invoke(null, new Object[] {args});
+            } finally {
+                if (exitTrap != null) {
+                    exitTrap.trap = false;
+                }
+            }
+        } finally {
+            loader.close();
+        }
+    }
+
+    // status of System.exit() if it finished the job, -1 otherwise
+    private static int exitStatus(Throwable e) {
+        while (e != null) {
+            if (e instanceof ExitCalled) {
+                return ((ExitCalled) e).status;
+            }
+            e = e.getCause();
+        }
+        return -1;
+    }
+
+    private static PrintStream jobStream(String file, PrintStream empty) throws Exception {
+        if (file.isEmpty()) {
+            return empty;
+        }
+        return new PrintStream(new FileOutputStream(file), true);
+    }
+
+    public static void main(String[] args) throws Exception {
+        PrintStream workerOut = System.out;
+        PrintStream workerErr = System.err;
+        PrintStream discard = new PrintStream(OutputStream.nullOutputStream());
+        ExitTrap exitTrap = installExitTrap();
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        workerOut.println(READY + "\t" + (exitTrap != null ? "exit_trap" : "no_exit_trap"));
+        workerOut.flush();
+
+        String line;
+        while ((line = requests.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            String[] fields = line.split("\t", -1);
+            String status = "OK";
+            PrintStream jobOut = discard;
+            PrintStream jobErr = workerErr;
+            try {
+                jobOut = jobStream(fields[1], discard);
+                jobErr = jobStream(fields[2], workerErr);
+                System.setOut(jobOut);
+                System.setErr(jobErr);
+                String[] jobArgs = new String[fields.length - 3];
+                System.arraycopy(fields, 3, jobArgs, 0, jobArgs.length);
+                runJar(fields[0], jobArgs, exitTrap);
+            } catch (InvocationTargetException e) {
+                int exit = exitStatus(e);
+                if (exit < 0) {
+                    e.getCause().printStackTrace();
+                }
+                if (exit != 0) {
+                    status = "FAIL";
+                }
+            } catch (Exception e) {
+                e.printStackTrace();
+                status = "FAIL";
+            } finally {
+                System.out.flush();
+                System.err.flush();
+                System.setOut(workerOut);
+                System.setErr(workerErr);
+                if (jobOut != discard) {
+                    jobOut.close();
+                }
+                if (jobErr != workerErr) {
+                    jobErr.close();
+                }
+            }
+            workerOut.println(DONE + "\t" + status);
+            workerOut.flush();
+        }
+    }
+}
@@ -1,5 +1,18 @@
+import importlib
+
 __all__ = [
-    'tools'    
+    'tools',
+    'scheduler',
+    'step_cache',
+    'instrument',
+    'java_worker',
+    'scatter',
+    'intermediate',
+    'profiling'
 ]
 
-from XICRA.other_tools import *
+def __getattr__(name):
+	## import submodules only when requested
+	if name in __all__:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Resource instrumentation of external tool calls.
+
+:func:`XICRA.other_tools.instrument.system_call` replaces ``HCGB.functions.system_call_functions.system_call``
+and records, for each call, wall time, CPU time, peak memory and bytes read/written by the
+process tree of the command. Records are appended to ``info/tool_calls.jsonl`` of the project
+and summarized using ``XICRA profile``.
+"""
+## useful imports
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+from termcolor import colored
+
+## psutil provides memory and IO for each process of the tree. If not available
+## information is read from /proc, if possible.
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+## file to record calls: set for each project
+_calls_file = None
+_calls_lock = threading.Lock()
+
+## seconds between samples of the process tree
+sampling_interval = 0.5
+
+## functions called with each call recorded (see :class:`XICRA.other_tools.scheduler.ResourceScheduler`)
+_observers = []
+
+####################################################################
+def set_info_dir(info_dir):
+    """
+    Sets the folder to record tool calls for this process.
+
+    :param info_dir: Folder of the project containing information (e.g. project/info).
+    :type info_dir: string
+    """
+    global _calls_file
+    _calls_file = os.path.join(os.path.abspath(info_dir), "tool_calls.jsonl")
+
+####################################################################
+def calls_file(info_dir):
+    """Returns the file containing tool calls recorded for a project."""
+    return (os.path.join(info_dir, "tool_calls.jsonl"))
+
+####################################################################
+def _proc_tree(pid):
+    ## returns pids of the process given and all its descendants using /proc
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' %entry) as stat_hd:
+                ppid = int(stat_hd.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree = [pid]
+    for this_pid in tree:
+        tree.extend(children.get(this_pid, []))
+    return (tree)
+
+def _proc_usage(pid):
+    ## returns RSS, bytes read and written of a process using /proc
+    rss, read_bytes, write_bytes = 0, 0, 0
+    try:
+        with open('/proc/%s/statm' %pid) as statm_hd:
+            rss = int(statm_hd.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        with open('/proc/%s/io' %pid) as io_hd:
+            for line in io_hd:
+                if line.startswith('read_bytes:'):
+                    read_bytes = int(line.split()[1])
+                elif line.startswith('write_bytes:'):
+                    write_bytes = int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return (rss, read_bytes, write_bytes)
+
+def _tree_usage(pid):
+    ## returns {pid: (rss, read_bytes, write_bytes)} for the process tree
+    usage = {}
+    if psutil:
+        try:
+            parent = psutil.Process(pid)
+            procs = [parent] + parent.children(recursive=True)
+        except psutil.Error:
+            return (usage)
+        for proc in procs:
+            try:
+                rss = proc.memory_info().rss
+                try:
+                    io = proc.io_counters()
+                    usage[proc.pid] = (rss, io.read_bytes, io.write_bytes)
+                except (psutil.Error, AttributeError):
+                    usage[proc.pid] = (rss, 0, 0)
+            except psutil.Error:
+                continue
+    elif os.path.isdir('/proc'):
+        for this_pid in _proc_tree(pid):
+            usage[this_pid] = _proc_usage(this_pid)
+    return (usage)
+
+class _TreeSampler(threading.Thread):
+    ## samples memory and IO of the process tree until stopped
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_RSS = 0
+        self.io = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            usage = _tree_usage(self.pid)
+            self.peak_RSS = max(self.peak_RSS, sum(x[0] for x in usage.values()))
+            for this_pid, (rss, read_bytes, write_bytes) in usage.items():
+                self.io[this_pid] = (read_bytes, write_bytes)
+            self._stop_event.wait(sampling_interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+####################################################################
+def add_observer(observer):
+    """
+    Adds a function to call with the information of each tool call recorded.
+
+    :param observer: Function accepting the information of the call (dict).
+    """
+    with _calls_lock:
+        _observers.append(observer)
+
+def remove_observer(observer):
+    """
+    Removes a function added with :func:`XICRA.other_tools.instrument.add_observer`.
+    """
+    with _calls_lock:
+        if observer in _observers:
+            _observers.remove(observer)
+
+####################################################################
+def record_call(info_call):
+    """
+    Appends information of a tool call to the file of the project, if any, and
+    sends it to the observers added.
+
+    :param info_call: Information of the call.
+    :type info_call: dict
+    """
+    with _calls_lock:
+        observers = list(_observers)
+    for observer in observers:
+        observer(info_call)
+
+    if not _calls_file:
+        return ()
+
+    with _calls_lock:
+        try:
+            with open(_calls_file, 'a') as calls_hd:
+                calls_hd.write(json.dumps(info_call) + '\n')
+        except OSError as err:
+            print (colored("** WARNING: tool call could not be recorded: %s" %err, 'yellow'))
+
+####################################################################
+def system_call(cmd, returned=False, message=True, step=None, sample=None):
+    """
+    Generates system call and records the resources employed.
+
+    Same behaviour as ``HCGB.functions.system_call_functions.system_call``: returns
+    'OK' or 'FAIL' or the output of the command if returned is True.
+
+    :param cmd: Command to execute using the shell.
+    :param returned: Return output of the command.
+    :param message: Print command and errors.
+    :param step: Name of the step (e.g. cutadapt). Default: name of the executable.
+    :param sample: Name of the sample, if any.
+
+    :type cmd: string
+    :type returned: bool
+    :type message: bool
+    :type step: string
+    :type sample: string
+    """
+    if (message):
+        print (colored("[** System: %s **]" % cmd, 'magenta'))
+
+    if not step:
+        step = os.path.basename(cmd.split()[0]) if cmd.split() else 'na'
+
+    start = time.time()
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
+    sampler = _TreeSampler(proc.pid)
+    sampler.start()
+
+    ## output and resources used by the shell and all its descendants
+    out = proc.stdout.read()
+    proc.stdout.close()
+    (pid, status, rusage) = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    wall = time.time() - start
+    sampler.stop()
+
+    ## bytes read/written: sampled if available, block counts otherwise
+    if sampler.io:
+        read_bytes = sum(x[0] for x in sampler.io.values())
+        write_bytes = sum(x[1] for x in sampler.io.values())
+    else:
+        read_bytes = rusage.ru_inblock * 512
+        write_bytes = rusage.ru_oublock * 512
+
+    ## peak memory: sampled for the whole tree; largest single process reported by the kernel
+    ## also covers processes shorter than the sampling interval. The kernel value starts from
+    ## the memory of this process when forked, so it is only used if above it.
+    kernel_peak = rusage.ru_maxrss * 1024
+    if kernel_peak <= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024:
+        kernel_peak = 0
+    record_call({'step': step, 'sample': sample, 'cmd': cmd, 'start': start,
+                 'wall': round(wall, 3), 'user': round(rusage.ru_utime, 3), 'sys': round(rusage.ru_stime, 3),
+                 'max_RSS': rusage.ru_maxrss * 1024, 'peak_tree_RSS': max(sampler.peak_RSS, kernel_peak),
+                 'read_bytes': read_bytes, 'write_bytes': write_bytes, 'returncode': proc.returncode})
+
+    if proc.returncode == 0:
+        if (returned):
+            return (out)
+        return ('OK')
+
+    if (returned):
+        return (out)
+    if (message):
+        print (colored("** ERROR **", 'red'))
+        print (colored(out, 'red'))
+        print (colored("** ERROR **", 'red'))
+
+    return ('FAIL')
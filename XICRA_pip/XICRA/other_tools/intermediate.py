@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Compression of intermediate fastq files (trimmed, joined and unjoined reads).
+
+The compression is a project setting (``info/intermediate.json``): it is set using
+option ``--compress`` of modules trim or join and following modules of the project use it
+by default. Files are compressed using multiple threads: gzip using ``pigz``, python-isal
+or isa-l ``igzip``, and zstd using the ``zstandard`` module or ``zstd`` executable.
+
+Compressed files are read by every module of XICRA (see :func:`XICRA.other_tools.intermediate.open_reads`
+and :func:`XICRA.other_tools.intermediate.get_files`).
+"""
+## useful imports
+import os
+import re
+import gzip
+import json
+import shutil
+import subprocess
+from termcolor import colored
+
+from HCGB import sampleParser
+
+## python-isal and zstandard are optional: executables or gzip used otherwise
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+## file extension for each compression
+compress_ext = {'none': '', 'gz': '.gz', 'zstd': '.zst'}
+
+## gzip level: intermediate files are read once or twice, favour speed
+gzip_level = 3
+
+## file of the project with the setting
+settings_file = 'intermediate.json'
+
+####################################################################
+def get_compression(info_dir, compress=None):
+    """
+    Returns the compression of intermediate files of the project.
+
+    If a compression is provided, it is saved as the project setting.
+
+    :param info_dir: Folder of the project containing information (e.g. project/info).
+    :param compress: none, gz, zstd or None to use the project setting.
+
+    :returns: none, gz or zstd
+    """
+    setting = os.path.join(info_dir, settings_file)
+    if compress:
+        with open(setting + '.tmp', 'w') as setting_hd:
+            json.dump({'compress': compress}, setting_hd)
+        os.replace(setting + '.tmp', setting)
+        return (compress)
+
+    try:
+        with open(setting) as setting_hd:
+            return (json.load(setting_hd).get('compress', 'none'))
+    except (OSError, ValueError):
+        return ('none')
+
+####################################################################
+def open_reads(fastq_file, threads=1):
+    """Returns a text stream of the reads.
+
+    Gzip compressed files are decompressed using ``pigz`` with the threads given or
+    isa-l ``igzip``, if available in ``$PATH``. Zstd compressed files are decompressed
+    using the ``zstandard`` module or ``zstd`` executable.
+
+    :param fastq_file: fastq file (plain, gzip or zstd compressed)
+    :param threads: threads available to decompress
+    """
+    if fastq_file.endswith('.zst'):
+        if zstandard:
+            return (zstandard.open(fastq_file, 'rt'))
+        return (_read_process([_exe('zstd'), '-dcf', fastq_file]))
+
+    if not fastq_file.endswith('.gz'):
+        return (open(fastq_file, 'r'))
+
+    pigz_exe = shutil.which('pigz')
+    if pigz_exe and threads > 1:
+        return (_read_process([pigz_exe, '-dc', '-p', str(threads), fastq_file]))
+    if igzip_threaded:
+        return (igzip_threaded.open(fastq_file, 'rt', threads=1 if threads > 1 else 0))
+    igzip_exe = shutil.which('igzip')
+    if igzip_exe:
+        return (_read_process([igzip_exe, '-dc', fastq_file]))
+
+    return (gzip.open(fastq_file, 'rt'))
+
+def _exe(name):
+    exe = shutil.which(name)
+    if not exe:
+        raise OSError("%s executable is required to read or write %s compressed files" %(name, name))
+    return (exe)
+
+def _read_process(cmd):
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1024*1024)
+    return (proc.stdout)
+
+def decompress_cmd(fastq_file):
+    """Returns command writing the reads to stdout (e.g. STAR ``--readFilesCommand``), or None if not compressed."""
+    if fastq_file.endswith('.zst'):
+        return ('zstd -dcf')
+    if fastq_file.endswith('.gz'):
+        return ('igzip -dc' if shutil.which('igzip') else 'gzip -dc')
+    return (None)
+
+####################################################################
+def open_output(out_file, compress='none', threads=1):
+    """Returns a text stream to write reads, compressed as requested.
+
+    :param out_file: file to create
+    :param compress: none, gz or zstd
+    :param threads: threads available to compress
+    """
+    if compress == 'gz':
+        pigz_exe = shutil.which('pigz')
+        if pigz_exe:
+            return (_ProcessWriter([pigz_exe, '-%s' %gzip_level, '-c', '-p', str(threads)], out_file))
+        if igzip_threaded:
+            ## isa-l levels: 0-3
+            return (igzip_threaded.open(out_file, 'wt', compresslevel=min(gzip_level, 3), threads=threads))
+        return (gzip.open(out_file, 'wt', compresslevel=gzip_level))
+
+    if compress == 'zstd':
+        if zstandard:
+            compressor = zstandard.ZstdCompressor(threads=threads if threads > 1 else 0)
+            return (_ZstdWriter(out_file, compressor))
+        return (_ProcessWriter([_exe('zstd'), '-q', '-c', '-T%s' %threads], out_file))
+
+    return (open(out_file, 'w'))
+
+class _ProcessWriter():
+    ## text stream compressed by an external process
+    def __init__(self, cmd, out_file):
+        self.out_hd = open(out_file, 'wb')
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=self.out_hd)
+
+    def write(self, text):
+        self.proc.stdin.write(text.encode())
+
+    def close(self):
+        self.proc.stdin.close()
+        code = self.proc.wait()
+        self.out_hd.close()
+        if code:
+            raise OSError("compression of %s failed (exit code %s)" %(self.out_hd.name, code))
+
+class _ZstdWriter():
+    ## text stream compressed using zstandard
+    def __init__(self, out_file, compressor):
+        self.out_hd = open(out_file, 'wb')
+        self.writer = compressor.stream_writer(self.out_hd, closefd=False)
+
+    def write(self, text):
+        self.writer.write(text.encode())
+
+    def close(self):
+        self.writer.close()
+        self.out_hd.close()
+
+def compress_file(in_file, compress, threads=1):
+    """Compresses a file (e.g. fastq-join output) and removes the original.
+
+    :param in_file: file to compress
+    :param compress: gz or zstd
+    :param threads: threads available to compress
+
+    :returns: True/False
+    """
+    out_file = in_file + compress_ext[compress]
+    try:
+        output = open_output(out_file + '.tmp', compress, threads)
+        with open(in_file) as in_hd:
+            for chunk in iter(lambda: in_hd.read(1 << 20), ''):
+                output.write(chunk)
+        output.close()
+    except OSError as err:
+        print (colored("** ERROR: %s could not be compressed: %s" %(in_file, err), 'red'))
+        return (False)
+    os.replace(out_file + '.tmp', out_file)
+    os.remove(in_file)
+    return (True)
+
+####################################################################
+def get_files(options, input_dir, mode, extension, debug):
+    """
+    Retrieves sample files using :func:`HCGB.sampleParser.files.get_files`, including zstd compressed files.
+
+    HCGB only selects plain and gzip compressed fastq files. Zstd compressed files (``.zst``)
+    are listed and filtered by HCGB as any other file and they are selected using an alias
+    ending in ``.gz`` (see :func:`XICRA.other_tools.intermediate.select_samples_zst`).
+
+    :param options: Contains several options as parser.parse_args options.
+    :param input_dir: Absolute path to input dir containing samples.
+    :param mode: fastq, trim or join.
+    :param extension: List of possible extension to retrieve.
+    :param debug: show extra information of the process
+
+    :returns: Pandas dataframe with sample and file information.
+    """
+    ## extensions of zstd compressed files
+    extension = list(extension) + [ext + '.zst' for ext in extension if re.search(r'\.f(ast)?q$', ext)]
+
+    select_samples = sampleParser.samples.select_samples
+    sampleParser.samples.select_samples = lambda list_samples, *args, **kwargs: select_samples_zst(select_samples, list_samples, *args, **kwargs)
+    try:
+        return (sampleParser.files.get_files(options, input_dir, mode, extension, debug))
+    finally:
+        sampleParser.samples.select_samples = select_samples
+
+def select_samples_zst(select_samples, list_samples, *args, **kwargs):
+    """
+    Calls :func:`HCGB.sampleParser.samples.select_samples` including zstd compressed files.
+
+    Zstd compressed files are provided using an alias (``<file>.gz``) and the alias is
+    replaced by the file in the dataframe returned.
+
+    :param select_samples: HCGB function.
+    :param list_samples: List of absolute path for fastq files.
+
+    :returns: Dataframe
+    """
+    alias = {f + '.gz': f for f in list_samples if f.endswith('.zst')}
+    list_alias = [f + '.gz' if f.endswith('.zst') else f for f in list_samples]
+    pd_samples_retrieved = select_samples(list_alias, *args, **kwargs)
+
+    ## path (sample), file name (file) and extension (gz) of zstd compressed files
+    zst_files = pd_samples_retrieved['sample'].isin(alias)
+    pd_samples_retrieved.loc[zst_files, 'sample'] = pd_samples_retrieved.loc[zst_files, 'sample'].map(alias)
+    pd_samples_retrieved.loc[zst_files, 'file'] = pd_samples_retrieved.loc[zst_files, 'file'].str.replace(r'\.gz$', '', regex=True)
+    pd_samples_retrieved.loc[zst_files, 'gz'] = '.zst'
+    return (pd_samples_retrieved)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Calls java tools (sRNAbench, miraligner) with a heap sized for each job.
+
+By default each call starts a new JVM (``java -Xmx<heap> -jar ...``). If enabled (option
+``--java_worker``), jobs are sent to long-lived JVMs (``JavaWorker.java``), so JVM start-up
+and JIT warm-up of the java runtime are paid once for each worker instead of once for each
+sample. Classes of the tool are loaded again for each job, so no state is kept between samples.
+Workers run a job at a time and are reused by following jobs requiring the same or less heap.
+Heap of idle workers is taken into account by :class:`XICRA.other_tools.scheduler.ResourceScheduler`.
+
+Calls to ``System.exit()`` of the tools are trapped by the worker (java 11 to 23). With java 24
+or later they finish the worker: the job status is the exit status and following jobs of the
+same tool are executed in a new JVM.
+
+Workers require java 11 or later. ``JavaWorker.java`` is compiled once for each process if
+``javac`` is available or launched as a single-file source program otherwise (JDK required).
+If a worker can not be started, jobs are executed in a new JVM.
+"""
+## useful imports
+import os
+import re
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from termcolor import colored
+
+from XICRA.config import set_config
+from XICRA.other_tools import instrument, tools
+
+## source of the worker
+worker_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'JavaWorker.java')
+
+## heap (MB) for each MB of input, according to the input format. Collapsed
+## reads only contain unique sequences, gzip compressed fastq are ~4x smaller
+heap_factor = {'.rc': 8, '.gz': 6}
+heap_factor_default = 2
+min_heap_MB = 1024
+
+## workers: enabled for this process and started
+_use_workers = False
+_workers = []
+_workers_lock = threading.Lock()
+
+## command to launch a worker for each java executable
+_worker_commands = {}
+_worker_commands_lock = threading.Lock()
+
+## jars finishing the worker with System.exit(): executed in a new JVM
+_exit_jars = set()
+
+####################################################################
+def enable(use_workers=True):
+    """
+    Sends java jobs of this process to long-lived JVM workers.
+
+    :param use_workers: Enable or disable workers.
+    :type use_workers: bool
+    """
+    global _use_workers
+    _use_workers = use_workers
+
+####################################################################
+def java_heap(files, max_heap_MB=None):
+    """
+    Returns the heap (MB) for a java job according to the size of its input.
+
+    The heap is ``min_heap_MB`` plus the size of the input scaled by the factor of its format
+    (see ``heap_factor``), limited to 80% of the memory available.
+
+    :param files: Input files of the job.
+    :param max_heap_MB: Maximum heap (MB). Default: 80% of the memory available.
+
+    :type files: list
+    :type max_heap_MB: int
+
+    :returns: heap in MB
+    """
+    heap_MB = min_heap_MB
+    for input_file in files:
+        if not os.path.isfile(input_file):
+            continue
+        factor = heap_factor.get(os.path.splitext(input_file)[1], heap_factor_default)
+        heap_MB += factor * os.path.getsize(input_file) / 1024**2
+
+    if max_heap_MB is None:
+        max_heap_MB = 0.8 * tools.available_RAM() / 1024**2
+
+    return (int(max(256, min(heap_MB, max_heap_MB))))
+
+####################################################################
+def _cpu_times(pid):
+    ## returns user and system CPU time (s) of a process using /proc
+    try:
+        with open('/proc/%s/stat' %pid) as stat_hd:
+            fields = stat_hd.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        return (int(fields[11]) / ticks, int(fields[12]) / ticks)
+    except (OSError, ValueError, IndexError):
+        return (0, 0)
+
+####################################################################
+def java_version(java_exe):
+    """
+    Returns the major version of the java executable given (e.g. 8, 11, 17) or 0 if unknown.
+    """
+    try:
+        out = subprocess.run([java_exe, '-version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True).stdout
+    except OSError:
+        return (0)
+    found = re.search(r'version "(1\.)?(\d+)', out)
+    return (int(found.group(2)) if found else 0)
+
+def worker_command(java_exe, Debug=False):
+    """
+    Returns the arguments to launch a worker with the java executable given (after heap option).
+
+    ``JavaWorker.java`` is compiled into a temporary folder, removed at exit, if ``javac`` is
+    available. Otherwise it is launched as a single-file source program.
+    """
+    with _worker_commands_lock:
+        if java_exe in _worker_commands:
+            return (_worker_commands[java_exe])
+
+        ## System.exit() is trapped using a security manager: it must be allowed for java 18-23
+        ## and it is an error to allow it for java 24 or later
+        command = []
+        if 18 <= java_version(java_exe) <= 23:
+            command.append('-Djava.security.manager=allow')
+
+        javac_exe = os.path.join(os.path.dirname(os.path.realpath(java_exe)), 'javac')
+        if not os.path.isfile(javac_exe):
+            javac_exe = shutil.which('javac')
+        classes_folder = tempfile.mkdtemp(prefix='XICRA_java_worker_')
+        atexit.register(shutil.rmtree, classes_folder, True)
+        if javac_exe and subprocess.run([javac_exe, '-d', classes_folder, worker_source],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0:
+            command += ['-cp', classes_folder, 'JavaWorker']
+        else:
+            command.append(worker_source)
+
+        if Debug:
+            print (colored("**DEBUG: java worker command: %s %s **" %(java_exe, " ".join(command)), 'yellow'))
+
+        _worker_commands[java_exe] = command
+        return (command)
+
+####################################################################
+class JavaWorker():
+    """
+    JVM running ``JavaWorker.java``. Jobs are executed one at a time.
+
+    :param java_exe: java executable
+    :param heap_MB: Maximum heap of the JVM (MB).
+    :param Debug: show extra information of the process
+    """
+    def __init__(self, java_exe, heap_MB, Debug=False):
+        self.heap_MB = heap_MB
+        self.busy = False
+        self.proc = subprocess.Popen([java_exe, '-Xmx%sm' %heap_MB] + worker_command(java_exe, Debug),
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     universal_newlines=True, bufsize=1)
+        ready = self._status('XICRA_WORKER_READY')
+        if ready is None:
+            self.close()
+            raise OSError("java worker could not be started (exit code %s)" %self.proc.returncode)
+
+        ## System.exit() of the tools is trapped by the worker
+        self.exit_trap = (ready == 'exit_trap')
+
+    def _status(self, tag):
+        ## reads stdout of the worker until the tag given: returns status or None if finished
+        for line in self.proc.stdout:
+            if line.startswith(tag):
+                return (line.rstrip('\n').split('\t')[-1])
+        self.proc.wait()
+        return (None)
+
+    def alive(self):
+        return (self.proc.poll() is None)
+
+    def run(self, jar, args, stdout_file=None, stderr_file=None):
+        """Executes the jar given with the arguments. Returns 'OK' or 'FAIL'."""
+        request = [jar, stdout_file or '', stderr_file or ''] + [str(arg) for arg in args]
+        try:
+            self.proc.stdin.write('\t'.join(request) + '\n')
+            self.proc.stdin.flush()
+        except OSError:
+            return ('FAIL')
+
+        status = self._status('XICRA_JOB_DONE')
+        if status is None:
+            ## tool called System.exit() (not trapped): the worker finished with its status
+            _exit_jars.add(jar)
+            return ('OK' if self.proc.returncode == 0 else 'FAIL')
+        return (status)
+
+    def close(self):
+        if self.alive():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=30)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+
+####################################################################
+def _acquire(java_exe, heap_MB, Debug=False):
+    ## returns an idle worker with enough heap or starts a new one. Idle workers
+    ## with less heap are closed to free memory
+    with _workers_lock:
+        for worker in list(_workers):
+            if worker.busy:
+                continue
+            if worker.alive() and worker.heap_MB >= heap_MB:
+                worker.busy = True
+                return (worker)
+            _workers.remove(worker)
+            worker.close()
+
+    worker = JavaWorker(java_exe, heap_MB, Debug)
+    worker.busy = True
+    with _workers_lock:
+        _workers.append(worker)
+    if Debug:
+        print (colored("**DEBUG: java worker started: pid %s heap %sm **" %(worker.proc.pid, worker.heap_MB), 'yellow'))
+    return (worker)
+
+def _release(worker):
+    with _workers_lock:
+        worker.busy = False
+        if not worker.alive():
+            _workers.remove(worker)
+
+def idle_RAM():
+    """
+    Returns the heap (bytes) of the workers started by this process not running any job.
+    """
+    with _workers_lock:
+        return (sum(worker.heap_MB for worker in _workers if not worker.busy) * 1024**2)
+
+def close_idle():
+    """Closes the workers started by this process not running any job."""
+    with _workers_lock:
+        for worker in [worker for worker in _workers if not worker.busy]:
+            _workers.remove(worker)
+            worker.close()
+
+def shutdown():
+    """Closes all workers started by this process."""
+    with _workers_lock:
+        for worker in _workers:
+            worker.close()
+        del _workers[:]
+
+atexit.register(shutdown)
+
+####################################################################
+def _worker_call(java_exe, jar, args, stdout_file, stderr_file, heap_MB, step, sample, Debug):
+    ## sends the job to a worker and records the resources used. Returns None if
+    ## no worker is available
+    global _use_workers
+    try:
+        worker = _acquire(java_exe, heap_MB, Debug)
+    except OSError as err:
+        print (colored("** WARNING: %s. Java jobs are executed in a new JVM." %err, 'yellow'))
+        _use_workers = False
+        return (None)
+
+    pid = worker.proc.pid
+    start = time.time()
+    (user_start, sys_start) = _cpu_times(pid)
+    io_start = instrument._proc_usage(pid)
+    try:
+        code = worker.run(jar, args, stdout_file, stderr_file)
+    finally:
+        (user_end, sys_end) = _cpu_times(pid) if worker.alive() else (user_start, sys_start)
+        usage = instrument._proc_usage(pid) if worker.alive() else (0, io_start[1], io_start[2])
+        _release(worker)
+
+    instrument.record_call({'step': step, 'sample': sample, 'start': start,
+                            'cmd': 'java_worker[%s] -Xmx%sm -jar %s %s' %(pid, worker.heap_MB, jar, " ".join(args)),
+                            'wall': round(time.time() - start, 3),
+                            'user': round(user_end - user_start, 3), 'sys': round(sys_end - sys_start, 3),
+                            'max_RSS': usage[0], 'peak_tree_RSS': usage[0],
+                            'read_bytes': usage[1] - io_start[1], 'write_bytes': usage[2] - io_start[2],
+                            'returncode': 0 if code == 'OK' else 1})
+    return (code)
+
+####################################################################
+def java_call(jar, args, stdout_file=None, stderr_file=None, heap_MB=None, step=None, sample=None, Debug=False):
+    """
+    Executes a java jar file with the arguments given.
+
+    Sent to a long-lived worker if enabled (see :func:`XICRA.other_tools.java_worker.enable`) or
+    executed in a new JVM using :func:`XICRA.other_tools.instrument.system_call` otherwise.
+
+    :param jar: java jar file
+    :param args: Arguments for the jar.
+    :param stdout_file: File to save standard output, if any.
+    :param stderr_file: File to save standard error, if any.
+    :param heap_MB: Maximum heap (MB). See :func:`XICRA.other_tools.java_worker.java_heap`.
+    :param step: Name of the step (e.g. sRNAbench).
+    :param sample: Name of the sample, if any.
+    :param Debug: show extra information of the process
+
+    :type jar: string
+    :type args: list
+    :type stdout_file: string
+    :type stderr_file: string
+    :type heap_MB: int
+    :type step: string
+    :type sample: string
+    :type Debug: bool
+
+    :returns: 'OK' or 'FAIL'
+    """
+    java_exe = set_config.get_exe('java', Debug=Debug)
+    args = [str(arg) for arg in args]
+
+    ## arguments are sent to workers separated by tabs
+    if _use_workers and jar not in _exit_jars and not any(('\t' in arg or '\n' in arg) for arg in args):
+        code = _worker_call(java_exe, jar, args, stdout_file, stderr_file,
+                            heap_MB or min_heap_MB, step, sample, Debug)
+        if code:
+            return (code)
+
+    cmd = java_exe
+    if heap_MB:
+        cmd += ' -Xmx%sm' %heap_MB
+    cmd += ' -jar %s %s' %(jar, " ".join(args))
+    if stdout_file:
+        cmd += ' > %s' %stdout_file
+    if stderr_file:
+        cmd += ' 2> %s' %stderr_file
+
+    return (instrument.system_call(cmd, step=step, sample=sample))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Python profiling of XICRA modules (option ``--profile``).
+
+Modules are executed under ``cProfile``. Worker threads (e.g. thread pools sending each sample)
+are also profiled and merged. Profile files and a summary of the functions consuming more
+time are saved in the ``info`` folder.
+"""
+## useful imports
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+from termcolor import colored
+
+import HCGB.functions.files_functions as HCGB_files
+
+####################################################################
+class ThreadProfiles():
+    """
+    Profiles all threads started while enabled.
+
+    Since python 3.12 ``cProfile`` receives events from all threads, so a single profiler
+    is enough. For previous versions, a profiler is created for each new thread.
+    """
+    def __init__(self):
+        self.main = cProfile.Profile()
+        self.threads = []
+        self._lock = threading.Lock()
+        self._per_thread = sys.version_info < (3, 12)
+
+    def _hook(self, frame, event, arg):
+        ## first event in a new thread: replace this hook by a profiler for the thread
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.threads.append((threading.current_thread().name, profiler))
+        profiler.enable()
+
+    def enable(self):
+        if self._per_thread:
+            threading.setprofile(self._hook)
+        self.main.enable()
+
+    def disable(self):
+        self.main.disable()
+        if self._per_thread:
+            threading.setprofile(None)
+
+    def stats(self, stream):
+        """Returns merged stats of main and worker threads and total time of each thread."""
+        all_stats = pstats.Stats(self.main, stream=stream)
+        threads_time = [('MainThread', all_stats.total_tt)]
+        for name, profiler in self.threads:
+            try:
+                thread_stats = pstats.Stats(profiler, stream=stream)
+            except TypeError:
+                ## no calls recorded
+                continue
+            threads_time.append((name, thread_stats.total_tt))
+            all_stats.add(thread_stats)
+        return (all_stats, threads_time)
+
+####################################################################
+def profile_dir(options):
+    """
+    Returns the ``info`` folder to save the profile: output folder if detached mode,
+    input folder (project) otherwise, or the current directory.
+    """
+    folder = None
+    if getattr(options, 'detached', False) and getattr(options, 'output_folder', None):
+        folder = options.output_folder
+    elif getattr(options, 'input', None) and os.path.isdir(options.input):
+        folder = options.input
+
+    if not folder or not os.path.isdir(folder):
+        folder = os.getcwd()
+
+    return (HCGB_files.create_subfolder("info", os.path.abspath(folder)))
+
+####################################################################
+def run_profiled(func, options, module_name, top=30):
+    """
+    Runs a module under the python profiler.
+
+    Saves ``info/profile_<module>_<date>.prof`` (see ``pstats``) and
+    ``info/profile_<module>_<date>.txt`` with the top functions by internal and
+    cumulative time and the time recorded for each thread.
+
+    :param func: Main function of the module.
+    :param options: Input parameters of the module.
+    :param module_name: Name of the module.
+    :param top: Number of functions to report.
+    """
+    profiles = ThreadProfiles()
+    profiles.enable()
+    try:
+        return (func(options))
+    finally:
+        profiles.disable()
+
+        ## save profile even if the module exits
+        info_dir = profile_dir(options)
+        profile_name = os.path.join(info_dir, "profile_%s_%s" %(module_name, time.strftime("%Y%m%d-%H%M%S")))
+
+        summary = io.StringIO()
+        (all_stats, threads_time) = profiles.stats(summary)
+        all_stats.dump_stats(profile_name + '.prof')
+
+        summary.write("## XICRA %s: python profile\n" %module_name)
+        summary.write("## Command: %s\n\n" %" ".join(sys.argv))
+        summary.write("## Time recorded for each thread (s)\n")
+        for name, total_tt in threads_time:
+            summary.write("%s\t%.3f\n" %(name, total_tt))
+
+        summary.write("\n## Top %s functions by internal time\n" %top)
+        all_stats.sort_stats('tottime').print_stats(top)
+        summary.write("\n## Top %s functions by cumulative time\n" %top)
+        all_stats.sort_stats('cumulative').print_stats(top)
+
+        with open(profile_name + '.txt', 'w') as summary_hd:
+            summary_hd.write(summary.getvalue())
+
+        print (colored("\n+ Python profile saved in: %s.prof / .txt" %profile_name, 'yellow'))
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Scatter-gather execution of single-threaded tools (miraligner, OptimiR, MINTmap).
+
+Unique sequences of a sample (see :func:`XICRA.scripts.collapse_reads.collapse_reads`) are split
+into shards of contiguous sequences. The tool is executed on each shard at the same time and
+outputs of the shards are merged by a function of the tool caller. Each unique sequence is
+analyzed in a single shard and fastq shards contain the original records (name, sequence and
+quality) of the reads, so merged results contain the same counts as an unsharded run.
+"""
+## useful imports
+import os
+import re
+import bisect
+import shutil
+import concurrent.futures
+from termcolor import colored
+
+from HCGB.functions import files_functions
+
+from XICRA.scripts import collapse_reads
+from XICRA.other_tools import intermediate
+
+## minimum unique sequences for each shard: smaller samples are not split
+min_shard_sequences = 50000
+
+####################################################################
+def count_lines(file_given):
+    """Returns the number of lines of a file."""
+    with open(file_given) as file_hd:
+        return (sum(1 for line in file_hd))
+
+def shard_bounds(collapsed_file, n_shards):
+    """
+    Splits unique sequences of collapsed reads into shards of contiguous sequences.
+
+    :param collapsed_file: Collapsed reads (sequence<tab>count), sorted by sequence.
+    :param n_shards: Number of shards.
+
+    :returns: Tuple with the index of the first sequence of each shard and the size of the shards.
+    """
+    shard_size = -(-count_lines(collapsed_file) // n_shards)
+    return ([shard_number * shard_size for shard_number in range(n_shards)], shard_size)
+
+def split_collapsed(collapsed_file, shard_files, shard_format='rc'):
+    """
+    Splits collapsed reads into shards of contiguous unique sequences.
+
+    Used for tools reading collapsed reads. For fastq tools, only if the original reads are
+    not available: reads of fastq shards are named ``seq_<index>_<copy>`` using the index of
+    the sequence in the collapsed file, with the highest quality for every base.
+
+    :param collapsed_file: Collapsed reads (sequence<tab>count).
+    :param shard_files: Files to create, one for each shard.
+    :param shard_format: rc (sequence<tab>count) or fastq (each sequence repeated count times).
+
+    :returns: Tuple with the index of the first sequence of each shard and the reads of each shard.
+    """
+    (offsets, shard_size) = shard_bounds(collapsed_file, len(shard_files))
+
+    shard_reads = []
+    with open(collapsed_file) as collapsed_hd:
+        for shard_number, shard_file in enumerate(shard_files):
+            shard_reads.append(0)
+            with open(shard_file, 'w') as shard_hd:
+                for line_number, line in enumerate(collapsed_hd):
+                    (seq, count) = line.rstrip('\n').split('\t')
+                    shard_reads[-1] += int(count)
+                    if shard_format == 'fastq':
+                        record = "@seq_%s_%%s\n%s\n+\n%s\n" %(offsets[shard_number] + line_number, seq, 'I'*len(seq))
+                        shard_hd.write("".join(record %copy for copy in range(int(count))))
+                    else:
+                        shard_hd.write(line)
+                    if line_number + 1 == shard_size:
+                        break
+    return (offsets, shard_reads)
+
+def split_fastq(fastq_file, collapsed_file, shard_files, threads=1):
+    """
+    Splits reads of a fastq file into shards: the same shards of unique sequences as
+    :func:`split_collapsed`.
+
+    Records are written as provided (name, sequence and quality) and in the same order. All
+    reads of a sequence are written into the same shard.
+
+    :param fastq_file: Reads (fastq, plain or compressed).
+    :param collapsed_file: Collapsed reads of the fastq file (sequence<tab>count), sorted by sequence.
+    :param shard_files: Files to create, one for each shard.
+    :param threads: threads available to decompress
+
+    :returns: Tuple with the index of the first sequence of each shard and the reads of each shard.
+    """
+    (offsets, shard_size) = shard_bounds(collapsed_file, len(shard_files))
+
+    ## first sequence of each shard: shard of a read is found by bisection
+    first_seqs = []
+    with open(collapsed_file) as collapsed_hd:
+        for line_number, line in enumerate(collapsed_hd):
+            if line_number % shard_size == 0:
+                first_seqs.append(line.split('\t', 1)[0])
+
+    shard_reads = [0 for shard_file in shard_files]
+    shard_hds = [open(shard_file, 'w') for shard_file in shard_files]
+    reads_hd = intermediate.open_reads(fastq_file, threads)
+    try:
+        for line_number, line in enumerate(reads_hd):
+            if line_number % 4 == 0:
+                record = [line]
+                continue
+            record.append(line)
+            if line_number % 4 == 3:
+                if not line.endswith('\n'):
+                    record[3] = line + '\n'
+                shard_number = bisect.bisect_right(first_seqs, record[1].rstrip()) - 1
+                shard_hds[shard_number].write("".join(record))
+                shard_reads[shard_number] += 1
+    finally:
+        reads_hd.close()
+        for shard_hd in shard_hds:
+            shard_hd.close()
+    return (offsets, shard_reads)
+
+####################################################################
+def merge_text(shard_files, out_file, rename=None):
+    """
+    Concatenates text outputs of the shards.
+
+    Header lines (starting with ``#``, or first line if identical in all shards) are
+    written once.
+
+    :param shard_files: Output of each shard, in order.
+    :param out_file: Merged file.
+    :param rename: Function applied to each line of a shard: rename(line, shard_number).
+    """
+    first_lines = set()
+    for shard_file in shard_files:
+        with open(shard_file) as shard_hd:
+            first_lines.add(shard_hd.readline())
+    first_lines.discard('')
+    shared_header = len(first_lines) == 1
+
+    with open(out_file + '.tmp', 'w') as out_hd:
+        for shard_number, shard_file in enumerate(shard_files):
+            with open(shard_file) as shard_hd:
+                for line_number, line in enumerate(shard_hd):
+                    header = line.startswith('#') or (line_number == 0 and shared_header)
+                    if header:
+                        if shard_number == 0:
+                            out_hd.write(line)
+                        continue
+                    out_hd.write(rename(line, shard_number) if rename else line)
+    os.replace(out_file + '.tmp', out_file)
+
+def rename_seq(offsets):
+    """Returns function to rename reads ``seq_<index>`` of each shard as in the unsharded input."""
+    seq_regex = re.compile(r'\bseq_(\d+)')
+    def rename(line, shard_number):
+        return (seq_regex.sub(lambda match: "seq_%s" %(offsets[shard_number] + int(match.group(1))), line))
+    return (rename)
+
+####################################################################
+def scatter_gather(reads, folder, name, threads, run_shard, gather, shard_format='rc', Debug=False):
+    """
+    Executes a tool for a sample splitting its unique sequences into shards.
+
+    If a single thread is available or the sample is small (less than ``min_shard_sequences``
+    unique sequences for each shard), the tool is executed on the reads as provided. Zstd
+    compressed reads are always sent to fastq tools as plain fastq. If outputs of the shards
+    cannot be merged, the tool is executed on the reads as provided.
+
+    :param reads: File with sample reads (fastq) or collapsed reads (.rc), in a list.
+    :param folder: Output folder of the tool.
+    :param name: Sample name.
+    :param threads: Number of shards to execute at the same time.
+    :param run_shard: Function executing the tool: run_shard(reads, folder). Returns True/False.
+    :param gather: Function merging outputs of the shards into folder: gather(shard_folders, offsets, shard_reads), with the index of the first unique sequence and the number of reads of each shard. Returns True/False.
+    :param shard_format: rc or fastq: input format of the tool.
+    :param Debug: show extra information of the process
+
+    :returns: True/False
+    """
+    ## tools do not read zstd compressed or collapsed reads
+    decompress = shard_format == 'fastq' and reads[0].endswith(('.zst', '.rc'))
+    if (threads < 2 and not decompress) or len(reads) > 1:
+        code = run_shard(reads, folder)
+        return (bool(code) and code != 'FAIL')
+
+    shards_folder = files_functions.create_subfolder('shards', folder)
+
+    ## unique sequences of the sample
+    collapsed_file = reads[0]
+    if not collapsed_file.endswith('.rc'):
+        collapsed_file = os.path.join(shards_folder, name + '.rc')
+        collapse_reads.collapse_reads(reads[0], collapsed_file, threads, Debug)
+
+    unique_seqs = count_lines(collapsed_file)
+    n_shards = min(threads, unique_seqs // min_shard_sequences)
+    if n_shards < 2 and not decompress:
+        shutil.rmtree(shards_folder)
+        code = run_shard(reads, folder)
+        return (bool(code) and code != 'FAIL')
+
+    ## create shards: same file name as the original input
+    shard_name = os.path.basename(reads[0])
+    if shard_format == 'fastq':
+        shard_name = re.sub(r'(\.fastq|\.fq)?(\.gz|\.zst|\.rc)?$', '.fastq', shard_name, count=1)
+    def split(shard_inputs):
+        if shard_format == 'fastq' and not reads[0].endswith('.rc'):
+            return (split_fastq(reads[0], collapsed_file, shard_inputs, threads))
+        return (split_collapsed(collapsed_file, shard_inputs, shard_format))
+
+    ## all reads at once: plain fastq for the tool, if required
+    def run_all():
+        if decompress:
+            all_reads = [os.path.join(shards_folder, shard_name)]
+            split(all_reads)
+            code = run_shard(all_reads, folder)
+        else:
+            code = run_shard(reads, folder)
+        shutil.rmtree(shards_folder)
+        return (bool(code) and code != 'FAIL')
+
+    if n_shards < 2:
+        return (run_all())
+
+    shard_folders = [files_functions.create_subfolder('shard_%s' %i, shards_folder) for i in range(n_shards)]
+    shard_inputs = [os.path.join(shard_folder, shard_name) for shard_folder in shard_folders]
+    (offsets, shard_reads) = split(shard_inputs)
+
+    print ("+ Sample %s: %s unique sequences split into %s shards" %(name, unique_seqs, n_shards))
+    if Debug:
+        print (colored("**DEBUG: scatter %s: shard offsets %s reads %s **" %(name, offsets, shard_reads), 'yellow'))
+
+    ## execute the tool on each shard
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_shards) as executor:
+        codes = list(executor.map(lambda i: run_shard([shard_inputs[i]], shard_folders[i]), range(n_shards)))
+
+    ## system calls return 'OK' or 'FAIL'
+    if not all(code and code != 'FAIL' for code in codes):
+        print (colored("** ERROR: Some shards failed for sample %s. See %s" %(name, shards_folder), 'red'))
+        return (False)
+
+    ## merge results
+    for shard_input in shard_inputs:
+        os.remove(shard_input)
+    if not gather(shard_folders, offsets, shard_reads):
+        print (colored("** Results of the shards of sample %s could not be merged: analyzing all reads at once" %name, 'yellow'))
+        for shard_folder in shard_folders:
+            shutil.rmtree(shard_folder)
+        return (run_all())
+
+    shutil.rmtree(shards_folder)
+    return (True)
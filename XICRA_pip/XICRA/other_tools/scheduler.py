@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Resource-aware scheduler for per-sample jobs.
+
+Jobs are sent as in a ``concurrent.futures.ThreadPoolExecutor`` but each one is only
+started when the CPUs and RAM it declares are free. Peak RAM of the external tools
+called in each step (see :func:`XICRA.other_tools.instrument.record_call`) is saved in
+``info/resources.json`` and used as estimate in later runs.
+"""
+## useful imports
+import os
+import json
+import time
+import threading
+import concurrent.futures
+from termcolor import colored
+
+from HCGB.functions import files_functions, main_functions
+
+from XICRA.other_tools import tools, instrument, java_worker
+
+####################################################################
+def RAM_estimate(info_dir, step, declared=0):
+    """
+    Returns the RAM (bytes) to reserve for each job of a step.
+
+    The maximum of the declared value and the peak RAM saved in previous runs, if any.
+
+    :param info_dir: Folder containing ``resources.json``.
+    :param step: Name of the step (e.g. trim, join, miRNA).
+    :param declared: RAM (bytes) declared by the module.
+
+    :type info_dir: string
+    :type step: string
+    :type declared: int
+
+    :returns: RAM in bytes
+    """
+    if not info_dir or not step:
+        return (int(declared))
+
+    resources_file = os.path.join(info_dir, "resources.json")
+    if not files_functions.is_non_zero_file(resources_file):
+        return (int(declared))
+
+    try:
+        resources = main_functions.read_json_file(resources_file)
+        learned = int(resources.get(step, {}).get('RAM', 0))
+    except (ValueError, AttributeError):
+        learned = 0
+
+    return (max(int(declared), learned))
+
+####################################################################
+def save_RAM_peak(info_dir, step, peak_RAM, job_cpus):
+    """
+    Saves peak RAM (bytes) observed for a step in ``resources.json``.
+
+    :param info_dir: Folder containing ``resources.json``.
+    :param step: Name of the step (e.g. trim, join, miRNA).
+    :param peak_RAM: RAM in bytes.
+    :param job_cpus: CPUs used by each job.
+    """
+    resources_file = os.path.join(info_dir, "resources.json")
+    resources = {}
+    if files_functions.is_non_zero_file(resources_file):
+        try:
+            resources = main_functions.read_json_file(resources_file)
+        except ValueError:
+            resources = {}
+
+    resources[step] = {'RAM': int(peak_RAM), 'cpus': int(job_cpus), 'time': time.time()}
+
+    ## write to a temporary file and rename
+    with open(resources_file + '.tmp', 'w') as resources_hd:
+        json.dump(resources, resources_hd, indent=4)
+    os.replace(resources_file + '.tmp', resources_file)
+
+####################################################################
+def fit_jobs(max_cpus, job_cpus, job_RAM, max_RAM):
+    """
+    Number of jobs that can run at the same time given CPUs and RAM available.
+
+    :param max_cpus: CPUs available.
+    :param job_cpus: CPUs for each job.
+    :param job_RAM: RAM (bytes) for each job.
+    :param max_RAM: RAM (bytes) available.
+
+    :returns: number of jobs (at least one)
+    """
+    jobs = int(max_cpus) // max(1, int(job_cpus))
+    if job_RAM > 0:
+        jobs = min(jobs, int(max_RAM // job_RAM))
+    return (max(1, jobs))
+
+####################################################################
+class ResourceScheduler(concurrent.futures.ThreadPoolExecutor):
+    """
+    Thread pool that starts jobs only when the CPUs and RAM they declare are free.
+
+    Jobs are started in the order they are submitted. A job requiring more than the
+    resources available is clamped to them, so it runs alone.
+
+    Heap of idle java workers (see :mod:`XICRA.other_tools.java_worker`) is not free RAM: 
+    if a job does not fit because of them, idle workers are closed.
+
+    If step and info_dir are provided, the RAM for each job is the maximum of job_RAM
+    and the peak saved in previous runs (see :func:`XICRA.other_tools.scheduler.RAM_estimate`)
+    and the peak observed is saved when the scheduler is shut down. The peak is the
+    largest ``peak_tree_RSS`` of the tool calls recorded while the scheduler is running
+    (see :func:`XICRA.other_tools.instrument.record_call`).
+
+    :param max_cpus: CPUs available.
+    :param job_cpus: CPUs for each job.
+    :param job_RAM: RAM (bytes) for each job.
+    :param max_RAM: RAM (bytes) available. Default: memory available in the system.
+    :param step: Name of the step (e.g. trim, join, miRNA).
+    :param info_dir: Folder to save/read RAM estimates.
+    :param Debug: show extra information of the process
+
+    :type max_cpus: int
+    :type job_cpus: int
+    :type job_RAM: int
+    :type max_RAM: int
+    :type step: string
+    :type info_dir: string
+    :type Debug: bool
+    """
+    def __init__(self, max_cpus, job_cpus=1, job_RAM=0, max_RAM=None, step=None, info_dir=None, Debug=False):
+
+        self.max_cpus = max(1, int(max_cpus))
+        self.job_cpus = min(max(1, int(job_cpus)), self.max_cpus)
+        if max_RAM is None:
+            ## idle java workers are discounted when jobs are started
+            max_RAM = tools.available_RAM() + java_worker.idle_RAM()
+        self.max_RAM = max(0, int(max_RAM))
+        self.job_RAM = min(RAM_estimate(info_dir, step, job_RAM), self.max_RAM)
+        self.max_jobs = fit_jobs(self.max_cpus, self.job_cpus, self.job_RAM, self.max_RAM)
+
+        self.step = step
+        self.info_dir = info_dir
+        self.Debug = Debug
+
+        ## resources free and order of jobs
+        self._condition = threading.Condition()
+        self._free_cpus = self.max_cpus
+        self._free_RAM = self.max_RAM
+        self._next_ticket = 0
+        self._serving = 0
+
+        ## peak RAM of tool calls of this step
+        self._peak_RAM = 0
+        instrument.add_observer(self._observe)
+
+        if Debug:
+            print (colored("**DEBUG: scheduler %s: max_cpus %s max_RAM %s job_cpus %s job_RAM %s max_jobs %s **" %(
+                step, self.max_cpus, self.max_RAM, self.job_cpus, self.job_RAM, self.max_jobs), 'yellow'))
+
+        super().__init__(max_workers=self.max_jobs)
+
+    def _fits(self, ticket):
+        ## job can be started: its turn and resources free
+        if ticket != self._serving or self._free_cpus < self.job_cpus or self._free_RAM < self.job_RAM:
+            return (False)
+        if self._free_RAM - java_worker.idle_RAM() < self.job_RAM:
+            java_worker.close_idle()
+        return (True)
+
+    def submit(self, fn, *args, **kwargs):
+        """Sends a job: fn(*args, **kwargs). Returns a Future."""
+        return (super().submit(self._run, fn, args, kwargs))
+
+    def _run(self, fn, args, kwargs):
+        ## wait for turn and resources
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._condition.wait_for(lambda: self._fits(ticket))
+            self._serving += 1
+            self._free_cpus -= self.job_cpus
+            self._free_RAM -= self.job_RAM
+            self._condition.notify_all()
+
+        try:
+            return (fn(*args, **kwargs))
+        finally:
+            with self._condition:
+                self._free_cpus += self.job_cpus
+                self._free_RAM += self.job_RAM
+                self._condition.notify_all()
+
+    def _observe(self, info_call):
+        ## keep peak RAM of each tool call
+        with self._condition:
+            self._peak_RAM = max(self._peak_RAM, int(info_call.get('peak_tree_RSS') or 0))
+
+    def shutdown(self, wait=True, **kwargs):
+        super().shutdown(wait=wait, **kwargs)
+        instrument.remove_observer(self._observe)
+
+        ## save peak RAM if any tool was called by the jobs of this step
+        if wait and self.step and self.info_dir and self._peak_RAM > 0:
+            save_RAM_peak(self.info_dir, self.step, self._peak_RAM, self.job_cpus)
+            if self.Debug:
+                print (colored("**DEBUG: scheduler %s: peak RAM %s **" %(self.step, self._peak_RAM), 'yellow'))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+"""
+Content-addressed cache for the steps of each sample.
+
+Each step is identified by its time stamp file (e.g. ``sample_folder/.success``) and
+a key generated from the hash of its input files, its parameters and the version of the
+tool employed. Keys are saved in a manifest for each project (``info/step_cache.json``)
+so a step is only executed again if any of them changed.
+"""
+## useful imports
+import os
+import json
+import hashlib
+import threading
+from termcolor import colored
+
+import HCGB.functions.info_functions as HCGB_info
+import HCGB.functions.time_functions as HCGB_time
+
+from XICRA.config import set_config
+
+## manifest of the project: {'files': {path: digest}, 'steps': {stamp: {key, time}}}
+_manifest_file = None
+_manifest = {'files': {}, 'steps': {}}
+_manifest_lock = threading.RLock()
+
+####################################################################
+def set_manifest(info_dir):
+    """
+    Sets the manifest of the project to use in this process.
+
+    If no manifest is set, steps are only skipped if the time stamp exists, as previously.
+
+    :param info_dir: Folder of the project containing information (e.g. project/info).
+    :type info_dir: string
+    """
+    global _manifest_file, _manifest
+
+    manifest_file = os.path.join(os.path.abspath(info_dir), "step_cache.json")
+    manifest = {}
+    try:
+        with open(manifest_file) as manifest_hd:
+            manifest = json.load(manifest_hd)
+    except (OSError, ValueError):
+        manifest = {}
+
+    with _manifest_lock:
+        _manifest_file = manifest_file
+        _manifest = {'files': manifest.get('files', {}), 'steps': manifest.get('steps', {})}
+
+####################################################################
+def _save_manifest():
+    ## write to a temporary file and rename: call with lock acquired
+    tmp_file = _manifest_file + '.tmp'
+    with open(tmp_file, 'w') as manifest_hd:
+        json.dump(_manifest, manifest_hd, indent=4)
+    os.replace(tmp_file, _manifest_file)
+
+####################################################################
+def file_fingerprint(this_file):
+    """
+    Returns the sha256 hash of the file given.
+
+    The hash is saved in the manifest and it is only computed again if size or
+    modification time of the file change.
+
+    :param this_file: file to check
+    :type this_file: string
+    :returns: hash (hexadecimal) or 'missing' if the file does not exist
+    """
+    this_file = os.path.abspath(this_file)
+    try:
+        stat = os.stat(this_file)
+    except OSError:
+        return ('missing')
+    if os.path.isdir(this_file):
+        return ('folder')
+
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    with _manifest_lock:
+        previous = _manifest['files'].get(this_file)
+    if previous and previous.get('stamp') == stamp:
+        return (previous['hash'])
+
+    file_hash = HCGB_info.read_filehash(this_file).hexdigest()
+    with _manifest_lock:
+        _manifest['files'][this_file] = {'stamp': stamp, 'hash': file_hash}
+
+    return (file_hash)
+
+####################################################################
+def step_key(inputs, params=None, tool=None, Debug=False):
+    """
+    Returns the key of a step.
+
+    :param inputs: Input files of the step (e.g. reads, database files).
+    :param params: Parameters of the step. Any object that can be converted to JSON.
+    :param tool: Name of the software employed (see :func:`XICRA.config.set_config.get_exe`), if any.
+    :param Debug: show extra information of the process
+
+    :type inputs: list
+    :type tool: string
+    :type Debug: bool
+
+    :returns: key (hexadecimal)
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+
+    tool_version = ''
+    if tool:
+        tool_version = set_config.get_exe(tool, Return_Version=True)[1]
+
+    info_step = {'inputs': [file_fingerprint(f) for f in inputs if f],
+                 'params': params,
+                 'tool': [tool, tool_version]}
+
+    if Debug:
+        print (colored("**DEBUG: step_key: %s **" %info_step, 'yellow'))
+
+    info_string = json.dumps(info_step, sort_keys=True, default=str)
+    return (hashlib.sha256(info_string.encode()).hexdigest())
+
+####################################################################
+def previous_results(filename_stamp, key):
+    """
+    Checks if a step was previously done with the same key.
+
+    If the time stamp exists but the key differs, the time stamp is removed and
+    False is returned, so the step is executed again. Time stamps generated with no
+    manifest are considered valid and its key is saved.
+
+    :param filename_stamp: Time stamp file of the step.
+    :param key: Key of the step (see :func:`XICRA.other_tools.step_cache.step_key`)
+
+    :returns: True/False
+    """
+    if not os.path.isfile(filename_stamp):
+        return (False)
+
+    if not _manifest_file:
+        return (True)
+
+    filename_stamp = os.path.abspath(filename_stamp)
+    with _manifest_lock:
+        previous = _manifest['steps'].get(filename_stamp)
+        if previous is None:
+            ## generated before manifest was available
+            _manifest['steps'][filename_stamp] = {'key': key, 'time': HCGB_time.read_time_stamp(filename_stamp)}
+            _save_manifest()
+            return (True)
+
+        if previous.get('key') == key:
+            return (True)
+
+    print (colored("\tInputs, parameters or software changed since results were generated: %s" %os.path.dirname(filename_stamp), 'yellow'))
+    os.remove(filename_stamp)
+    return (False)
+
+####################################################################
+def save_step(filename_stamp, key):
+    """
+    Creates the time stamp of a step and saves its key in the manifest.
+
+    :param filename_stamp: Time stamp file of the step.
+    :param key: Key of the step (see :func:`XICRA.other_tools.step_cache.step_key`)
+    """
+    HCGB_time.print_time_stamp(filename_stamp)
+
+    if not _manifest_file:
+        return ()
+
+    with _manifest_lock:
+        _manifest['steps'][os.path.abspath(filename_stamp)] = {'key': key, 'time': HCGB_time.read_time_stamp(filename_stamp)}
+        _save_manifest()
+
+####################################################################
+def succeeded(code):
+    """
+    Checks the code returned by a step before saving it.
+
+    System calls (see :func:`XICRA.other_tools.instrument.system_call` and
+    :func:`XICRA.other_tools.java_worker.java_call`) return 'OK' or 'FAIL', both
+    evaluated as True.
+
+    :param code: Code returned: 'OK'/'FAIL', True/False or the file generated.
+
+    :returns: True/False
+    """
+    return (bool(code) and code != 'FAIL')
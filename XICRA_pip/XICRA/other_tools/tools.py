@@ -4,7 +4,8 @@
 ## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
 ##########################################################
 """
-Retrieves files within ``other_tools`` directory and returns path to given script specified
+Retrieves files within ``other_tools`` directory and returns path to given script specified.
+Other helper functions.
 """
 ## useful imports
 import os
@@ -23,4 +24,21 @@ def R_scripts(script, Debug):
         name = os.path.splitext(os.path.basename(f))[0]
         if (name == script):
             return (f)
-        
\ No newline at end of file
+        
+
+####################################################################
+def available_RAM():
+    """
+    Returns memory available (bytes) for new processes.
+    
+    It uses MemAvailable from ``/proc/meminfo`` if available, otherwise free physical pages.
+    """
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return (int(line.split()[1]) * 1024)
+    except (OSError, ValueError):
+        pass
+    
+    return (os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE'))
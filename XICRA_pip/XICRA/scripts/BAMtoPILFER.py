@@ -13,23 +13,58 @@ from collections import defaultdict
 import argparse
 from termcolor import colored
 import concurrent.futures
+import multiprocessing
+from collections import deque
 
 from XICRA.scripts import bedtools_caller
 from XICRA.scripts import samtools_caller
 from XICRA.scripts import pilfer_caller
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument
 from XICRA.modules import database
 
 import HCGB.functions.fasta_functions as HCGB_fasta
 import HCGB.functions.time_functions as HCGB_time
-import HCGB.functions.system_call_functions as HCGB_sys
 import HCGB.functions.files_functions as HCGB_files
 import HCGB.functions.main_functions as HCGB_main
 import HCGB.functions.aesthetics_functions as HCGB_aes
 import HCGB.format_conversion.file_splitter as HCGB_splitter
 
+## pysam is required for the streaming conversion. If not available
+## use bedtools/samtools conversion using intermediate files
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
 ##########################################################3
-def annotate_sam_call(sam_file, gold_piRNA, ncpu, folder, Debug):
+def sam_byte_ranges(sam_file, n_chunks):
+    """
+    Splits a SAM file in byte ranges aligned to line boundaries.
+    
+    :param sam_file: Absolute path to SAM file.
+    :param n_chunks: Number of ranges desired.
+    
+    :returns: List of tuples (start, end) for each range.
+    """
+    file_size = os.path.getsize(sam_file)
+    chunk_size = max(1, int(file_size / n_chunks))
+    
+    ranges = []
+    start = 0
+    with open(sam_file, 'rb') as sam_hd:
+        while start < file_size:
+            ## move to next line boundary
+            sam_hd.seek(min(start + chunk_size, file_size))
+            sam_hd.readline()
+            end = min(sam_hd.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    
+    return (ranges)
+
+##########################################################3
+def annotate_sam_call(sam_file, gold_piRNA, ncpu, parsed_sam, Debug):
     
     ### Original code
     # def ReverseComplement(seq):
@@ -43,54 +78,56 @@ def annotate_sam_call(sam_file, gold_piRNA, ncpu, folder, Debug):
     # seq_id = list(set(seq_id))
     
     
-    ## read fasta file and save results in list
-    seq_dict = HCGB_fasta.get_fasta_dict(gold_piRNA, Debug=Debug)
-    seq_id = list(seq_dict.keys())
+    ## read gold piRNA sequences as a set: O(1) look up for each read
+    ## index is saved next to fasta file and only generated once
+    seq_id = database.piRNA_gold_index(gold_piRNA, Debug)
 
     if Debug:
-        print("seq_dict gold piRNA")
-        ##print(seq_dict)
+        print("seq_id gold piRNA")
+        ##print(seq_id)
         print ("ATTENTION: Very big file. See file provided for details: " + gold_piRNA)
 
-    ## as it might be very big, we are splitting and processing in parallel
-    path_given = HCGB_files.create_folder(os.path.join(folder, "split_sam"))
-    HCGB_splitter.split_file_call(sam_file, ncpu*8, "split_file", False, 'SAM', os.path.abspath(path_given), Debug)
+    ## as it might be very big, we are processing byte ranges in parallel.
+    ## Annotation is pure python code, so use processes instead of threads (GIL)
+    ## and read ranges from the original SAM file: no split files are generated.
+    list_ranges = sam_byte_ranges(sam_file, ncpu*8)
     
-    list_sam_files = HCGB_main.get_fullpath_list(path_given, Debug)
+    if Debug:
+        HCGB_aes.debug_message("SAM byte ranges: " + str(len(list_ranges)), "yellow")
     
-    ## remove non-desired files
-    list_sam_files = [s for s in list_sam_files if '.parsed' not in s]
-    list_sam_files = [s for s in list_sam_files if '.split_file_success' not in s]
-
-    ## send for each subset using multiple threads
-    cpus2use=ncpu*4 ## Each single process uses just 10% each cpu, we would increase speed by using x4 times more. 
-		    ## It might not be best way but it really speeds up the process and does not consum many RAM or CPUs
-    with concurrent.futures.ThreadPoolExecutor(max_workers=cpus2use) as executor:
-        commandsSent = { executor.submit(pilfer_caller.annotate_sam, seq_id, 
-                                         subset_sam, Debug): subset_sam for subset_sam in list_sam_files }
-
-        for cmd2 in concurrent.futures.as_completed(commandsSent):
-            details = commandsSent[cmd2]
-            try:
-                data = cmd2.result()
-            except Exception as exc:
-                print ('***ERROR:')
-                print (cmd2)
-                print('%r generated an exception: %s' % (details, exc))
-
-    list_sam_files = (s + '.parsed' for s in list_sam_files)
+    ## use fork when available to share gold piRNA sequences copy-on-write
+    if 'fork' in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context('fork')
+    else:
+        mp_context = multiprocessing.get_context()
     
-    if Debug:
-        print(list_sam_files)
+    ## results are written in order, keep a limited number of ranges on the fly
+    max_on_fly = ncpu*2
+    parsed_sam_file = open(parsed_sam, "w")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=ncpu, mp_context=mp_context,
+                                                initializer=pilfer_caller.init_annotate_worker, 
+                                                initargs=(seq_id,)) as executor:
+        commandsSent = deque()
+        for start, end in list_ranges:
+            commandsSent.append(executor.submit(pilfer_caller.annotate_sam_chunk, sam_file, start, end))
+            if len(commandsSent) >= max_on_fly:
+                parsed_sam_file.write(commandsSent.popleft().result())
+        
+        while commandsSent:
+            parsed_sam_file.write(commandsSent.popleft().result())
 
-    return(list_sam_files)
+    parsed_sam_file.close()
+    
+    return(parsed_sam)
 
 ################################
 def process_call(bam_file, sample_folder, name, gold_piRNA, ncpu, Debug):
     
-    ## check if previously trimmed and succeeded
+    ## check if previously converted and succeeded with same BAM and annotation
     filename_stamp = sample_folder + '/.success_BAM2PILFER'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key([bam_file, gold_piRNA['general']['ncRNA'], gold_piRNA['piRBase']['gold_piRNA']], 
+                              [bool(pysam)], 'bedtools', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         print ("\n+ Converting BAM file into PILFER input file")
         stamp = HCGB_time.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'BAMtoPILFER'), 'yellow'))
@@ -99,9 +136,12 @@ def process_call(bam_file, sample_folder, name, gold_piRNA, ncpu, Debug):
         return (pilfer_file)
 
     else:
-        code_returned = bam2pilfer(bam_file, sample_folder, name, gold_piRNA, ncpu, Debug)
+        if pysam:
+            code_returned = bam2pilfer_stream(bam_file, sample_folder, name, gold_piRNA, ncpu, Debug)
+        else:
+            code_returned = bam2pilfer(bam_file, sample_folder, name, gold_piRNA, ncpu, Debug)
         if code_returned:
-            HCGB_time.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
             return (code_returned) ## file name
         else:
             print ('** Sample %s failed...' %name)
@@ -121,7 +161,7 @@ def merge_sam_bed(bed_file, sam_file, pilfer_tmp, Debug):
 
     cmd_paste = "paste %s %s | grep \':P\' | awk -v \"OFS=\t\" \'{print $1, $2, $3, $16, $6}\' > %s" %(bed_file, sam_file, pilfer_tmp)
         
-    paste_code = HCGB_sys.system_call(cmd_paste, False, True)
+    paste_code = instrument.system_call(cmd_paste, False, True, step='paste')
     return paste_code
 
 ################################
@@ -147,7 +187,8 @@ def bam2pilfer(bam_file, out_folder, name, annot_info, ncpu, Debug):
     ## generate paste filter tmp file
     reads_to_get = os.path.join(out_folder, "reads2retain.txt")
     filename_stamp = out_folder + '/.subtract_read_success'
-    if os.path.isfile(filename_stamp) and HCGB_files.is_non_zero_file(reads_to_get):
+    key = step_cache.step_key([bed_file_reduced])
+    if step_cache.previous_results(filename_stamp, key) and HCGB_files.is_non_zero_file(reads_to_get):
         stamp = HCGB_time.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'subtract reads'), 'yellow'))
     else:
@@ -162,6 +203,7 @@ def bam2pilfer(bam_file, out_folder, name, annot_info, ncpu, Debug):
 
         sys.stdout = original_stdout
         f_out.close()
+        step_cache.save_step(filename_stamp, key)
     
     ## convert bamtosam
     print("\t- Convert BAM to SAM format file only including subtracted reads...")
@@ -182,51 +224,40 @@ def bam2pilfer(bam_file, out_folder, name, annot_info, ncpu, Debug):
     ## Annotate reads using gold piRNA
     print("\t- Annotate reads in BAM using gold piRNA information provided...")
     
+    ## annotated sam
+    parsed_sam = os.path.join(out_folder, name + '_reduced-annotated.sam')
+    
     ## generate paste filter tmp file
     filename_stamp = out_folder + '/.annotate_sam_success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key([sam_file, annot_info['piRBase']['gold_piRNA']])
+    if step_cache.previous_results(filename_stamp, key) and HCGB_files.is_non_zero_file(parsed_sam):
         stamp = HCGB_time.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'annotate sam'), 'yellow'))
-        
-        path_given = HCGB_files.create_folder(os.path.join(os.path.abspath(out_folder), "split_sam"))
-        list_sam_parsed = HCGB_main.get_fullpath_list(path_given, Debug)
-   
-        ## remove non-desired files
-        list_sam_parsed = [s for s in list_sam_parsed if not '.parsed' not in s]
-        list_sam_parsed = [s for s in list_sam_parsed if '.split_file_success' not in s]
-
     else:
-        list_sam_parsed = annotate_sam_call(sam_file, annot_info['piRBase']['gold_piRNA'], ncpu, out_folder, Debug)
+        try:
+            annotate_sam_call(sam_file, annot_info['piRBase']['gold_piRNA'], ncpu, parsed_sam, Debug)
+        except Exception as exc:
+            print ('***ERROR:')
+            print('%r generated an exception: %s' % (sam_file, exc))
+            print ("** Some error ocurred while annotating SAM file")
+            exit()
+        
         ## print time stamp
-        HCGB_time.print_time_stamp(filename_stamp)
-    
-    ## merge annotated sam
-    parsed_sam = os.path.join(out_folder, name + '_reduced-annotated.sam')
-    list_sam_parsed = sorted(list_sam_parsed, key=lambda x: int("".join([i for i in x if i.isdigit()])))
-
-    if Debug:
-        HCGB_aes.debug_message("List of sam files parsed:")
-        print(list_sam_parsed)
-
-    ## add annotated reads into asingle file
-    parsed_sam_file = open(parsed_sam, "w")
-    for l in list_sam_parsed:
-        for row in open(l, 'r'):
-            parsed_sam_file.write(row)
-
-    parsed_sam_file.close()
+        step_cache.save_step(filename_stamp, key)
     
     #####
     print("\t- Create PILFER format file...")
     filename_stamp = out_folder + '/.convert_bam2pilfer_success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key([bed_file_mapping, parsed_sam], None, 'bedtools')
+    if step_cache.previous_results(filename_stamp, key):
         if (HCGB_files.is_non_zero_file(pilfer_tmp)):
+            stamp = HCGB_time.read_time_stamp(filename_stamp)
             print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'bam2pilfer'), 'yellow'))
             return(pilfer_file)
 
     ## generate paste filter tmp file
     code_exec = merge_sam_bed(bed_file_mapping, parsed_sam, pilfer_tmp, Debug)
-    if not code_exec:
+    if not step_cache.succeeded(code_exec):
         print ("** Some error ocurred while merging annotated SAM and BED file")
         exit()
 
@@ -235,8 +266,8 @@ def bam2pilfer(bam_file, out_folder, name, annot_info, ncpu, Debug):
 
     bedtools_exe = set_config.get_exe("bedtools", Debug)
     cmd_bedtools = "%s sort -chrThenSizeA -i %s | sort -k 4 | %s groupby -o count -g 1,2,3,4,5 -c 4 | awk -v \"OFS=\t\" \'{print $1, $2, $3, $4, $6, $5}\' > %s " %(bedtools_exe, pilfer_tmp, bedtools_exe,  pilfer_file)
-    bed_code = HCGB_sys.system_call(cmd_bedtools, False, True)
-    if not bed_code:
+    bed_code = instrument.system_call(cmd_bedtools, False, True, step='bedtools', sample=name)
+    if not step_cache.succeeded(bed_code):
         print("** Some error occurred while generating PILFER input file")
         exit()
 
@@ -244,7 +275,149 @@ def bam2pilfer(bam_file, out_folder, name, annot_info, ncpu, Debug):
     #os.remove(pilfer_tmp)
     #os.remove(sam_file_out)
 
-    HCGB_time.print_time_stamp(filename_stamp)
+    step_cache.save_step(filename_stamp, key)
+    return(pilfer_file)
+
+################################
+def ncRNA_index(ncRNA_bed):
+    """
+    Reads ncRNA annotation in BED format and indexes intervals by chromosome.
+    
+    :param ncRNA_bed: Absolute path to ncRNA BED file (merged ncRNA from database).
+    
+    :returns: Dictionary with chromosome as key and list of (start, end, strand) sorted by start as value.
+    """
+    ncRNA_dict = defaultdict(list)
+    for line in open(ncRNA_bed):
+        line = line.rstrip().split("\t")
+        if len(line) < 3:
+            continue
+        
+        strand = line[5] if len(line) > 5 else '.'
+        ncRNA_dict[line[0]].append((int(line[1]), int(line[2]), strand))
+    
+    for chrom in ncRNA_dict:
+        ncRNA_dict[chrom].sort()
+    
+    return (ncRNA_dict)
+
+################################
+def subtract_reads(bam_file, ncRNA_dict, ncpu, Debug):
+    """
+    Gets reads that do not overlap ncRNA annotation.
+    
+    Same rule as bedtools subtract -s -f 0.5 -A: an alignment is discarded if at 
+    least 50% of it overlaps an ncRNA feature in the same strand. Coordinates are 
+    swept along the BAM file, so it must be sorted by coordinate.
+    
+    :param bam_file: Absolute path to BAM file sorted by coordinate.
+    :param ncRNA_dict: Dictionary generated by :func:`ncRNA_index`.
+    :param ncpu: Number of threads for BAM decompression.
+    :param Debug: True/False for debugging messages.
+    
+    :returns: Set of read names retained.
+    """
+    reads_retained = set()
+    chrom = None
+    
+    with pysam.AlignmentFile(bam_file, "rb", threads=ncpu) as bam_hd:
+        for aln in bam_hd.fetch(until_eof=True):
+            if aln.is_unmapped:
+                continue
+            
+            ## new chromosome: reset ncRNA features
+            if aln.reference_name != chrom:
+                chrom = aln.reference_name
+                features = ncRNA_dict.get(chrom, [])
+                pos = 0
+                active = []
+            
+            start = aln.reference_start
+            end = aln.reference_end
+            strand = '-' if aln.is_reverse else '+'
+            
+            ## add features starting before alignment end and 
+            ## discard features ending before alignment start
+            while pos < len(features) and features[pos][0] < end:
+                active.append(features[pos])
+                pos += 1
+            active = [feat for feat in active if feat[1] > start]
+            
+            ## check overlap
+            min_overlap = 0.5 * (end - start)
+            overlap_ncRNA = False
+            for feat in active:
+                if feat[2] == strand and (min(end, feat[1]) - max(start, feat[0])) >= min_overlap:
+                    overlap_ncRNA = True
+                    break
+            
+            if not overlap_ncRNA:
+                reads_retained.add(aln.query_name)
+    
+    if Debug:
+        HCGB_aes.debug_message("reads_retained: " + str(len(reads_retained)), "yellow")
+    
+    return (reads_retained)
+
+################################
+def bam2pilfer_stream(bam_file, out_folder, name, annot_info, ncpu, Debug):
+    """
+    Converts BAM file into PILFER input file without intermediate files.
+    
+    Reads not overlapping ncRNA are retained (see :func:`subtract_reads`) and all 
+    their alignments are annotated using gold piRNA information, collapsed and 
+    counted into the PILFER BED format file: chr, start, end, seq::PI/PU, count, strand.
+    
+    :param bam_file: Absolute path to BAM file sorted by coordinate.
+    :param out_folder: Absolute path to store results.
+    :param name: Sample name.
+    :param annot_info: Dictionary generated by :func:`XICRA.modules.database.piRNA_info`.
+    :param ncpu: Number of threads for BAM decompression.
+    :param Debug: True/False for debugging messages.
+    
+    :returns: PILFER BED format file.
+    """
+    out_folder = os.path.abspath(out_folder)
+    pilfer_tmp = os.path.join(out_folder, name + ".pilfer.bed.tmp")
+    pilfer_file = os.path.join(out_folder, name + ".pilfer.bed")
+    
+    print("+ Convert BAM to PILFER input file")
+    
+    ## get gold piRNA sequences
+    seq_id = database.piRNA_gold_index(annot_info['piRBase']['gold_piRNA'], Debug)
+    
+    ## substract ncRNA included (no piRNA)
+    print("\t- Subtract ncRNA annotated reads from BAM to reduce processing...")
+    ncRNA_dict = ncRNA_index(annot_info['general']['ncRNA'])
+    reads_retained = subtract_reads(bam_file, ncRNA_dict, ncpu, Debug)
+    del ncRNA_dict
+    
+    ## Annotate reads using gold piRNA and count alignments
+    print("\t- Annotate reads in BAM using gold piRNA information provided...")
+    pilfer_counts = defaultdict(int)
+    with pysam.AlignmentFile(bam_file, "rb", threads=ncpu) as bam_hd:
+        for aln in bam_hd.fetch(until_eof=True):
+            if aln.is_unmapped or aln.query_name not in reads_retained:
+                continue
+            
+            seq = aln.query_sequence or '*'
+            tag = pilfer_caller.piRNA_tag(seq, aln.is_reverse, seq_id)
+            if not tag:
+                continue
+            
+            strand = '-' if aln.is_reverse else '+'
+            pilfer_counts[(aln.reference_name, str(aln.reference_start), 
+                           str(aln.reference_end), seq + '::' + tag, strand)] += 1
+    
+    del reads_retained
+    
+    ## create bed file summarized
+    print("\t- Create PILFER format file...")
+    with open(pilfer_tmp, 'w') as pilfer_hd:
+        for key in sorted(pilfer_counts, key=lambda x: (x[3], x[4], x)):
+            pilfer_hd.write("\t".join([key[0], key[1], key[2], key[3], str(pilfer_counts[key]), key[4]]) + "\n")
+    
+    os.rename(pilfer_tmp, pilfer_file)
     return(pilfer_file)
 
 ################################
@@ -19,6 +19,7 @@ from termcolor import colored
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument, scatter
 from XICRA.modules import database
 import HCGB.functions.aesthetics_functions as HCGB_aes
 
@@ -33,9 +34,10 @@ def download_MINTmap_db(database_folder, tRNA_db, debug):
 
 ############################
 def MINTmap_caller(MINTmap_folder, reads, name, num_threads, species, database, Debug):
-    # check if previously generated and succeeded
+    # check if previously generated and succeeded with same reads and options
     filename_stamp = MINTmap_folder + '/.success_all'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key(reads, [species, database], 'MINTmap', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'MINTmap'), 'yellow'))
         return True
@@ -44,7 +46,7 @@ def MINTmap_caller(MINTmap_folder, reads, name, num_threads, species, database,
         # Call MINTMap_analysis
         code_returned = MINTMap_analysis(MINTmap_folder, reads, name, num_threads, species, database, Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
             return True
         else:
             print ('** Sample %s failed...' %name)
@@ -66,28 +68,24 @@ def MINTMap_analysis(path_folder, reads, name, num_threads, species, database, D
         HCGB_aes.debug_message("species: " + species, "yellow")
         HCGB_aes.debug_message("species_code: " + species_code, "yellow")
     
-    ## ATTENTION: MINTmap needs to chdir to output folder
-    path_here = os.getcwd()
-    
-    ## debug messages 
-    if Debug:    
-        HCGB_aes.debug_message("path_here: " + path_here, "yellow")
-            
     filename_stamp = path_folder + '/.success_mintmap'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key(reads, [species, database], 'MINTmap')
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'MINTmap call'), 'yellow'))
     else:
-        # Call MINTMap_analysis
-        codeReturn = MINTmap(reads, path_folder, name, num_threads, species_code, database, Debug)
-        os.chdir(path_here)
+        # Call MINTMap_analysis: split into shards if several threads
+        codeReturn = scatter.scatter_gather(reads, path_folder, name, num_threads, 
+                                            lambda shard_input, shard_folder: MINTmap(shard_input, shard_folder, name, 1, species_code, database, Debug),
+                                            lambda shard_folders, offsets, shard_reads: merge_shards(shard_folders, shard_reads, path_folder, Debug), 
+                                            'fastq', Debug)
         
         if not codeReturn:
             print ('** Sample %s failed...' %name)
             return False
 
         ## create time stamp        
-        functions.time_functions.print_time_stamp(filename_stamp)
+        step_cache.save_step(filename_stamp, key)
 
     ## Get MINTmap matrix
     MINTmap_matrix_folder = functions.files_functions.create_subfolder("mintmap_parse", path_folder)
@@ -183,15 +181,92 @@ def parse_tRF(pathFile, sample_name, matrix_folder, ident, Debug):
 
         return(tsv_file)
 
+##############
+def merge_shards(shard_folders, shard_reads, outpath, Debug):
+    """Merges MINTmap expression tables (exclusive and ambiguous tRFs) of the shards of a sample.
+
+    Unnormalized counts are kept and RPM values are calculated again for the whole sample: 
+    using reads in the table and using reads of the sample (sum of reads of the shards). 
+    Tables are only merged if RPM values of every shard are obtained from the reads of the 
+    shard and headers of the shards are identical, so merged tables are the same as for an 
+    unsharded run. Rows are sorted by counts. Other outputs (html, countsmeta) are not 
+    generated for samples split into shards.
+
+    :param shard_folders: output folder of each shard
+    :param shard_reads: number of reads of each shard
+    :param outpath: output folder
+    :param Debug: display complete log.
+
+    :returns: True/False
+    """
+    outputs = [f for f in os.listdir(shard_folders[0]) if f.endswith('expression.txt')]
+    if not outputs:
+        return (False)
+    
+    ## read tables of each shard
+    tables = {}
+    for output in outputs:
+        headers, rows = [], []
+        for shard_number, shard_folder in enumerate(shard_folders):
+            shard_file = os.path.join(shard_folder, output)
+            if not os.path.isfile(shard_file):
+                return (False)
+            header, shard_rows = [], []
+            with open(shard_file) as shard_hd:
+                for line in shard_hd:
+                    if line.startswith('#') or line.startswith('License Plate'):
+                        header.append(line)
+                        continue
+                    fields = line.rstrip('\n').split('\t')
+                    if len(fields) < 6:
+                        continue
+                    shard_rows.append(fields)
+            
+            ## RPM values of the shard: using reads in the table and reads of the shard
+            table_reads = sum(int(fields[3]) for fields in shard_rows)
+            for fields in shard_rows:
+                if (fields[4] != "%.2f" %(int(fields[3]) * 1e6 / table_reads) or
+                    fields[5] != "%.2f" %(int(fields[3]) * 1e6 / shard_reads[shard_number])):
+                    if Debug:
+                        HCGB_aes.debug_message("MINTmap shards: RPM values not obtained from reads of the shard: " + "\t".join(fields), "yellow")
+                    return (False)
+            headers.append(header)
+            rows.extend(shard_rows)
+        
+        if any(header != headers[0] for header in headers):
+            if Debug:
+                HCGB_aes.debug_message("MINTmap shards: different headers for " + output, "yellow")
+            return (False)
+        tables[output] = (headers[0], rows)
+    
+    ## reads of the sample
+    sample_reads = sum(shard_reads)
+    if Debug:
+        HCGB_aes.debug_message("MINTmap shards: reads of the sample: %s" %sample_reads, "yellow")
+    
+    for output, (header, rows) in tables.items():
+        table_reads = sum(int(fields[3]) for fields in rows)
+        rows.sort(key=lambda fields: (-int(fields[3]), fields[0]))
+        with open(os.path.join(outpath, output), 'w') as out_hd:
+            out_hd.writelines(header)
+            for fields in rows:
+                fields[4] = "%.2f" %(int(fields[3]) * 1e6 / table_reads)
+                fields[5] = "%.2f" %(int(fields[3]) * 1e6 / sample_reads)
+                out_hd.write('\t'.join(fields) + '\n')
+    
+    ## logs
+    shard_logs = [os.path.join(shard_folder, 'MINTmap.log') for shard_folder in shard_folders]
+    if all(os.path.isfile(f) for f in shard_logs):
+        scatter.merge_text(shard_logs, os.path.join(outpath, 'MINTmap.log'))
+    
+    return (True)
+
 ##############
 def MINTmap(reads, outpath, name, num_threads, species_code, database, Debug):
     
     outpath = os.path.abspath(outpath)
     functions.files_functions.create_folder(outpath)
     
-    ## change path where the results are required
-    os.chdir(outpath)
-    
     mintmap_exe = set_config.get_exe("MINTmap", Debug=Debug)
     logfile = os.path.join(outpath, 'MINTmap.log')
     
@@ -205,13 +280,17 @@ def MINTmap(reads, outpath, name, num_threads, species_code, database, Debug):
     ## TODO
     ## use -m option with database provided
     
+    ## ATTENTION: MINTmap creates results in the current directory: 
+    ## change directory only for the command, as samples are analyzed at the same time
+    reads_file = os.path.abspath(reads[0])
+    
     ## species bundle
     if species_code == "default": 
         ## create command: use default mapping bundle provided with MINTmap 
-        cmd = '%s -p %s %s 2> %s' %(mintmap_exe, name, reads[0], logfile)
+        cmd = 'cd %s && %s -p %s %s 2> %s' %(outpath, mintmap_exe, name, reads_file, logfile)
     else:
         ## create command: use specific mapping bundle path 
-        cmd = '%s -p %s -m %s %s 2> %s' %(mintmap_exe, name, species_code, reads[0], logfile)
+        cmd = 'cd %s && %s -p %s -m %s %s 2> %s' %(outpath, mintmap_exe, name, species_code, reads_file, logfile)
     
-    return(functions.system_call_functions.system_call(cmd))
+    return(instrument.system_call(cmd, step='MINTmap', sample=name))
  
\ No newline at end of file
@@ -16,9 +16,10 @@ import concurrent.futures
 
 ## import my modules
 from XICRA.config import set_config
+from XICRA.other_tools import scheduler, step_cache, instrument
 
 ## import HCGB
-from HCGB.functions import system_call_functions, main_functions, time_functions
+from HCGB.functions import main_functions, time_functions
 from HCGB.functions import files_functions, math_functions
 
 ## plots
@@ -46,15 +47,17 @@ def biotype_all(featureCount_exe, path, gtf_file, bam_file, name, threads, Debug
 	out_file = os.path.join(path, 'featureCount.out')
 	logfile = os.path.join(path, name + '_RNAbiotype.log')
 
+	## featureCounts and parsing done with same BAM, annotation and options
+	key = step_cache.step_key([bam_file, gtf_file], [allow_multimap, stranded], 'featureCounts', Debug)
 	filename_stamp_all = path + '/.success_all'
-	if os.path.isfile(filename_stamp_all):
+	if step_cache.previous_results(filename_stamp_all, key):
 		stamp = time_functions.read_time_stamp(filename_stamp_all)
 		print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'RNAbiotype'), 'yellow'))
 		return()
 
 	else:
 		filename_stamp_featureCounts = path + '/.success_featureCounts'
-		if os.path.isfile(filename_stamp_featureCounts):
+		if step_cache.previous_results(filename_stamp_featureCounts, key):
 			stamp = time_functions.read_time_stamp(filename_stamp_featureCounts)
 			print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'featureCounts'), 'yellow'))
 		else:
@@ -79,16 +82,17 @@ def biotype_all(featureCount_exe, path, gtf_file, bam_file, name, threads, Debug
 				
 				
 			## system call
-			cmd_featureCount_code = system_call_functions.system_call(cmd_featureCount, False, True)
-			if not cmd_featureCount_code:
+			cmd_featureCount_code = instrument.system_call(cmd_featureCount, False, True, step='featureCounts', sample=name)
+			if not step_cache.succeeded(cmd_featureCount_code):
 				print("** ERROR: featureCount failed for sample " + name)
 				exit()
 				
 			## print time stamp
-			time_functions.print_time_stamp(filename_stamp_featureCounts)
+			step_cache.save_step(filename_stamp_featureCounts, key)
 		
 		## parse results
 		(extended_Stats_file, RNAbiotypes_stats_file) = parse_featureCount(out_file, path, name, bam_file, Debug)
+		step_cache.save_step(filename_stamp_all, key)
 		
 		## debugging messages
 		if Debug:
@@ -118,7 +122,8 @@ def parse_featureCount(out_file, path, name, bam_file, Debug):
 
 	##
 	filename_stamp_parse = path + '/.success_parse'
-	if os.path.isfile(filename_stamp_parse):
+	key = step_cache.step_key([out_file, out_file + '.summary'])
+	if step_cache.previous_results(filename_stamp_parse, key):
 		stamp = time_functions.read_time_stamp(filename_stamp_parse)
 		print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'parse results'), 'yellow'))
 	else:
@@ -296,27 +301,29 @@ def parse_featureCount(out_file, path, name, bam_file, Debug):
 		mapping_stats_file.close()
 		count_file.close()
 		## print timestamp
-		time_functions.print_time_stamp(filename_stamp_parse)
+		step_cache.save_step(filename_stamp_parse, key)
 
 	return(out_tsv_file_name, RNA_biotypes_file_name)
 
 #######################################################################
-def RNAbiotype_module_call(samples_dict, output_dict, gtf_file, Debug, max_workers_int, threads_job, multimapping, stranded):
+def RNAbiotype_module_call(samples_dict, output_dict, gtf_file, Debug, threads, threads_job, multimapping, stranded, info_dir=None):
 	"""
 	Create RNAbiotype analysis for each sample and create summary plots
 	
 	:param samples_dict: Dictionary containing sample IDs as keys and bam files as values
 	:param output_dict: Dictionary containing sample IDs as keys and output folder as values
 	:param gtf_file: Gene annotation file for the reference genome used.
-	:param threads: Number of threads to use.
 	:param Debug: True/False for debugging messages
+	:param threads: Number of threads to use in total.
+	:param threads_job: Number of threads to use for each sample.
+	:param info_dir: Folder to save/read RAM estimates for featureCounts (see :class:`XICRA.other_tools.scheduler.ResourceScheduler`)
 	"""
 	
 	## get bin
 	featureCount_exe = set_config.get_exe('featureCounts')
 
-	## send for each sample
-	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers_int) as executor:
+	## send for each sample when CPUs and RAM are available
+	with scheduler.ResourceScheduler(threads, threads_job, step="featureCounts", info_dir=info_dir, Debug=Debug) as executor:
 		commandsSent = { executor.submit(biotype_all, featureCount_exe, 
 										output_dict[sample], gtf_file, bam_files, 
 										sample, threads_job, Debug, multimapping, stranded): sample for sample, bam_files in samples_dict.items() }
@@ -369,7 +376,8 @@ def pie_plot_results(RNAbiotypes_stats_file, name, folder, Debug):
 	
 	##
 	filename_stamp_plot = folder + '/.success_plot'
-	if os.path.isfile(filename_stamp_plot):
+	key = step_cache.step_key([RNAbiotypes_stats_file])
+	if step_cache.previous_results(filename_stamp_plot, key):
 		stamp = time_functions.read_time_stamp(filename_stamp_plot)
 		print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'plot results'), 'yellow'))
 	else:
@@ -429,10 +437,8 @@ def pie_plot_results(RNAbiotypes_stats_file, name, folder, Debug):
 		plt.close(name_figure)
 		plt.close()
 		
-		## print time stamps
-		time_functions.print_time_stamp(filename_stamp_plot)
-		filename_stamp_all = folder + '/.success_all'
-		time_functions.print_time_stamp(filename_stamp_all)
+		## print time stamp
+		step_cache.save_step(filename_stamp_plot, key)
 		
 #######################################################################
 def main():
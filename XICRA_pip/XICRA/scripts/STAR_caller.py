@@ -12,9 +12,12 @@ import sys
 from sys import argv
 import subprocess
 import traceback
+import signal
+import threading
+import contextlib
 
-from HCGB.functions import system_call_functions
 from HCGB.functions import files_functions
+from XICRA.other_tools import instrument, intermediate
 
 ############################################################
 def create_genomeDir(folder, STAR_exe, num_threads, fasta_file, limitGenomeGenerateRAM):
@@ -41,7 +44,7 @@ def create_genomeDir(folder, STAR_exe, num_threads, fasta_file, limitGenomeGener
         STAR_exe, limitGenomeGenerateRAM, num_threads, genomeDir, fasta_file)
 
     print ('\t+ genomeDir generation for STAR mapping')
-    create_code = system_call_functions.system_call(cmd_create, False, True)
+    create_code = instrument.system_call(cmd_create, False, True, step='STAR')
     
     if not create_code:
         print ("** ERROR: Some error occurred during genomeDir creation... **")
@@ -68,10 +71,10 @@ def load_Genome(folder, STAR_exe, genomeDir, num_threads):
     ## --genomeLoad LoadAndExit
     Load_folder = files_functions.create_subfolder('LoadMem', folder)
     cmd_LD = "%s --genomeDir %s --runThreadN %s --outFileNamePrefix %s --genomeLoad LoadAndExit" %(
-        STAR_exe, genomeDir, num_threads, Load_folder)
+        STAR_exe, genomeDir, num_threads, Load_folder + '/')
     
     print ('\t+ Loading memory for STAR mapping')
-    load_code = system_call_functions.system_call(cmd_LD, False, True)
+    load_code = instrument.system_call(cmd_LD, False, True, step='STAR')
     return (load_code)
 
 ############################################################
@@ -93,13 +96,109 @@ def remove_Genome(STAR_exe, genomeDir, folder, num_threads):
     ## --genomeLoad Remove
     remove_folder = files_functions.create_subfolder('RemoveMem', folder)
     cmd_RM = "%s --genomeDir %s --outFileNamePrefix %s --runThreadN %s --genomeLoad Remove" %(
-        STAR_exe, genomeDir, remove_folder, num_threads)
+        STAR_exe, genomeDir, remove_folder + '/', num_threads)
     
     ## send command    
     print ('\t+ Removing memory loaded for STAR mapping')
-    remove_code = system_call_functions.system_call(cmd_RM, False, True)
+    remove_code = instrument.system_call(cmd_RM, False, True, step='STAR')
     return (remove_code)
 
+############################################################
+def genome_size(genomeDir):
+    """Size of the genome index loaded in memory by STAR 
+    
+    :param genomeDir: path to the genome directory
+    :type genomeDir: string
+
+    :returns: size in bytes of Genome, SA and SAindex files
+    """
+    size = 0
+    for index_file in ("Genome", "SA", "SAindex"):
+        index_file = os.path.join(genomeDir, index_file)
+        if os.path.isfile(index_file):
+            size += os.path.getsize(index_file)
+    return (size)
+
+############################################################
+def _exit_on_sigterm(signum, frame):
+    ## raise SystemExit so that shared_genome removes the genome from memory
+    sys.exit(128 + signum)
+
+############################################################
+@contextlib.contextmanager
+def shared_genome(folder, STAR_exe, genomeDir, num_threads):
+    """Keeps the genome loaded in shared memory while mapping several samples
+
+    Removes any copy of the genome left in memory by previous calls, loads the genome 
+    once (LoadAndExit) and yields whether it was loaded. Samples can be mapped using 
+    :func:`XICRA.scripts.STAR_caller.mapReads` with LoadAndKeep option. 
+    
+    The genome is removed from memory when leaving the context, including errors, 
+    exit calls and SIGTERM signals (if called from the main thread).
+    
+    If the genome could not be loaded, samples must be mapped using NoSharedMemory.
+    
+    :param folder: folder where the genome will be loaded
+    :param STAR_exe: Executable path for STAR binary
+    :param genomeDir: path to the genome directory
+    :param num_threads: number of threads to do the computation
+
+    :type folder: string
+    :type STAR_exe: string
+    :type genomeDir: string
+    :type num_threads: int 
+
+    :returns: True if genome loaded in shared memory
+    """
+    ## remove previous reference genome from memory
+    print ('\t+ Remove genome in memory from previous call... (if any)')
+    remove_Genome(STAR_exe, genomeDir, folder, num_threads)
+    
+    ## load reference genome
+    load_code = load_Genome(folder, STAR_exe, genomeDir, num_threads)
+    loaded = load_code not in (False, 'FAIL')
+    if not loaded:
+        print ("** WARNING: Genome could not be loaded in shared memory. Each sample will load its own copy... **")
+    
+    ## SIGTERM: exit through finally clause
+    previous_handler = None
+    if loaded and threading.current_thread() is threading.main_thread():
+        previous_handler = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    
+    try:
+        yield (loaded)
+    finally:
+        if loaded:
+            remove_Genome(STAR_exe, genomeDir, folder, num_threads)
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+############################################################
+def mapping_RAM(genomeDir, limitRAM_option, shared, free_RAM):
+    """RAM required by each STAR mapping job and RAM available for all jobs
+    
+    Each job requires limitRAM_option bytes for BAM sorting and, if genome is not 
+    shared, its own copy of the genome index. If shared, the genome index is 
+    loaded once and it is not available for the jobs.
+    
+    :param genomeDir: path to the genome directory
+    :param limitRAM_option: maximum RAM (bytes) for BAM sorting for each job
+    :param shared: genome loaded in shared memory
+    :param free_RAM: memory (bytes) available before loading the genome
+
+    :type genomeDir: string
+    :type limitRAM_option: int
+    :type shared: bool
+    :type free_RAM: int
+
+    :returns: RAM (bytes) for each job and RAM (bytes) available
+    """
+    index_size = genome_size(genomeDir)
+    if shared:
+        return (int(limitRAM_option), max(0, free_RAM - index_size))
+    
+    return (int(limitRAM_option) + index_size, free_RAM)
+
 ############################################################
 def mapReads(option, reads, folder, name, STAR_exe, genomeDir, limitRAM_option, num_threads, Debug, multimapping):
     """
@@ -161,8 +260,11 @@ def mapReads(option, reads, folder, name, STAR_exe, genomeDir, limitRAM_option,
     else:
         cmd = cmd + "--genomeLoad NoSharedMemory"
     
-    ## ReadFiles
+    ## ReadFiles: compressed reads (e.g. intermediate files) streamed
     cmd = cmd + " --readFilesIn %s " %jread
+    read_cmd = intermediate.decompress_cmd(reads[0])
+    if read_cmd:
+        cmd = cmd + "--readFilesCommand %s " %read_cmd
 
     ## logfile & errfile
     logfile = os.path.join(folder, 'STAR.log')
@@ -170,7 +272,7 @@ def mapReads(option, reads, folder, name, STAR_exe, genomeDir, limitRAM_option,
     cmd = cmd + ' > ' + logfile + ' 2> ' + errfile
     
     ## sent command
-    mapping_code = system_call_functions.system_call(cmd, False, True)
+    mapping_code = instrument.system_call(cmd, False, True, step='STAR', sample=name)
     return (mapping_code)
 
 ###############
@@ -1,9 +1,15 @@
+import importlib
+
 __all__ = [
     'BAMtoPILFER',
     'bedtools_caller',
+    'collapse_reads',
     'cutadapt_caller',
+    'expression_store',
     'fastqc_caller',
     'generate_DE',
+    'isomir_converter',
+    'join_reads',
     'miraligner_caller',
     'MINTMap_caller',
     'multiQC_report',
@@ -12,7 +18,12 @@ __all__ = [
     'pilfer_caller',
     'RNAbiotype',
     'STAR_caller',
-    'samtools_caller'
+    'samtools_caller',
+    'srna_qc'
 ]
 
-from XICRA.scripts import *
+def __getattr__(name):
+	## import submodules only when requested
+	if name in __all__:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError("module %r has no attribute %r" %(__name__, name))
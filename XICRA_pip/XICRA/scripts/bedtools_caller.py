@@ -15,9 +15,9 @@ import argparse
 from termcolor import colored
 
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument
 import HCGB.functions.aesthetics_functions as HCGB_aes
 import HCGB.functions.files_functions as HCGB_files
-import HCGB.functions.system_call_functions as HCGB_sys
 import HCGB.functions.time_functions as HCGB_time
 
 #import pybedtools
@@ -34,7 +34,8 @@ def subtract_coordinates(file1, file2, path_given, name, options, debug):
     
     ## check if previously done
     filename_stamp = path_given + '/.' + name + '_subtract_success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key([file1, file2], [options], 'bedtools')
+    if step_cache.previous_results(filename_stamp, key):
         if HCGB_files.is_non_zero_file(bed_file):
             stamp = HCGB_time.read_time_stamp(filename_stamp)
             print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'subtract bed annotations'), 'yellow'))
@@ -49,13 +50,13 @@ def subtract_coordinates(file1, file2, path_given, name, options, debug):
     bedtools_exe = set_config.get_exe("bedtools", debug)
     cmd_bedtools = "%s subtract -a %s -b %s %s > %s" %(bedtools_exe, file1, file2, string_options, bed_file) 
     
-    bed_code = HCGB_sys.system_call(cmd_bedtools, False, True)
-    if not bed_code:
+    bed_code = instrument.system_call(cmd_bedtools, False, True, step='bedtools', sample=name)
+    if not step_cache.succeeded(bed_code):
         print(colored("** ERROR: Something happen while calling bedtools subtract for job: " + name, "red"))
         exit()
         
     ## print time stamp
-    HCGB_time.print_time_stamp(filename_stamp)
+    step_cache.save_step(filename_stamp, key)
 
     return (bed_file)    
 
@@ -71,7 +72,8 @@ def intersect_coordinates(file1, file2, path_given, name, options, debug):
     
     ## check if previously done
     filename_stamp = path_given + '/.' + name + '_intersect_success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key([file1, file2], [options], 'bedtools')
+    if step_cache.previous_results(filename_stamp, key):
         if HCGB_files.is_non_zero_file(bed_file):
             stamp = HCGB_time.read_time_stamp(filename_stamp)
             print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'intersect bed annotations'), 'yellow'))
@@ -86,14 +88,14 @@ def intersect_coordinates(file1, file2, path_given, name, options, debug):
     bedtools_exe = set_config.get_exe("bedtools", debug)
     cmd_bedtools = "%s intersect -a %s -b %s %s > %s" %(bedtools_exe, file1, file2, string_options, bed_file) 
     
-    bed_code = HCGB_sys.system_call(cmd_bedtools, False, True)
+    bed_code = instrument.system_call(cmd_bedtools, False, True, step='bedtools', sample=name)
 
-    if not bed_code:
+    if not step_cache.succeeded(bed_code):
         print(colored("** ERROR: Something happen while calling bedtools intersect for job: " + name, "red"))
         exit()
         
     ## print time stamp
-    HCGB_time.print_time_stamp(filename_stamp)
+    step_cache.save_step(filename_stamp, key)
 
     return (bed_file)    
 
@@ -108,8 +110,9 @@ def convert_bam2bed(sample, bam_file, path_given, pilfer=False, debug=False):
     bed_file = os.path.join(os.path.abspath(path_given), sample + ".bed") ## create a name
     bed_file_tmp = bed_file + '_tmp' 
     
-    filename_stamp = path_given + '/.convert_bam2bed_success'
-    if os.path.isfile(filename_stamp):
+    filename_stamp = path_given + '/.' + sample + '_convert_bam2bed_success'
+    key = step_cache.step_key([bam_file], [pilfer], 'bedtools')
+    if step_cache.previous_results(filename_stamp, key):
         if HCGB_files.is_non_zero_file(bed_file):
             stamp = HCGB_time.read_time_stamp(filename_stamp)
             print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, sample, 'convert_bam2bed'), 'yellow'))
@@ -124,11 +127,11 @@ def convert_bam2bed(sample, bam_file, path_given, pilfer=False, debug=False):
         ## Create call in two separate calls to reduce RAM requirement
         bedtools_exe = set_config.get_exe("bedtools", debug)
         cmd_bedtools = "%s bamtobed -i %s > %s" %(bedtools_exe, bam_file, bed_file)
-        bed_code = HCGB_sys.system_call(cmd_bedtools, False, True)
+        bed_code = instrument.system_call(cmd_bedtools, False, True, step='bedtools', sample=sample)
     
-        if bed_code:
+        if step_cache.succeeded(bed_code):
             ## print time stamp
-            HCGB_time.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
         
             return (bed_file)
         else:
@@ -138,12 +141,12 @@ def convert_bam2bed(sample, bam_file, path_given, pilfer=False, debug=False):
         ## Create call in two separate calls to reduce RAM requirement
         bedtools_exe = set_config.get_exe("bedtools", debug)
         cmd_bedtools = "%s bamtobed -i %s | %s groupby -o count -g 1,2,3 -c 4 > %s" %(bedtools_exe, bam_file, bedtools_exe, bed_file_tmp)
-        bed_code = HCGB_sys.system_call(cmd_bedtools, False, True)
+        bed_code = instrument.system_call(cmd_bedtools, False, True, step='bedtools', sample=sample)
     
-        if bed_code:
+        if step_cache.succeeded(bed_code):
             cmd_bedtools2 = "%s sort -chrThenSizeA -i %s | %s groupby -o count -g 1,2,3 -c 4 > %s" %(bedtools_exe, bed_file_tmp, 
                                                                                                                     bedtools_exe, bed_file)
-            bed_code2 = HCGB_sys.system_call(cmd_bedtools2, False, True)
+            bed_code2 = instrument.system_call(cmd_bedtools2, False, True, step='bedtools', sample=sample)
         
         ## -----------------------------------------------
         ## Pybedtools
@@ -153,12 +156,12 @@ def convert_bam2bed(sample, bam_file, path_given, pilfer=False, debug=False):
         
         ## We might try but I guess to many RAM would be required.
         
-        if not bed_code or not bed_code2:
+        if not step_cache.succeeded(bed_code) or not step_cache.succeeded(bed_code2):
             print ("** ERROR: Some error occurred during conversion from BAM to BED... **")
             exit()
     
     ## print time stamp
-    HCGB_time.print_time_stamp(filename_stamp)
+    step_cache.save_step(filename_stamp, key)
 
     ## remove tmp files
     os.remove(bed_file_tmp)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez, Marta Lopez & Lauro Sumoy           ##
+## Copyright (C) 2019-2021 Lauro Sumoy Lab, IGTP, Spain ##
+##########################################################
+'''
+Collapses reads of a sample into unique sequences and counts.
+
+The collapsed file (``sequence<tab>count``, sorted by sequence) is generated once for each
+sample and shared by the miRNA quantifiers that accept it (sRNAbench, miraligner).
+'''
+## useful imports
+import os
+import heapq
+import tempfile
+from termcolor import colored
+
+## import my modules
+from HCGB import functions
+from XICRA.other_tools import step_cache, intermediate
+
+## maximum number of unique sequences kept in memory before sorting
+## and saving them into a temporary file
+max_unique_memory = 2000000
+
+###############
+def _save_chunk(freq_seqs, tmp_dir):
+    ## save sorted counts into a temporary file and return its name
+    (fd, chunk_file) = tempfile.mkstemp(suffix='.rc', dir=tmp_dir)
+    with os.fdopen(fd, 'w') as chunk_hd:
+        for seq in sorted(freq_seqs):
+            chunk_hd.write("%s\t%s\n" %(seq, freq_seqs[seq]))
+    return (chunk_file)
+
+def _read_chunk(chunk_file):
+    ## yields (sequence, count) of a temporary file
+    with open(chunk_file) as chunk_hd:
+        for line in chunk_hd:
+            (seq, count) = line.rstrip('\n').split('\t')
+            yield (seq, int(count))
+
+###############
+class Collapser():
+    """Counts unique sequences of a stream of reads.
+
+    Sequences are counted in memory up to ``max_unique_memory`` unique sequences.
+    Beyond that, counts are saved into sorted temporary files that are finally merged,
+    so memory is bounded regardless of the library size.
+
+    :param tmp_dir: folder for temporary files
+    """
+    def __init__(self, tmp_dir):
+        self.tmp_dir = tmp_dir
+        self.freq_seqs = {}
+        self.chunk_files = []
+        self.total_reads = 0
+
+    def add(self, seqs):
+        """Counts the sequences given."""
+        freq_seqs = self.freq_seqs
+        for seq in seqs:
+            freq_seqs[seq] = freq_seqs.get(seq, 0) + 1
+            self.total_reads += 1
+            if len(freq_seqs) >= max_unique_memory:
+                self.chunk_files.append(_save_chunk(freq_seqs, self.tmp_dir))
+                freq_seqs = self.freq_seqs = {}
+
+    def add_fastq(self, fastq_text):
+        """Counts the sequences of fastq records (text)."""
+        self.add(fastq_text.split('\n')[1::4])
+
+    def items(self):
+        """Yields (sequence, count) sorted by sequence, merging temporary files, if any."""
+        streams = [_read_chunk(f) for f in self.chunk_files]
+        streams.append(((seq, self.freq_seqs[seq]) for seq in sorted(self.freq_seqs)))
+
+        previous_seq, previous_count = None, 0
+        for seq, count in heapq.merge(*streams):
+            if seq == previous_seq:
+                previous_count += count
+                continue
+            if previous_seq is not None:
+                yield (previous_seq, previous_count)
+            previous_seq, previous_count = seq, count
+        if previous_seq is not None:
+            yield (previous_seq, previous_count)
+
+    def clear(self):
+        """Removes counts and temporary files."""
+        for chunk_file in self.chunk_files:
+            os.remove(chunk_file)
+        self.freq_seqs = {}
+        self.chunk_files = []
+
+    def save(self, out_file):
+        """Saves counts sorted by sequence (sequence<tab>count). Returns number of unique sequences."""
+        unique_seqs = 0
+        with open(out_file + '.tmp', 'w') as out_hd:
+            for seq, count in self.items():
+                out_hd.write("%s\t%s\n" %(seq, count))
+                unique_seqs += 1
+        os.replace(out_file + '.tmp', out_file)
+
+        self.clear()
+        return (unique_seqs)
+
+def collapse_reads(fastq_file, out_file, threads=1, Debug=False):
+    """Collapses reads of a fastq file into unique sequences and counts (see :class:`Collapser`).
+
+    :param fastq_file: fastq file (plain, gzip or zstd compressed) or text stream of reads
+    :param out_file: tabular file to create (sequence<tab>count)
+    :param threads: threads available to decompress
+    :param Debug: display complete log.
+
+    :returns: Tuple with number of reads and unique sequences.
+    """
+    collapser = Collapser(os.path.dirname(os.path.abspath(out_file)))
+
+    ## sequence: second line of each record
+    reads_hd = intermediate.open_reads(fastq_file, threads) if isinstance(fastq_file, str) else fastq_file
+    try:
+        collapser.add(line.rstrip() for line_number, line in enumerate(reads_hd) if line_number % 4 == 1)
+    finally:
+        reads_hd.close()
+
+    if (Debug):
+        print (colored("**DEBUG: collapse_reads: %s temporary files for %s **" %(len(collapser.chunk_files), out_file), 'yellow'))
+
+    unique_seqs = collapser.save(out_file)
+    return (collapser.total_reads, unique_seqs)
+
+###############
+def collapse_caller(reads, sample_folder, name, threads, Debug):
+    """Generates collapsed reads for a sample, if not previously done.
+
+    :param reads: file with sample reads
+    :param sample_folder: output folder
+    :param name: sample name
+    :param threads: selected threads (by defoult 2)
+    :param Debug: display complete log.
+
+    :returns: Collapsed reads file or None if failed.
+    """
+    if (len(reads) > 1):
+        print (colored("** ERROR: Only 1 fastq file is allowed please joined reads before...", 'red'))
+        exit()
+
+    collapsed_file = os.path.join(sample_folder, name + '.rc')
+
+    # check if previously generated and succeeded with same reads
+    filename_stamp = sample_folder + '/.success'
+    key = step_cache.step_key(reads, ['collapse'], None, Debug)
+    if step_cache.previous_results(filename_stamp, key) and os.path.isfile(collapsed_file):
+        stamp = functions.time_functions.read_time_stamp(filename_stamp)
+        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'collapse'), 'yellow'))
+        return (collapsed_file)
+
+    try:
+        (total_reads, unique_seqs) = collapse_reads(reads[0], collapsed_file, threads, Debug)
+    except (OSError, ValueError) as err:
+        print (colored("** ERROR: Reads could not be collapsed for sample %s: %s" %(name, err), 'red'))
+        return (None)
+
+    print ("+ Sample %s: %s reads collapsed into %s unique sequences" %(name, total_reads, unique_seqs))
+    step_cache.save_step(filename_stamp, key)
+    return (collapsed_file)
@@ -19,9 +19,10 @@ from termcolor import colored
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument, intermediate
 
 #############################################
-def caller(list_reads, sample_folder, name, threads, min_read_len, Debug, adapters, extra):
+def caller(list_reads, sample_folder, name, threads, min_read_len, Debug, adapters, extra, compress='none'):
     """ Checks if the trimming process have been done previously. If not, it executes it
     calling cutadapt()    
     
@@ -31,6 +32,7 @@ def caller(list_reads, sample_folder, name, threads, min_read_len, Debug, adapte
     :param Debug: show additional message for debugging purposes.
     :param adapters: dictionary with the introduced adapters
     :param extra: provided extra options for cutadapt trimming process
+    :param compress: compression of trimmed reads: none, gz or zstd (see :mod:`XICRA.other_tools.intermediate`)
 
     :type list_reads: string
     :type sample_folder: string
@@ -43,23 +45,27 @@ def caller(list_reads, sample_folder, name, threads, min_read_len, Debug, adapte
     :returns: None
     """
     
-    ## check if previously trimmed and succeeded
+    ## check if previously trimmed and succeeded with same reads and options
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    params = [min_read_len, adapters, extra]
+    if compress != 'none':
+        params.append(compress)
+    key = step_cache.step_key(list_reads, params, 'cutadapt', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'cutadapt'), 'yellow'))
     else:
         # Call cutadapt
         cutadapt_exe = set_config.get_exe('cutadapt')
-        code_returned = cutadapt(cutadapt_exe, list_reads, sample_folder, name, threads, min_read_len, Debug, adapters, extra)
-        if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+        code_returned = cutadapt(cutadapt_exe, list_reads, sample_folder, name, threads, min_read_len, Debug, adapters, extra, compress)
+        if code_returned == 'OK':
+            step_cache.save_step(filename_stamp, key)
         else:
             print ('** Sample %s failed...' %name)
 
 
 #############################################
-def cutadapt(cutadapt_exe, reads, path, sample_name, num_threads, min_len_given, Debug, adapters, extra):
+def cutadapt(cutadapt_exe, reads, path, sample_name, num_threads, min_len_given, Debug, adapters, extra, compress='none'):
     """
     Executes cutadapt sofware for each sample cutting the adapters of each read
     
@@ -71,6 +77,7 @@ def cutadapt(cutadapt_exe, reads, path, sample_name, num_threads, min_len_given,
     :param Debug: show additional message for debugging purposes.
     :param adapters: dictionary with the introduced adapters
     :param extra: provided extra options for cutadapt trimming process
+    :param compress: compression of trimmed reads: none, gz or zstd
     
     :type cutadapt_exe: string
     :type reads: string
@@ -85,81 +92,97 @@ def cutadapt(cutadapt_exe, reads, path, sample_name, num_threads, min_len_given,
     """
     logfile = os.path.join(path, sample_name + '.cutadapt.log')
     
+    ## cutadapt compresses outputs according to their extension, using several threads
+    ext = '.fastq' + intermediate.compress_ext[compress]
+    
+    if (len(reads) == 2):
+        p_param = os.path.join(path, sample_name + '_trim_R2' + ext)
+        o_param = os.path.join(path, sample_name + '_trim_R1' + ext)
+        output = '-o %s -p %s' %(o_param, p_param)
+    elif (len(reads) == 1):
+        o_param = os.path.join(path, sample_name + '_trim' + ext)
+        output = '-o %s' %o_param
+    else:
+        print ('** Wrong number of files provided for sample: %s...' %sample_name)
+        return(False)
+
+    cmd = trim_cmd(cutadapt_exe, reads, output, logfile, num_threads, min_len_given, adapters, extra)
+    code = instrument.system_call(cmd, step='cutadapt', sample=sample_name)
+    
+    if extra and not check_logs(logfile):
+        print (colored("** ERROR: Adapter trimming failed for sample %s. See %s" %(sample_name, logfile), 'red'))
+        return ('FAIL')
+    
+    return (code)
+
+#############################################
+def trim_cmd(cutadapt_exe, reads, output, logfile, num_threads, min_len_given, adapters, extra):
+    """
+    Returns the cutadapt command to trim adapters of the reads.
+    
+    If additional options are provided, adapter trimmed reads are sent to a second cutadapt 
+    command to ensure this options take effect after adapter removal (e.g. -u). Reads are 
+    streamed (interleaved if paired-end) so input is read once and no temporary fastq is 
+    written. Report of the first command is sent to stderr and saved in the logfile, report of
+    the second command in logfile + '.extra' (see :func:`XICRA.scripts.cutadapt_caller.check_logs`).
+    
+    :param cutadapt_exe: to call cutadapt software
+    :param reads: fastq files of the sample to be trimmed
+    :param output: cutadapt output options (-o/-p) or None to write reads to stdout (interleaved if paired-end)
+    :param logfile: file to save the report
+    :param num_threads: number of CPUs to use.
+    :param min_len_given: minimum read length
+    :param adapters: dictionary with the introduced adapters
+    :param extra: provided extra options for cutadapt trimming process
+    
+    :returns: command
+    """
     if (len(reads) == 2):
         if not adapters['adapter_a'] or not adapters['adapter_A']:
              print ("** ERROR: Missing adapter information")
              exit()
         
-        if extra:
-            o_param = os.path.join(path, sample_name + '_temp1_trim_R1.fastq')
-            p_param = os.path.join(path, sample_name + '_temp1_trim_R2.fastq')
-        else:
-            p_param = os.path.join(path, sample_name + '_trim_R2.fastq')
-            o_param = os.path.join(path, sample_name + '_trim_R1.fastq')
-        
         ## paired-end mode, 15 bps as the min length cutoff
-        cmd = '%s -j %s -m %s -a %s -A %s -o %s -p %s %s %s > %s' %(cutadapt_exe,  
-                                                                       num_threads, min_len_given, 
-                                                                       adapters['adapter_a'], 
-                                                                       adapters['adapter_A'], o_param, 
-                                                                       p_param, reads[0], reads[1], logfile)
-    elif (len(reads) == 1):
+        trim_options = '-j %s -m %s -a %s -A %s' %(num_threads, min_len_given, 
+                                                   adapters['adapter_a'], adapters['adapter_A'])
+    else:
         if not adapters['adapter_a']:
              print ("** ERROR: Missing adapter information")
              exit()
-
-        if extra:
-            o_param = os.path.join(path, sample_name + '_temp1_trim.fastq')
-        else:
-            o_param = os.path.join(path, sample_name + '_trim.fastq')
         
         ## single-end mode:
-        cmd = '%s -j %s -m %s -a %s -o %s %s > %s' %(cutadapt_exe, num_threads, 
-                                                     min_len_given,
-                                                     adapters['adapter_a'], 
-                                                     o_param, reads[0], logfile)    
-    else:
-        print ('** Wrong number of files provided for sample: %s...' %sample_name)
-        return(False)
+        trim_options = '-j %s -m %s -a %s' %(num_threads, min_len_given, adapters['adapter_a'])
 
-    ##
-    code = functions.system_call_functions.system_call(cmd)
+    ## reads written to stdout: report to stderr
+    interleaved = '--interleaved ' if len(reads) == 2 else ''
+    report = '>'
+    if not output:
+        output = '-o -'
+        report = '2>'
 
-    ## if additional options, run a second cutadapt command
-    ## to ensure this options take effect.
-    if (extra):
-        if (len(reads) == 2):
-            o_param2 = os.path.join(path, sample_name + '_trim_R1.fastq')
-            p_param2 = os.path.join(path, sample_name + '_trim_R2.fastq')
-        
-            ## paired-end mode
-            extra_cmd = '%s %s -j %s -m %s -a %s -A %s -o %s -p %s %s %s >> %s' %(cutadapt_exe, 
-                                                                                  extra, 
-                                                                                  num_threads, 
-                                                                                  min_len_given, 
-                                                                                  adapters['adapter_a'], 
-                                                                                  adapters['adapter_A'],
-                                                                                  o_param2, p_param2, 
-                                                                                  o_param, p_param, logfile)
-        
-        elif (len(reads) == 1):
-            o_param2 = os.path.join(path, sample_name + '_trim.fastq')
-            ## single-end mode:
-            extra_cmd = '%s %s -j %s -m %s -a %s -o %s %s >> %s' %(cutadapt_exe, 
-                                                                   extra, 
-                                                                   num_threads, 
-                                                                   min_len_given,
-                                                                   adapters['adapter_a'], 
-                                                                   o_param2, o_param, logfile)    
-        
-        code2 = functions.system_call_functions.system_call(extra_cmd)
-        
-        ## remove: o_param p_param
-        if (len(reads) == 2):        
-            os.remove(p_param)
-       
-        os.remove(o_param)
-        return (code2)
+    if not extra:
+        return ('%s %s %s%s %s %s %s' %(cutadapt_exe, trim_options, interleaved if report == '2>' else '', 
+                                        output, " ".join(reads), report, logfile))
+
+    return ('%s %s %s-o - %s 2> %s | %s %s %s %s%s - %s %s.extra' %(cutadapt_exe, trim_options, interleaved, 
+                                                                    " ".join(reads), logfile,
+                                                                    cutadapt_exe, extra, trim_options, 
+                                                                    interleaved, output, report, logfile))
+
+def check_logs(logfile):
+    """Appends the report of the extra options command to the logfile and checks adapter trimming finished.
     
-    else:
-        return (code)
+    The shell returns the code of the second command only: check the first finished.
+    
+    :returns: True/False
+    """
+    with open(logfile) as log_hd:
+        adapter_trimmed = '=== Summary ===' in log_hd.read()
+    
+    if os.path.isfile(logfile + '.extra'):
+        with open(logfile, 'a') as log_hd:
+            with open(logfile + '.extra') as extra_hd:
+                log_hd.write(extra_hd.read())
+        os.remove(logfile + '.extra')
+    
+    return (adapter_trimmed)
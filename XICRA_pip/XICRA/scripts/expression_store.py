@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+############################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019-2021 Lauro Sumoy Lab, IGTP, Spain   ##
+############################################################
+"""
+Sparse long-format expression store.
+
+Expression matrices (miRNA, tRNA, RNA biotype) are stored as a long table
+with a row for each feature and sample with a value. Missing values (NaN)
+in the dense matrix are not stored. Stores are saved in Parquet format and
+dense CSV matrices can be generated from them when requested.
+"""
+## useful imports
+import os
+import sys
+import csv
+import pandas as pd
+from termcolor import colored
+
+import HCGB.functions.files_functions as HCGB_files
+
+## pyarrow is required to read/write Parquet files. If not available
+## dense CSV matrices are generated as usual.
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+##########################################################
+def parquet_available():
+    """
+    Returns True if Parquet stores can be written.
+    """
+    return (pyarrow is not None)
+
+##########################################################
+def matrix2long(all_data, keys=None):
+    """
+    Converts a dense expression matrix into a long-format table.
+
+    Missing values are discarded: only features expressed in each sample are kept.
+
+    :param all_data: Dataframe containing features in rows and samples in columns.
+    :param keys: Names for the fields in the index separated by '&' (e.g. miRNA, variant, UID). If None, the index is kept as a single column named as the index.
+
+    :type all_data: pd.DataFrame
+    :type keys: list
+
+    :returns: Dataframe with keys, sample and count columns.
+    """
+    index_name = all_data.index.name if all_data.index.name else 'ID'
+    if not keys:
+        keys = [index_name]
+
+    data = all_data.copy()
+    data.index.name = 'ID'
+    data.columns.name = 'sample'
+
+    ## discard missing values
+    long_data = data.stack().dropna().rename('count').reset_index()
+
+    ## split index into keys: no columns are generated if there is no data
+    if len(keys) > 1:
+        if long_data.empty:
+            tmp = pd.DataFrame(columns=range(len(keys)), index=long_data.index, dtype=object)
+        else:
+            tmp = long_data['ID'].str.split('&', n=len(keys)-1, expand=True)
+        for i, key in enumerate(keys):
+            long_data.insert(i, key, tmp[i])
+        long_data = long_data.drop(['ID'], axis=1)
+    else:
+        long_data = long_data.rename(columns={'ID': keys[0]})
+
+    ## sample as categorical saves space and keeps sample order
+    long_data['sample'] = pd.Categorical(long_data['sample'], categories=all_data.columns.to_list())
+
+    return (long_data)
+
+##########################################################
+def long2matrix(long_data, keys=None):
+    """
+    Converts a long-format table into a dense expression matrix.
+
+    Inverse of :func:`XICRA.scripts.expression_store.matrix2long`.
+
+    :param long_data: Dataframe with keys, sample and count columns.
+    :param keys: Names for the fields to join by '&' as index. If None, all columns except sample and count.
+
+    :type long_data: pd.DataFrame
+    :type keys: list
+
+    :returns: Dataframe containing features in rows and samples in columns.
+    """
+    if not keys:
+        keys = [x for x in long_data.columns if x not in ('sample', 'count')]
+
+    ## samples in original order
+    if isinstance(long_data['sample'].dtype, pd.CategoricalDtype):
+        samples = long_data['sample'].cat.categories.to_list()
+    else:
+        samples = pd.unique(long_data['sample']).tolist()
+
+    if len(keys) > 1:
+        index = long_data[keys[0]].astype(str)
+        for key in keys[1:]:
+            index = index + '&' + long_data[key].astype(str)
+        index_name = 'ID'
+    else:
+        index = long_data[keys[0]]
+        index_name = keys[0]
+
+    all_data = pd.DataFrame({'ID': index,
+                             'sample': long_data['sample'].astype(str),
+                             'count': long_data['count']})
+    all_data = all_data.pivot(index='ID', columns='sample', values='count')
+    all_data = all_data.reindex(columns=samples).sort_index()
+    all_data.index.name = index_name
+    all_data.columns.name = None
+
+    return (all_data)
+
+##########################################################
+def write_store(long_data, store_file, append=False, samples=None):
+    """
+    Writes a long-format table into a Parquet store.
+
+    When append is True and the store exists, samples in the new data replace
+    those in the store and the rest are kept. If samples are provided, only 
+    these samples are kept from the existing store.
+
+    :param long_data: Dataframe with keys, sample and count columns.
+    :param store_file: Parquet file.
+    :param append: Add to existing store.
+    :param samples: Samples to keep from the existing store.
+
+    :type long_data: pd.DataFrame
+    :type store_file: string
+    :type append: bool
+    :type samples: list
+
+    :returns: Dataframe stored.
+    """
+    if append and HCGB_files.is_non_zero_file(store_file):
+        old_data = read_store(store_file)
+        if isinstance(long_data['sample'].dtype, pd.CategoricalDtype):
+            new_samples = long_data['sample'].cat.categories.to_list()
+        else:
+            new_samples = long_data['sample'].astype(str).unique().tolist()
+        old_data = old_data[~old_data['sample'].astype(str).isin(new_samples)].copy()
+        old_samples = [x for x in old_data['sample'].cat.categories if x not in new_samples]
+        if samples is not None:
+            old_data = old_data[old_data['sample'].astype(str).isin(samples)].copy()
+            old_samples = [x for x in old_samples if x in samples]
+
+        ## keep sample order: old samples first
+        old_data['sample'] = old_data['sample'].astype(str)
+        long_data = long_data.copy()
+        long_data['sample'] = long_data['sample'].astype(str)
+        long_data = pd.concat([old_data, long_data], ignore_index=True)
+        long_data['sample'] = pd.Categorical(long_data['sample'], categories=old_samples + new_samples)
+
+    ## write to a temporary file and rename
+    tmp_file = store_file + '.tmp'
+    long_data.to_parquet(tmp_file, engine='pyarrow', index=False, compression='zstd')
+    os.replace(tmp_file, store_file)
+
+    return (long_data)
+
+##########################################################
+def store_samples(store_file):
+    """
+    Returns the samples available in a Parquet store.
+
+    :param store_file: Parquet file.
+    :type store_file: string
+
+    :returns: List of samples, in store order.
+    """
+    sample_data = pd.read_parquet(store_file, engine='pyarrow', columns=['sample'])['sample']
+    if isinstance(sample_data.dtype, pd.CategoricalDtype):
+        return (sample_data.cat.categories.to_list())
+    return (pd.unique(sample_data.astype(str)).tolist())
+
+##########################################################
+def read_store(store_file, samples=None):
+    """
+    Reads a long-format table from a Parquet store.
+
+    :param store_file: Parquet file.
+    :param samples: Only retrieve these samples, if provided.
+
+    :type store_file: string
+    :type samples: list
+
+    :returns: Dataframe with keys, sample and count columns.
+    """
+    filters = None
+    if samples:
+        filters = [('sample', 'in', list(samples))]
+
+    long_data = pd.read_parquet(store_file, engine='pyarrow', filters=filters)
+    if not isinstance(long_data['sample'].dtype, pd.CategoricalDtype):
+        long_data['sample'] = pd.Categorical(long_data['sample'])
+
+    return (long_data)
+
+##########################################################
+def store2csv(store_file, csv_outfile, keys=None):
+    """
+    Generates the dense CSV matrix from a Parquet store.
+
+    :param store_file: Parquet file.
+    :param csv_outfile: CSV file to create.
+    :param keys: Names for the fields to join by '&' as index. See :func:`XICRA.scripts.expression_store.long2matrix`.
+
+    :returns: Dataframe containing features in rows and samples in columns.
+    """
+    all_data = long2matrix(read_store(store_file), keys)
+    all_data.to_csv(csv_outfile, quoting=csv.QUOTE_NONNUMERIC)
+    return (all_data)
+
+######
+def main():
+    ## this code runs when call as a single script
+
+    ## control if options provided or help
+    if len(sys.argv) > 2:
+        print ("")
+    else:
+        print ("Provide Parquet store and CSV file to create")
+        exit()
+
+    if not parquet_available():
+        print (colored("** ERROR: pyarrow is required to read expression stores", "red"))
+        exit()
+
+    store2csv(sys.argv[1], sys.argv[2])
+
+######
+if __name__== "__main__":
+    main()
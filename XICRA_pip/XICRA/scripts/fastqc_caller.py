@@ -19,6 +19,7 @@ from termcolor import colored
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument
 
 ############
 def call_fastqc(path, files, sample, fastqc_bin, threads):    
@@ -27,14 +28,19 @@ def call_fastqc(path, files, sample, fastqc_bin, threads):
     #name = functions.files_functions.create_subfolder(sample, path)
     logFile = path + '/' + sample + '.log'
     
-    # create string with files path
-    files_string = " ".join(files)
+    # create string with files path: zstd compressed files are sent using stdin
+    files_string = " ".join([f for f in files if not f.endswith('.zst')])
     
     ##print ("+ Calling fastqc for samples...")    
-    cmd_fastqc = '%s --extract -t %s -o %s %s > %s 2> %s' %(fastqc_bin, threads, path, files_string, logFile, logFile)
-    fastq_code = functions.system_call_functions.system_call( cmd_fastqc )
+    cmds = []
+    if files_string:
+        cmds.append('%s --extract -t %s -o %s %s > %s 2> %s' %(fastqc_bin, threads, path, files_string, logFile, logFile))
+    for zst_file in [f for f in files if f.endswith('.zst')]:
+        cmds.append('zstd -dcf %s | %s --extract -o %s stdin:%s >> %s 2>&1' %(zst_file, fastqc_bin, path, 
+                                                                            os.path.basename(zst_file)[:-4], logFile))
+    fastq_code = instrument.system_call(" && ".join(cmds), step='fastqc', sample=sample)
     
-    if not fastq_code:
+    if fastq_code != 'OK':
         print ('** Sample %s failed...' %sample)
 
     ## send command    
@@ -44,9 +50,10 @@ def call_fastqc(path, files, sample, fastqc_bin, threads):
 def run_module_fastqc(path, files, sample, threads):    
     ## Arguments provided via ARGVs
 
-    ## check if previously done and succeeded
+    ## check if previously done and succeeded with same files
     filename_stamp = path + '/.success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key(files, None, 'fastqc')
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, sample, 'fastqc'), 'yellow'))
     else:
@@ -54,7 +61,7 @@ def run_module_fastqc(path, files, sample, threads):
         fastqc_bin = set_config.get_exe('fastqc')
         codeReturn = call_fastqc(path, files, sample, fastqc_bin, threads)
 
-        if codeReturn:
-            functions.time_functions.print_time_stamp(filename_stamp)
+        if codeReturn == 'OK':
+            step_cache.save_step(filename_stamp, key)
         
         return ()
@@ -8,12 +8,17 @@ import re
 import sys
 import pandas as pd
 import csv
+import json
 
 from HCGB import functions
 import HCGB.functions.aesthetics_functions as HCGB_aes
+import HCGB.functions.info_functions as HCGB_info
+from termcolor import colored
+
+from XICRA.scripts import expression_store
 
 ####################
-def generate_DE(dataframe_results, Debug, outfolder, type_analysis='miRNA'):
+def generate_DE(dataframe_results, Debug, outfolder, type_analysis='miRNA', expression_format='csv', incremental=False):
 	"""Builds final expression matrices comparing all samples.
 	
 		Generates three .csv for each software used:
@@ -23,13 +28,29 @@ def generate_DE(dataframe_results, Debug, outfolder, type_analysis='miRNA'):
 		
 		miRNA is the default analysis but other can be provided such as tRNA, piRNA, etc
 		
+		If expression_format is parquet, a sparse long-format store is generated instead 
+		(miRNA_expression-soft_name.parquet and miRNA_expression-soft_name_seq.parquet). 
+		CSV files can be later generated using :func:`XICRA.scripts.generate_DE.store2csv`.
+		Use both to generate store and CSV files.
+		
+		If incremental, parsed tables for each sample are kept in outfolder/cache and only new 
+		or changed samples are parsed (see :func:`XICRA.scripts.generate_DE.update_matrix`). 
+		Existing stores are updated with these samples.
+		
 		:param dataframe_results: dataframe with the paths of the outputs of each sample and software
 		:param Debug: display complete log
 		:param outfolder: output folder
+		:param expression_format: csv, parquet or both
+		:param incremental: reuse samples parsed in previous runs
 		
 	    :returns: None
 	"""
 	
+	## Parquet requires pyarrow
+	if expression_format != 'csv' and not expression_store.parquet_available():
+		print (colored("** WARNING: pyarrow is not available. Expression matrices will be generated as CSV files.", "yellow"))
+		expression_format = 'csv'
+	
 	## get results dictionary for each software employed 
 	soft_list = dataframe_results.soft.unique()
 	
@@ -57,16 +78,100 @@ def generate_DE(dataframe_results, Debug, outfolder, type_analysis='miRNA'):
 			print ("dict_files")
 			print (dict_files)
 
-		## get data and discard duplicate UIDs if any
-		(all_data, all_seqs) = generate_matrix(dict_files, soft_name.lower(), Debug, type_analysis=type_analysis)
-		all_data_filtered, all_data_duplicated = discard_UID_duplicated(all_data, type_res=type_analysis)
-			
+		## cache of samples parsed
+		cache_folder = None
+		if incremental:
+			cache_folder = functions.files_functions.create_subfolder(type_analysis + '_expression-' + soft_name, 
+																	   functions.files_functions.create_subfolder("cache", outfolder))
+		
+		## get data
+		(all_data, all_seqs, parsed) = update_matrix(dict_files, soft_name.lower(), Debug, 
+													 type_analysis=type_analysis, cache_folder=cache_folder)
 		
 		## dump data in folder provided
 		csv_outfile = os.path.join(outfolder, type_analysis + '_expression-' + soft_name)
-		all_data_filtered.to_csv(csv_outfile + ".csv", quoting=csv.QUOTE_NONNUMERIC)
-		all_data_duplicated.to_csv(csv_outfile + '_dup.csv', quoting=csv.QUOTE_NONNUMERIC)
-		all_seqs.to_csv(csv_outfile + '_seq.csv', quoting=csv.QUOTE_NONNUMERIC)
+		
+		## sparse store
+		if expression_format in ('parquet', 'both'):
+			if incremental and functions.files_functions.is_non_zero_file(csv_outfile + ".parquet"):
+				## add new or changed samples and discard those not available
+				updated = [x for x in parsed if x in all_data.columns]
+				if not updated and set(expression_store.store_samples(csv_outfile + ".parquet")) == set(all_data.columns):
+					print ("+ Expression store is up to date")
+				else:
+					print ("+ Updating expression store with %s sample(s)" %len(updated))
+					write_store(all_data[updated], all_seqs, csv_outfile, type_analysis, 
+								append=True, samples=all_data.columns.to_list())
+			else:
+				write_store(all_data, all_seqs, csv_outfile, type_analysis)
+			print ("+ Expression store available at: " + csv_outfile + ".parquet")
+		
+		## dense matrices
+		if expression_format in ('csv', 'both'):
+			write_csv(all_data, all_seqs, csv_outfile, type_analysis)
+
+####################
+def write_csv(all_data, all_seqs, csv_outfile, type_analysis='miRNA'):
+	"""Discards duplicate UIDs if any and dumps expression matrices in CSV format
+	
+	:param all_data: expression matrix generated by :func:`XICRA.scripts.generate_DE.generate_matrix`
+	:param all_seqs: sequence table generated by :func:`XICRA.scripts.generate_DE.generate_matrix`
+	:param csv_outfile: prefix for the files to generate
+	:param type_analysis: miRNA, tRF-amb, tRF-exc, etc
+	
+	:returns: None
+	"""
+	all_data_filtered, all_data_duplicated = discard_UID_duplicated(all_data, type_res=type_analysis)
+	all_data_filtered.to_csv(csv_outfile + ".csv", quoting=csv.QUOTE_NONNUMERIC)
+	all_data_duplicated.to_csv(csv_outfile + '_dup.csv', quoting=csv.QUOTE_NONNUMERIC)
+	all_seqs.to_csv(csv_outfile + '_seq.csv', quoting=csv.QUOTE_NONNUMERIC)
+
+####################
+def write_store(all_data, all_seqs, store_prefix, type_analysis='miRNA', append=False, samples=None):
+	"""Dumps expression matrix and sequences as sparse long-format stores
+	
+	Generates store_prefix.parquet with a row for each name, variant, UID and sample 
+	and store_prefix_seq.parquet with the sequence for each UID. 
+	See :func:`XICRA.scripts.expression_store.write_store` for append option.
+	
+	:param all_data: expression matrix generated by :func:`XICRA.scripts.generate_DE.generate_matrix`
+	:param all_seqs: sequence table generated by :func:`XICRA.scripts.generate_DE.generate_matrix`
+	:param store_prefix: prefix for the files to generate
+	:param type_analysis: miRNA, tRF-amb, tRF-exc, etc
+	:param append: add samples to existing store
+	:param samples: samples to keep from existing store
+	
+	:returns: None
+	"""
+	## expression
+	long_data = expression_store.matrix2long(all_data, keys=[type_analysis, 'variant', 'UID'])
+	expression_store.write_store(long_data, store_prefix + '.parquet', append=append, samples=samples)
+	
+	## sequences: one for each UID
+	seq_data = all_seqs.bfill(axis=1).iloc[:, :1]
+	seq_data.columns = ['Read']
+	seq_data = seq_data.dropna()
+	seq_data.index.name = 'UID'
+	seq_file = store_prefix + '_seq.parquet'
+	if append and functions.files_functions.is_non_zero_file(seq_file):
+		seq_data = pd.concat([pd.read_parquet(seq_file).set_index('UID'), seq_data])
+		seq_data = seq_data[~seq_data.index.duplicated(keep='last')].sort_index()
+	seq_data.reset_index().to_parquet(seq_file + '.tmp', index=False)
+	os.replace(seq_file + '.tmp', seq_file)
+
+####################
+def store2csv(store_prefix, type_analysis='miRNA'):
+	"""Generates CSV expression matrices from the stores generated by :func:`XICRA.scripts.generate_DE.write_store`
+	
+	:param store_prefix: prefix for the stores and files to generate
+	:param type_analysis: miRNA, tRF-amb, tRF-exc, etc
+	
+	:returns: None
+	"""
+	all_data = expression_store.long2matrix(expression_store.read_store(store_prefix + '.parquet'), 
+											keys=[type_analysis, 'variant', 'UID'])
+	all_seqs = pd.read_parquet(store_prefix + '_seq.parquet').set_index('UID')
+	write_csv(all_data, all_seqs, store_prefix, type_analysis)
 
 ####################
 def discard_UID_duplicated(df_data, type_res="miRNA"):
@@ -132,131 +237,86 @@ def generate_matrix(dict_files, soft_name, Debug, type_analysis="miRNA"):
 	### count values for each sample (sample_name) in columns
 	###
 	#########################################################
-	all_data = pd.DataFrame()
-	seq_all_data = pd.DataFrame()
+	(all_data, seq_all_data, parsed) = update_matrix(dict_files, soft_name, Debug, type_analysis=type_analysis)
+	return (all_data, seq_all_data)
+
+####################
+def update_matrix(dict_files, soft_name, Debug, type_analysis="miRNA", cache_folder=None):
+	"""Generates count and sequence matrices reusing samples parsed in previous runs
+	
+	If cache_folder is provided, a digest (path, size, mtime and sha256 hash) and the 
+	parsed tables are stored for each sample. Only new samples or samples with 
+	changed files are parsed again. See :func:`XICRA.scripts.generate_DE.generate_matrix`.
+	
+	:param dict_files: dictionary with sample names as keys and files as values
+	:param soft_name: software employed
+	:param Debug: display complete log
+	:param type_analysis: miRNA, tRF-amb, tRF-exc, etc
+	:param cache_folder: folder to store digests and parsed tables
+	
+	:returns: count matrix, sequence matrix and list of samples parsed in this run 
+	"""
+	## digest of samples parsed in previous runs
+	digest = {}
+	digest_file = ""
+	if cache_folder:
+		digest_file = os.path.join(cache_folder, "digest.json")
+		if functions.files_functions.is_non_zero_file(digest_file):
+			digest = functions.main_functions.read_json_file(digest_file)
+	
+	## collect data for each sample and merge all at once
+	list_data = []
+	list_seq_data = []
+	parsed = []
+	new_digest = {}
 	for sample, this_file in dict_files.items():
 		
-		new_data=pd.DataFrame()
-		
-		print ('+ Reading information from sample: ', sample)	
-		
 		## 
-		if functions.files_functions.is_non_zero_file(this_file):
-			data = pd.read_csv(this_file, sep='\t')
-		else:
+		if not functions.files_functions.is_non_zero_file(this_file):
+			print ('+ Reading information from sample: ', sample)	
 			print ('\t - Information not available for sample: ', sample)	
 			continue
+		
+		## reuse tables from previous runs if sample file did not change
+		tables = None
+		if cache_folder:
+			sample_digest = file_digest(this_file, digest.get(sample))
+			new_digest[sample] = sample_digest
+			cache_file = os.path.join(cache_folder, sample + ".pkl")
+			if digest.get(sample, {}).get('hash') == sample_digest['hash'] and os.path.isfile(cache_file):
+				print ('+ Reading information from sample: ', sample, ' [cached]')	
+				tables = pd.read_pickle(cache_file)
+		
+		if tables is None:
+			print ('+ Reading information from sample: ', sample)	
+			tables = parse_sample(sample, this_file, soft_name, Debug, type_analysis)
+			parsed.append(sample)
+			if cache_folder:
+				pd.to_pickle(tables, cache_file)
+		
 		##
-		if (data.size == 0):
+		(new_data, seq_data) = tables
+		if new_data is None:
 			print ('\t - Information not available for sample: ', sample)  
 			continue
-
-		####
-		if type_analysis=="miRNA":
-			
-			## ------------------------------------------ ##
-			## Create matrix for miRNA results
-			## ------------------------------------------ ##
-			
-			## get info, generate unique name and merge for samples
-			## header of tsv files: 
-			## UID	Read	miRNA	Variant	iso_5p	iso_3p	iso_add3p	iso_snp	sRNAbench
-	
-			## add NA if any
-			data['Variant'] = data['Variant'].fillna('Canonical')
-			
-			
-			## some variants are more complex and are denoted by several variants separated by comma:
-			## e.g. iso_3p:+3,iso_add3p:1
-			
-			## These variants be included in different orders generating erroneous duplicated hits later:
-			## e.g.: 
-				## "hsa-miR-383-3p&iso_3p:+3,iso_add3p:1 & iso-22-0JEVN3JBF"
-				## "hsa-miR-383-3p&iso_add3p:1,iso_3p:+3 & iso-22-0JEVN3JBF"
-
-				## "hsa-miR-9500 & iso_add3p:1,iso_snv,iso_3p:+3 & iso-22-DKDERUKIQ"
-				## "hsa-miR-9500 & iso_snv,iso_add3p:1,iso_3p:+3 & iso-22-DKDERUKIQ"
-
-			## let's sort several entries if any and avoid this artifact
-
-			## get variants that contain several types and sort them
-			#print(data[data['Variant'].str.contains(",")])
-			for i, row in data.iterrows():
-				if (',' in row.Variant):
-					list_of_variants = row['Variant'].split(',')
-					list_of_variants.sort()
-					data.at[i,'Variant'] = ",".join(list_of_variants)
-								
-			## create unique_id merging miRNA & variants & UID
-			data['unique_id'] = data.apply(lambda data: data['miRNA'] + '&' + data['Variant'] + '&' + data['UID'], axis=1)
-	
-			## parse according to software
-			if (soft_name == 'srnabench'):
-				## sRNAbench mirtop creates a column id with sRNAbench instead of sample name
-				new_data = data.filter(['unique_id', 'sRNAbench'], axis=1)
-				new_data = new_data.set_index('unique_id')
-				new_data = new_data.rename(columns={'sRNAbench': sample})
-	
-			if (soft_name == 'optimir'):
-				## OptimiR mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
-				regex=re.compile(sample + '.*')
-				search_list = list(filter(regex.match, data.columns.values.tolist()))
-				new_data = data.filter(['unique_id', search_list[0]], axis=1)
-				new_data = new_data.set_index('unique_id')
-				new_data = new_data.rename(columns={search_list[0]: sample})
-	
-			if (soft_name == 'miraligner'):
-				## miraligner mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
-				new_data = data.filter(['unique_id', sample], axis=1)
-				new_data = new_data.set_index('unique_id')
 		
-		####
-		elif "tRF" in type_analysis: ## tRF-amb; tRF-exc, tRF
-
-			if Debug:
-				HCGB_aes.debug_message(type_analysis + " analysis: ")
-
-			## ------------------------------------------ ##
-			## Create matrix for tRNA results
-			## ------------------------------------------ ##
-			## UID	Read	tRNA	variant	ident	expression	soft\n'
-			
-			data['variant'].fillna('NA', inplace=True)
-			
-			## parse according to software
-			if (soft_name == 'mintmap'):
-				data['unique_id'] = data.apply(lambda data: data['tRNA'] + '&' + data['variant'] + '&' + data['UID'], axis=1)
-				new_data = data.filter(['unique_id', 'expression'], axis=1)
-				new_data = new_data.set_index('unique_id')
-				new_data = new_data.rename(columns={'expression': sample})
-			
-			## TODO
-			#else:
-			#	data['unique_id'] = data.apply(lambda data: data['tRNA'] + '&' + data['variant'] + '&' + data['UID'], axis=1)
-			#	new_data = data.filter(['unique_id', 'XXXX'], axis=1) ## TODO
-			#	new_data = new_data.set_index('unique_id')			  ## TODO
-			#	new_data = new_data.rename(columns={'XXXX': sample})  ## TODO
-				
-		else:
-			print()
-			## add new
-		
-		## sequence information
-		seq_data = data.filter(['UID', 'Read'], axis=1)	
-		seq_data = seq_data.set_index('UID')
-        
-        ## debugging messages
-		if Debug:
-			HCGB_aes.debug_message("Data for samples: " + sample)
-			print (new_data)
-			HCGB_aes.debug_message("Sequence data for samples: " + sample)
-			print (seq_data)
-            
 		#seq_all_data = seq_all_data.append(seq_data, sort=True).drop_duplicates('Read')
-		seq_all_data = pd.concat([seq_all_data, seq_data], axis=1, sort=True).drop_duplicates('Read')
-        
-		all_data = pd.concat([all_data, new_data], axis=1, sort=True)
+		list_seq_data.append(seq_data)
+		list_data.append(new_data)
+
+	## save digest
+	if cache_folder:
+		with open(digest_file, "w") as digest_hd:
+			json.dump(new_digest, digest_hd, indent=4)
 
+	## merge samples: outer join on the index
+	if list_data:
+		all_data = pd.concat(list_data, axis=1, sort=True)
+		seq_all_data = pd.concat(list_seq_data, axis=1, sort=True).drop_duplicates('Read')
+	else:
+		all_data = pd.DataFrame()
+		seq_all_data = pd.DataFrame()
+	
 	##
 	## debugging messages
 	if Debug:
@@ -265,7 +325,147 @@ def generate_matrix(dict_files, soft_name, Debug, type_analysis="miRNA"):
 		HCGB_aes.debug_message("Data for sequences all samples: ")
 		print (seq_all_data)
 	
-	return (all_data, seq_all_data)	
+	return (all_data, seq_all_data, parsed)
+
+####################
+def file_digest(this_file, previous=None):
+	"""Returns path, size, mtime and sha256 hash of the file given
+	
+	The hash is only computed if size or mtime differ from the previous digest.
+	
+	:param this_file: file to check
+	:param previous: digest generated in a previous run, if any
+	
+	:returns: dictionary with path, size, mtime and hash
+	"""
+	stat = os.stat(this_file)
+	sample_digest = {'path': os.path.abspath(this_file), 'size': stat.st_size, 'mtime': stat.st_mtime}
+	
+	if (previous and previous.get('path') == sample_digest['path'] and 
+		previous.get('size') == sample_digest['size'] and previous.get('mtime') == sample_digest['mtime']):
+		sample_digest['hash'] = previous.get('hash')
+	else:
+		sample_digest['hash'] = HCGB_info.read_filehash(this_file).hexdigest()
+	
+	return (sample_digest)
+
+####################
+def parse_sample(sample, this_file, soft_name, Debug, type_analysis="miRNA"):
+	"""Parses the results of a sample and returns count and sequence tables
+	
+	:param sample: sample name
+	:param this_file: file with results for this sample
+	:param soft_name: software employed
+	:param Debug: display complete log
+	:param type_analysis: miRNA, tRF-amb, tRF-exc, etc
+	
+	:returns: count and sequence tables for this sample or None if no data available
+	"""
+	new_data=pd.DataFrame()
+	data = pd.read_csv(this_file, sep='\t')
+	
+	##
+	if (data.size == 0):
+		return (None, None)
+
+	####
+	if type_analysis=="miRNA":
+		
+		## ------------------------------------------ ##
+		## Create matrix for miRNA results
+		## ------------------------------------------ ##
+		
+		## get info, generate unique name and merge for samples
+		## header of tsv files: 
+		## UID	Read	miRNA	Variant	iso_5p	iso_3p	iso_add3p	iso_snp	sRNAbench
+
+		## add NA if any
+		data['Variant'] = data['Variant'].fillna('Canonical')
+		
+		
+		## some variants are more complex and are denoted by several variants separated by comma:
+		## e.g. iso_3p:+3,iso_add3p:1
+		
+		## These variants be included in different orders generating erroneous duplicated hits later:
+		## e.g.: 
+			## "hsa-miR-383-3p&iso_3p:+3,iso_add3p:1 & iso-22-0JEVN3JBF"
+			## "hsa-miR-383-3p&iso_add3p:1,iso_3p:+3 & iso-22-0JEVN3JBF"
+
+			## "hsa-miR-9500 & iso_add3p:1,iso_snv,iso_3p:+3 & iso-22-DKDERUKIQ"
+			## "hsa-miR-9500 & iso_snv,iso_add3p:1,iso_3p:+3 & iso-22-DKDERUKIQ"
+
+		## let's sort several entries if any and avoid this artifact
+
+		## get variants that contain several types and sort them
+		#print(data[data['Variant'].str.contains(",")])
+		data['Variant'] = data['Variant'].str.split(',').map(sorted).str.join(',')
+							
+		## create unique_id merging miRNA & variants & UID
+		data['unique_id'] = data['miRNA'] + '&' + data['Variant'] + '&' + data['UID']
+
+		## parse according to software
+		if (soft_name == 'srnabench'):
+			## sRNAbench mirtop creates a column id with sRNAbench instead of sample name
+			new_data = data.filter(['unique_id', 'sRNAbench'], axis=1)
+			new_data = new_data.set_index('unique_id')
+			new_data = new_data.rename(columns={'sRNAbench': sample})
+
+		if (soft_name == 'optimir'):
+			## OptimiR mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
+			regex=re.compile(sample + '.*')
+			search_list = list(filter(regex.match, data.columns.values.tolist()))
+			new_data = data.filter(['unique_id', search_list[0]], axis=1)
+			new_data = new_data.set_index('unique_id')
+			new_data = new_data.rename(columns={search_list[0]: sample})
+
+		if (soft_name == 'miraligner'):
+			## miraligner mirtop creates a column containing sample name and other tags (trim, joined, fastq...)
+			new_data = data.filter(['unique_id', sample], axis=1)
+			new_data = new_data.set_index('unique_id')
+	
+	####
+	elif "tRF" in type_analysis: ## tRF-amb; tRF-exc, tRF
+
+		if Debug:
+			HCGB_aes.debug_message(type_analysis + " analysis: ")
+
+		## ------------------------------------------ ##
+		## Create matrix for tRNA results
+		## ------------------------------------------ ##
+		## UID	Read	tRNA	variant	ident	expression	soft\n'
+		
+		data['variant'].fillna('NA', inplace=True)
+		
+		## parse according to software
+		if (soft_name == 'mintmap'):
+			data['unique_id'] = data['tRNA'] + '&' + data['variant'] + '&' + data['UID']
+			new_data = data.filter(['unique_id', 'expression'], axis=1)
+			new_data = new_data.set_index('unique_id')
+			new_data = new_data.rename(columns={'expression': sample})
+		
+		## TODO
+		#else:
+		#	data['unique_id'] = data.apply(lambda data: data['tRNA'] + '&' + data['variant'] + '&' + data['UID'], axis=1)
+		#	new_data = data.filter(['unique_id', 'XXXX'], axis=1) ## TODO
+		#	new_data = new_data.set_index('unique_id')			  ## TODO
+		#	new_data = new_data.rename(columns={'XXXX': sample})  ## TODO
+			
+	else:
+		print()
+		## add new
+	
+	## sequence information
+	seq_data = data.filter(['UID', 'Read'], axis=1)	
+	seq_data = seq_data.set_index('UID')
+        
+        ## debugging messages
+	if Debug:
+		HCGB_aes.debug_message("Data for samples: " + sample)
+		print (new_data)
+		HCGB_aes.debug_message("Sequence data for samples: " + sample)
+		print (seq_data)
+	
+	return (new_data, seq_data.drop_duplicates('Read'))
 
 ######
 
@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez, Marta Lopez & Lauro Sumoy           ##
+## Copyright (C) 2019-2021 Lauro Sumoy Lab, IGTP, Spain ##
+##########################################################
+'''
+Converts isomiR results into miRTop count tables within XICRA.
+
+Replaces calls to ``mirtop gff`` and ``mirtop counts`` for sRNAbench (``reads.annotation``),
+OptimiR (GFF3) and miraligner (``.mirna``) results. The miRBase hairpin and GFF3 annotation is
+loaded once for each process and the table generated contains the same columns as
+``counts/mirtop.tsv``:
+
+UID, Read, miRNA, Variant, iso_5p, iso_3p, iso_add3p, iso_snp and the counts for the sample.
+
+Annotation of isomiRs follows miRTop (v0.4.23, https://github.com/miRTop/mirtop) so results
+can be compared with it (see :func:`XICRA.scripts.isomir_converter.parity_test`).
+'''
+## useful imports
+import os
+import re
+import sys
+import copy
+import argparse
+import itertools
+import threading
+import warnings
+from collections import defaultdict
+from termcolor import colored
+
+import pandas as pd
+
+## pairwise2 is deprecated in Biopython but used by miRTop: use it if available
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        from Bio import pairwise2
+except ImportError:
+    pairwise2 = None
+    from Bio.Align import PairwiseAligner
+
+## header of miRTop count tables
+counts_header = ['UID', 'Read', 'miRNA', 'Variant', 'iso_5p', 'iso_3p', 'iso_add3p', 'iso_snp']
+
+####################################################################
+## Unique identifiers for sequences (MINTplates license plates)
+####################################################################
+_plate_codes = 'BD0EF1HI2JK3LM4NO5PQ6RS7UV8WX9YZ'
+
+def _plate_tables():
+    ## code for each k-mer (k <= 5): 5-mers use two symbols, shorter k-mers are numbered after them
+    encode = {}
+    for k in range(1, 6):
+        offset = 0 if k == 5 else sum(4**j for j in range(1, k))
+        for index, kmer in enumerate(itertools.product('ACGT', repeat=k)):
+            kmer = ''.join(kmer)
+            value = index + offset
+            if k < 5 and value < 32:
+                code = _plate_codes[value]
+            else:
+                code = _plate_codes[value // 32] + _plate_codes[value % 32]
+            encode[kmer] = code
+    return (encode)
+
+_plate_encode = _plate_tables()
+
+def make_uid(seq):
+    """Returns the miRTop unique identifier (iso-length-code) of a sequence."""
+    seq = seq.upper().replace('U', 'T')
+    if not re.match('^[ACGT]+$', seq):
+        raise ValueError("Sequence is not valid: %s" %seq)
+    return ('iso-%s-%s' %(len(seq), ''.join(_plate_encode[seq[i:i+5]] for i in range(0, len(seq), 5))))
+
+####################################################################
+## Annotation
+####################################################################
+_annotation = {}
+_annotation_lock = threading.Lock()
+
+def read_precursors(hairpinFasta, species=None):
+    """Returns hairpin sequences (DNA) of the species given, as miRTop."""
+    hairpin = defaultdict(str)
+    name = None
+    with open(hairpinFasta) as in_handle:
+        for line in in_handle:
+            if line.startswith(">"):
+                if name in hairpin:
+                    hairpin[name] = hairpin[name] + "NNNNNNNNNNNN"
+                if not species or line.find(species) > -1:
+                    name = line.strip().replace(">", " ").split()[0]
+                else:
+                    name = None
+            elif name:
+                hairpin[name] += line.strip().replace("U", "T")
+        if name:
+            hairpin[name] = hairpin[name] + "NNNNNNNNNNNN"
+    return (dict(hairpin))
+
+def read_matures(miRNA_gff):
+    """Returns position (0-based, end included) of each mature miRNA within its precursor.
+
+    :param miRNA_gff: miRBase GFF3 annotation file
+
+    :returns: {precursor: {miRNA: [start, end, strand]}}
+    """
+    precursors_pos = {}
+    matures_pos = {}
+    id_dict = {}
+    with open(miRNA_gff) as in_handle:
+        for line in in_handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            cols = line.strip().split("\t")
+            attrs = [n for n in cols[-1].split(";")]
+            name = [n.split("=")[1] for n in attrs if n.startswith("Name")]
+            idname = [n.split("=")[1] for n in attrs if n.startswith("ID")]
+            id_dict[idname[0]] = name[0]
+            if cols[2] == "miRNA_primary_transcript":
+                precursors_pos[name[0]] = [cols[0], int(cols[3]), int(cols[4]), cols[6]]
+            if cols[2] == "miRNA":
+                parent = [n.split("=")[1] for n in attrs if n.startswith("Derives_from")]
+                matures_pos[(parent[0], name[0])] = [cols[0], int(cols[3]), int(cols[4]), cols[6], parent[0]]
+
+    matures = defaultdict(dict)
+    for (parent, mirna), (chrom, start, end, strand, _) in matures_pos.items():
+        precursor = precursors_pos.get(id_dict.get(parent))
+        if not precursor:
+            continue
+        if precursor[3] == "+":
+            matures[id_dict[parent]][mirna] = [start - precursor[1], end - precursor[1], strand]
+        elif precursor[3] == "-":
+            matures[id_dict[parent]][mirna] = [precursor[2] - end, precursor[2] - start, strand]
+    return (dict(matures))
+
+def load_annotation(hairpinFasta, miRNA_gff, species):
+    """Loads hairpin sequences and mature positions once for each process.
+
+    :param hairpinFasta: hairpin fasta file
+    :param miRNA_gff: miRNA gff3 annotation file
+    :param species: species tag ID. Default: hsa (Homo sapiens)
+
+    :returns: Dictionary with precursors (see :func:`XICRA.scripts.isomir_converter.read_precursors`)
+        and matures (see :func:`XICRA.scripts.isomir_converter.read_matures`).
+    """
+    key = (os.path.abspath(hairpinFasta), os.path.abspath(miRNA_gff), species)
+    with _annotation_lock:
+        if key not in _annotation:
+            _annotation[key] = {'precursors': read_precursors(hairpinFasta, species),
+                                'matures': read_matures(miRNA_gff)}
+        return (_annotation[key])
+
+####################################################################
+## isomiRs
+####################################################################
+class isomir:
+    """Alignment of a read on a precursor."""
+    def __init__(self, start, length):
+        self.start = max(start, 0)
+        self.end = self.start + length - 1
+        self.t5 = []
+        self.t3 = []
+        self.add = []
+        self.subs = []
+        self.mirna = None
+
+    def score(self, length):
+        """Read length minus changes: 3' additions (0.25 A/T; 0.75 others) and substitutions."""
+        for nt in self.add:
+            length -= 0.25 if nt in ['A', 'T'] else 0.75
+        return (length - len(self.subs))
+
+    def variant(self):
+        """Returns Variant attribute: sorted variants separated by comma or NA."""
+        value = set()
+        for sub in self.subs:
+            if 1 < sub[0] < 8:
+                value.add("iso_snv_seed")
+            elif sub[0] == 8:
+                value.add("iso_snv_central_offset")
+            elif 8 < sub[0] < 13:
+                value.add("iso_snv_central")
+            elif 12 < sub[0] < 18:
+                value.add("iso_snv_central_supp")
+            else:
+                value.add("iso_snv")
+        if self.add:
+            value.add("iso_add3p:%s" % len(self.add))
+        if self.t5:
+            value.add("iso_5p:%s%s" % ("-" if self.t5.isupper() else "+", len(self.t5)))
+        if self.t3:
+            value.add("iso_3p:%s%s" % ("+" if self.t3.isupper() else "-", len(self.t3)))
+        if not value:
+            return ("NA")
+        return (",".join(sorted(value)))
+
+def align(seq, reference):
+    """Global alignment of the read and the precursor region (match 1, mismatch -1, gaps -1/-0.5)."""
+    if pairwise2:
+        aligned = list(pairwise2.align.globalms(seq, reference, 1, -1, -1, -0.5, one_alignment_only=True)[0])
+    else:
+        aligner = PairwiseAligner(mode='global', match_score=1, mismatch_score=-1,
+                                  open_gap_score=-1, extend_gap_score=-0.5)
+        aligned = list(aligner.align(seq, reference)[0])
+    if "N" in aligned[0]:
+        aligned[0] = ''.join(reference[i] if nt == 'N' else nt for i, nt in enumerate(aligned[0]))
+    return (aligned[0], aligned[1])
+
+def tune(seq, precursor, start):
+    """Realigns the read on the precursor and returns substitutions and 3' additions."""
+    end = len(seq)
+    if start < 0:
+        end = end + start
+        start = 0
+    (seq, mature) = align(seq, precursor[start:start + end])
+    if seq.startswith("-"):
+        seq = seq[1:]
+    if seq.endswith("-"):
+        seq = seq[:-1]
+
+    error = set(pos for pos in range(0, len(seq)) if seq[pos] != mature[pos])
+
+    ## non-templated additions: A/T or mismatches at the 3' end
+    subs, add = [], []
+    prob = 0
+    add_position = []
+    for e in range(len(seq) - 1, len(seq) - 6, -1):
+        if e in error:
+            prob = 1
+        if prob == 1:
+            add.append(seq[e])
+            add_position.append(e)
+        if e not in error and prob == 0 and seq[e] in ["A", "T"]:
+            add.append(seq[e])
+            add_position.append(e)
+            continue
+        if e not in error:
+            if add:
+                add.pop()
+                add_position.pop()
+            if prob == 0:
+                add = []
+                add_position = []
+            break
+
+    for e in error:
+        if e not in add_position:
+            subs.append([e, seq[e], mature[e]])
+
+    return (subs, "".join(add))
+
+def _coord(sequence, start, mirna, precursor, iso):
+    ## defines 5' and 3' variants of the read for the mature miRNA given
+    insertion = sum([1 if s[-1] == "-" else 0 for s in iso.subs])
+    deletion = sum([1 if s[1] == "-" else 0 for s in iso.subs])
+    add = len(iso.add) if iso.add else 0
+    end = (iso.end - add - insertion + deletion)
+
+    dif = abs(mirna[0] - start)
+    if start < mirna[0]:
+        iso.t5 = sequence[:dif].upper()
+    elif start > mirna[0]:
+        iso.t5 = precursor[mirna[0]:mirna[0] + dif].lower()
+    else:
+        iso.t5 = 0
+    if dif > 6:
+        return (False)
+
+    dif = abs(mirna[1] - iso.end)
+    if iso.add:
+        iso.add = iso.add.replace("-", "")
+        sequence = sequence[:-len(iso.add)]
+    if end > mirna[1]:
+        iso.t3 = sequence[-dif:].upper()
+    elif end < mirna[1]:
+        iso.t3 = precursor[mirna[1] + 1 - dif:(mirna[1] + 1)].lower()
+    else:
+        iso.t3 = 0
+
+    if dif > 7:
+        return (False)
+    return (True)
+
+def _expand(variant):
+    ## iso_5p, iso_3p, iso_add3p and number of substitutions from Variant
+    isomir_values = {}
+    snv = 0
+    for v in variant.split(","):
+        if v.find(":") > 0:
+            isomir_values[v.split(":")[0]] = v.split(":")[1]
+        elif v.find("snv") > 0:
+            snv += 1
+    return ([isomir_values.get("iso_5p", "0"), isomir_values.get("iso_3p", "0"),
+             isomir_values.get("iso_add3p", "0"), str(snv)])
+
+####################################################################
+## Readers: return hits as [key, chrom, start, attributes, samples, counts]
+## grouped by chrom and start in the order miRTop merges them
+####################################################################
+def _add_hit(hits, chrom, start, hit):
+    hits.setdefault(chrom, {}).setdefault(start, []).append(hit)
+
+def read_seqbuster(mirna_file, annotation):
+    """Reads miraligner results (.mirna) and annotates isomiRs."""
+    precursors = annotation['precursors']
+    matures = annotation['matures']
+    sample = os.path.splitext(os.path.basename(mirna_file))[0]
+
+    ## last alignment of each read
+    reads = {}
+    col_fix = 0
+    with open(mirna_file) as handle:
+        header = handle.readline()
+        if header.find("freq") < 0:
+            col_fix = 1
+        for line in handle:
+            cols = line.strip().split("\t")
+            (name, seq) = (cols[1], cols[0])
+            if seq and seq.find("N") > -1:
+                continue
+            reads[name] = (seq, None)
+            start = int(cols[4-col_fix]) - 1
+            chrom = cols[13-col_fix]
+            iso = isomir(start, len(seq))
+            if len(precursors.get(chrom, '')) < start + len(seq):
+                continue
+            (iso.subs, iso.add) = tune(seq, precursors[chrom], start)
+            if len(iso.subs) < 6:
+                reads[name] = (seq, (chrom, iso))
+
+    hits = {}
+    for name, (seq, alignment) in reads.items():
+        if not alignment:
+            continue
+        (chrom, iso) = alignment
+
+        ## annotate with mature miRNAs: last valid is kept
+        for mirna, mirna_pos in matures.get(chrom, {}).items():
+            iso_copy = copy.deepcopy(iso)
+            if not precursors.get(chrom):
+                continue
+            if _coord(seq, iso.start, mirna_pos, precursors[chrom], iso_copy):
+                iso = iso_copy
+                iso.mirna = mirna
+
+        if not iso.mirna or iso.score(len(seq)) < 1:
+            continue
+        if iso.subs and "N" in iso.subs[0]:
+            iso.subs = []
+
+        try:
+            counts = int(name.split("_x")[1])
+        except (IndexError, ValueError):
+            counts = 0
+        uid = make_uid(seq)
+        attributes = {'UID': uid, 'Read': seq, 'Name': iso.mirna, 'Variant': iso.variant()}
+        _add_hit(hits, chrom, iso.start, ["%s.%s.%s" %(chrom, uid, seq), chrom, str(iso.start),
+                                         attributes, sample, counts])
+    return (hits, [sample])
+
+def _read_srnabench_iso(iso_file):
+    ## isomiR definition for each sequence and miRNA
+    iso = dict()
+    with open(iso_file) as inh:
+        inh.readline()
+        for line in inh:
+            cols = line.strip().split("\t")
+            label = cols[3].split("$")
+            mirnas = cols[1].split("$")
+            if len(mirnas) == 1 and len(label) > 1:
+                label = [cols[3].split("$")[0]]
+            if len(mirnas) != len(label):
+                label = label * (len(mirnas) - len(label))
+            for m, m_label in zip(mirnas, label):
+                iso[(cols[0], m)] = _translate_srnabench(m_label, cols[4])
+    return (iso)
+
+def _translate_srnabench(isomirs, description):
+    ## sRNAbench isomiR labels into miRTop variants
+    iso = []
+    for label in isomirs.split("@"):
+        if label == "exact":
+            return ("NA")
+        if label.find("mv") > -1:
+            return ("mv")
+        number_nts = label.split("|")[-1].split("#")[-1]
+        if number_nts.find("-") < 0:
+            number_nts = "+%s" % number_nts
+        if label.find("lv3p") > -1:
+            iso.append("iso_3p:%s" % number_nts)
+        if label.find("lv5p") > -1:
+            if number_nts.startswith("+"):
+                number_nts = number_nts.replace("+", "-")
+            else:
+                number_nts = number_nts.replace("-", "+")
+            iso.append("iso_5p:%s" % number_nts)
+        if label.find("nta") > -1:
+            iso.append("iso_add3p:%s" % label.split("|")[1].split("#")[-1])
+        if label.find("NucVar") > -1:
+            for nt in description.split(","):
+                if nt == "-" or nt == "NA":
+                    return ("notsure")
+                pos = int(nt.split(":")[0])
+                if 1 < pos < 8:
+                    iso.append("iso_snv_seed")
+                elif pos == 8:
+                    iso.append("iso_snv_central_offset")
+                elif 8 < pos < 13:
+                    iso.append("iso_snv_central")
+                elif 12 < pos < 18:
+                    iso.append("iso_snv_central_supp")
+                else:
+                    iso.append("iso_snv")
+    return (",".join(iso))
+
+def read_srnabench(results_folder, annotation):
+    """Reads sRNAbench results (reads.annotation and microRNAannotation.txt)."""
+    precursors = annotation['precursors']
+    sample = os.path.basename(os.path.normpath(results_folder))
+    source_iso = _read_srnabench_iso(os.path.join(results_folder, "microRNAannotation.txt"))
+
+    hits = {}
+    seen = set()
+    with open(os.path.join(results_folder, "reads.annotation")) as handle:
+        for line in handle:
+            cols = line.strip().split("\t")
+            seq = cols[0]
+            if not seq or seq.find("N") > -1:
+                continue
+            if cols[3].find("mature") == -1:
+                continue
+            counts = int(cols[1])
+            for nhit in cols[4].split("$"):
+                hit_info = nhit.split("#")
+                pos_info = hit_info[3].split(",")
+                start = int(pos_info[1]) - 1
+                chrom = pos_info[0]
+                mirna = hit_info[1]
+                if (seq, mirna) in seen:
+                    continue
+                seen.add((seq, mirna))
+                variant = source_iso.get((seq, mirna))
+                if variant is None or variant == "mv":
+                    continue
+                if len(precursors.get(chrom, '')) < start + len(seq):
+                    continue
+                uid = make_uid(seq)
+                attributes = {'UID': uid, 'Read': seq, 'Name': mirna, 'Variant': variant}
+                _add_hit(hits, chrom, start, [uid, chrom, str(start), attributes, sample, counts])
+    return (hits, [sample])
+
+def read_optimir(gff_file):
+    """Reads OptimiR results (GFF3 in miRTop format)."""
+    sample = os.path.splitext(os.path.basename(gff_file))[0]
+    gff_samples = None
+    hits = {}
+    with open(gff_file) as handle:
+        for line in handle:
+            if line.startswith("## COLDATA"):
+                gff_samples = line.strip().split(": ")[1].strip().split(",")
+            if line.startswith("#") or not line.strip():
+                continue
+            cols = line.strip().split("\t")
+            sep = "=" if cols[8].find("Name=") > -1 else " "
+            attributes = {}
+            for item in cols[8].split(";"):
+                item_pair = item.strip().split(sep)
+                if len(item_pair) > 1:
+                    attributes[item_pair[0].strip()] = item_pair[1].strip()
+            attributes.setdefault("Variant", "NA")
+            chrom = attributes["Parent"].split(",")[0]
+            _add_hit(hits, chrom, cols[3], [attributes["UID"], chrom, cols[3], attributes,
+                                           gff_samples, attributes["Expression"].split(",")])
+    return (hits, [sample])
+
+####################################################################
+## Count table
+####################################################################
+def merge_hits(hits, samples):
+    """Returns rows of the count table: a row for each hit identifier (last hit kept), as miRTop."""
+    all_data = {}
+    all_hits = {}
+    for chrom in hits:
+        for start in hits[chrom]:
+            for hit in hits[chrom][start]:
+                (key, hit_samples, counts) = (hit[0], hit[4], hit[5])
+                if not isinstance(hit_samples, list):
+                    (hit_samples, counts) = ([hit_samples], [counts])
+                all_data.setdefault(key, {}).update(zip(hit_samples, counts))
+                all_hits[key] = hit
+
+    merged = {}
+    for key in all_data:
+        (chrom, start, attributes) = all_hits[key][1:4]
+        expression = [str(all_data[key][s]) if s in all_data[key] else "0" for s in samples]
+        merged.setdefault(chrom, {}).setdefault(start, []).append((attributes, expression))
+
+    rows = []
+    for chrom in merged:
+        for start in sorted(merged[chrom]):
+            for attributes, expression in merged[chrom][start]:
+                variant = attributes['Variant']
+                rows.append([attributes['UID'], attributes['Read'], attributes['Name'], variant]
+                            + _expand(variant) + expression)
+    return (rows)
+
+def results_file(results_folder, format, Debug=False):
+    """Returns the results file of each software or None if empty."""
+    if format == "srnabench":
+        this_file = os.path.join(results_folder, "reads.annotation")
+    else:
+        folder = os.path.join(results_folder, "OptimiR_Results") if format == "optimir" else results_folder
+        ext = ".gff3" if format == "optimir" else ".mirna"
+        found = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(ext)] if os.path.isdir(folder) else []
+        this_file = found[0] if found else None
+
+    if Debug:
+        print (colored("**DEBUG: isomir_converter: results file %s **" %this_file, 'yellow'))
+
+    if not this_file or not os.path.isfile(this_file) or os.path.getsize(this_file) == 0:
+        return (None)
+    return (this_file)
+
+def convert(results_folder, out_file, format, annotation, Debug=False):
+    """Converts results of a sample into a miRTop count table.
+
+    :param results_folder: folder with the output of the sample from the software
+    :param out_file: count table to create (e.g. counts/mirtop.tsv)
+    :param format: 'srnabench', 'optimir' or 'seqbuster'
+    :param annotation: annotation loaded with :func:`XICRA.scripts.isomir_converter.load_annotation`
+    :param Debug: display complete log.
+
+    :returns: out_file or False if no isomiRs detected
+    """
+    format = format.lower()
+    this_file = results_file(results_folder, format, Debug)
+    if not this_file:
+        return (False)
+
+    if format == "srnabench":
+        (hits, samples) = read_srnabench(results_folder, annotation)
+    elif format == "optimir":
+        (hits, samples) = read_optimir(this_file)
+    elif format == "seqbuster":
+        (hits, samples) = read_seqbuster(this_file, annotation)
+    else:
+        raise ValueError("Format not supported: %s" %format)
+
+    rows = merge_hits(hits, samples)
+    with open(out_file + '.tmp', 'w') as out_hd:
+        out_hd.write("\t".join(counts_header + samples) + "\n")
+        for row in rows:
+            out_hd.write("\t".join(row) + "\n")
+    os.replace(out_file + '.tmp', out_file)
+
+    if Debug:
+        print (colored("**DEBUG: isomir_converter: %s isomiRs in %s **" %(len(rows), out_file), 'yellow'))
+
+    return (out_file)
+
+####################################################################
+## Parity with miRTop
+####################################################################
+def compare_counts(table_a, table_b):
+    """Compares two miRTop count tables regardless of rows and variants order.
+
+    :returns: Dataframe with rows that differ (empty if both are equal).
+    """
+    keys = ['UID', 'Read', 'miRNA', 'Variant']
+    tables = []
+    for table in (table_a, table_b):
+        data = pd.read_csv(table, sep='\t', dtype=str).fillna('NA')
+        data['Variant'] = data['Variant'].str.split(',').map(sorted).str.join(',')
+        tables.append(data.set_index(keys).sort_index())
+
+    merged = tables[0].join(tables[1], how='outer', lsuffix='_a', rsuffix='_b')
+    differ = pd.Series(False, index=merged.index)
+    for col in tables[0].columns:
+        col_b = col + '_b' if col in tables[1].columns else None
+        if col_b is None:
+            differ = differ | True
+            continue
+        differ = differ | (merged[col + '_a'] != merged[col_b])
+    return (merged[differ])
+
+def parity_test(results_folder, format, hairpinFasta, miRNA_gff, species, outdir, Debug=False):
+    """Converts results of a sample with miRTop and XICRA and compares both count tables.
+
+    :returns: True if both are equal.
+    """
+    from XICRA.scripts import mirtop_caller
+
+    mirtop_folder = os.path.join(os.path.abspath(outdir), 'miRTop')
+    xicra_table = os.path.join(os.path.abspath(outdir), 'mirtop_XICRA.tsv')
+    for folder in [mirtop_folder] + [os.path.join(mirtop_folder, f) for f in ('gff', 'stats', 'counts', 'export')]:
+        os.makedirs(folder, exist_ok=True)
+
+    mirtop_table = mirtop_caller.miRTop(results_folder, mirtop_folder, 'parity', 1, format.lower(),
+                                        miRNA_gff, hairpinFasta, species, Debug)
+    annotation = load_annotation(hairpinFasta, miRNA_gff, species)
+    if not mirtop_table or not convert(results_folder, xicra_table, format, annotation, Debug):
+        print (colored("** ERROR: No isomiRs detected in %s" %results_folder, 'red'))
+        return (False)
+
+    differences = compare_counts(mirtop_table, xicra_table)
+    if differences.empty:
+        print (colored("+ Count tables are equal: %s" %results_folder, 'green'))
+        return (True)
+
+    print (colored("** %s isomiRs differ between miRTop and XICRA: %s" %(len(differences), results_folder), 'red'))
+    print (differences.head(20).to_string())
+    return (False)
+
+####################################################################
+def main():
+    ## Compare miRTop and XICRA count tables for a sample
+    parser = argparse.ArgumentParser(description="Compare count tables generated by miRTop and XICRA for a sample.")
+    parser.add_argument("--results", required=True, help="Folder with results of the sample (e.g. data/sample/miRNA/miraligner)")
+    parser.add_argument("--format", required=True, choices=['sRNAbench', 'optimir', 'seqbuster'])
+    parser.add_argument("--hairpin", required=True, help="Hairpin fasta file")
+    parser.add_argument("--gff", required=True, help="miRBase GFF3 file")
+    parser.add_argument("--species", default='hsa')
+    parser.add_argument("-o", "--outdir", required=True)
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    if not parity_test(args.results, args.format, args.hairpin, args.gff, args.species, args.outdir, args.debug):
+        sys.exit(1)
+
+######
+if __name__== "__main__":
+    main()
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez, Marta Lopez & Lauro Sumoy           ##
+## Copyright (C) 2019-2021 Lauro Sumoy Lab, IGTP, Spain ##
+##########################################################
+'''
+Joins overlapping paired-end reads of short small RNA inserts.
+
+Read pairs are processed in batches using numpy: for each pair, the reverse complement of
+read 2 is overlapped with the end of read 1 and the overlap with the best score
+``(mismatches^2 + 1) / overlap`` (as fastq-join) among those with less mismatches than the
+percentage allowed is chosen. In the overlap, the base with higher quality is kept. Batches
+are sent to several processes and outputs are written in the input order.
+
+Joined and unjoined reads (plain, gzip or zstd compressed) and statistics for the sample
+(merge rate and histograms of overlap length, mismatches and joined length) are generated.
+'''
+## useful imports
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import concurrent.futures
+import numpy as np
+from termcolor import colored
+
+## import my modules
+from XICRA.other_tools import intermediate
+
+## read pairs processed in each batch
+batch_size = 50000
+
+## bases encoded as 0-3, other characters as 4 (never matching)
+_base_code = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(('Aa', 'Cc', 'Gg', 'Tt')):
+    for _base in _bases:
+        _base_code[ord(_base)] = _code
+_base_letter = np.frombuffer(b'ACGTN', dtype=np.uint8)
+_complement = str.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+###############
+def output_names(path, sample_name, compress='none'):
+    """Returns joined, unjoined R1 and unjoined R2 reads files for a sample."""
+    ext = intermediate.compress_ext[compress]
+    return (os.path.join(path, sample_name + '_trim_joined.fastq' + ext),
+            os.path.join(path, sample_name + '_trimmed_unjoin_R1.fastq' + ext),
+            os.path.join(path, sample_name + '_trimmed_unjoin_R2.fastq' + ext))
+
+###############
+def read_pairs(fastq_1, fastq_2=None, threads=1):
+    """Yields batches of read pairs: lists of (header_1, seq_1, qual_1, header_2, seq_2, qual_2).
+
+    :param fastq_1: read 1 fastq file or text stream of reads (e.g. cutadapt output)
+    :param fastq_2: read 2 fastq file or None if read pairs are interleaved in fastq_1
+    :param threads: threads available to decompress
+    """
+    reads_1 = intermediate.open_reads(fastq_1, threads) if isinstance(fastq_1, str) else fastq_1
+    reads_2 = reads_1
+    if fastq_2:
+        reads_2 = intermediate.open_reads(fastq_2, threads)
+    try:
+        batch = []
+        while True:
+            record_1 = [reads_1.readline() for i in range(4)]
+            record_2 = [reads_2.readline() for i in range(4)]
+            if not record_1[0] or not record_2[0]:
+                if record_1[0] or record_2[0]:
+                    raise ValueError("Different number of reads in %s and %s" %(fastq_1, fastq_2))
+                break
+            batch.append((record_1[0].rstrip('\n'), record_1[1].rstrip(), record_1[3].rstrip(),
+                          record_2[0].rstrip('\n'), record_2[1].rstrip(), record_2[3].rstrip()))
+            if len(batch) == batch_size:
+                yield (batch)
+                batch = []
+        if batch:
+            yield (batch)
+    finally:
+        reads_1.close()
+        reads_2.close()
+
+###############
+def _encode(strings, pad):
+    ## returns array of characters (padded) and lengths of strings given
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    width = max(int(lengths.max()), 1)
+    flat = np.frombuffer(''.join(strings).encode(), dtype=np.uint8)
+    rows = np.repeat(np.arange(len(strings)), lengths)
+    cols = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    array = np.full((len(strings), width), pad, dtype=np.uint8)
+    array[rows, cols] = flat
+    return (array, lengths)
+
+def best_overlap(seq_1, len_1, seq_2, len_2, min_overlap, perc_diff):
+    """Returns overlap length (0: not joined) and mismatches of the best overlap of each pair.
+
+    Read 1 end is overlapped with read 2 (reverse complemented) start.
+
+    :param seq_1: encoded read 1 (pairs x positions)
+    :param len_1: read 1 lengths
+    :param seq_2: encoded read 2 reverse complemented
+    :param len_2: read 2 lengths
+    :param min_overlap: minimum overlap length
+    :param perc_diff: maximum percentage of mismatches in the overlap
+    """
+    pairs = len(len_1)
+    best_length = np.zeros(pairs, dtype=np.int64)
+    best_mismatch = np.zeros(pairs, dtype=np.int64)
+    best_score = np.full(pairs, np.inf)
+    max_overlap = np.minimum(len_1, len_2)
+
+    for length in range(int(max_overlap.max(initial=0)), min_overlap - 1, -1):
+        rows = np.nonzero(max_overlap >= length)[0]
+        cols = (len_1[rows] - length)[:, None] + np.arange(length)[None, :]
+        overlap_1 = np.take_along_axis(seq_1[rows], cols, axis=1)
+        overlap_2 = seq_2[rows, :length]
+        mismatch = ((overlap_1 != overlap_2) | (overlap_1 == 4)).sum(axis=1)
+        score = (mismatch**2 + 1) / length
+        better = (mismatch * 100 <= perc_diff * length) & (score < best_score[rows])
+        rows = rows[better]
+        best_length[rows] = length
+        best_mismatch[rows] = mismatch[better]
+        best_score[rows] = score[better]
+
+    return (best_length, best_mismatch)
+
+def merge_batch(batch, min_overlap=6, perc_diff=0):
+    """Joins a batch of read pairs.
+
+    :param batch: list of pairs (see :func:`XICRA.scripts.join_reads.read_pairs`)
+    :param min_overlap: minimum overlap length
+    :param perc_diff: maximum percentage of mismatches in the overlap
+
+    :returns: Tuple with joined reads, unjoined R1 and R2 (text) and statistics for the batch.
+    """
+    rc_seqs = [pair[4].translate(_complement)[::-1] for pair in batch]
+    rc_quals = [pair[5][::-1] for pair in batch]
+    (seq_1, len_1) = _encode([pair[1] for pair in batch], 5)
+    (seq_2, len_2) = _encode(rc_seqs, 6)
+    seq_1 = _base_code[seq_1]
+    seq_1[np.arange(seq_1.shape[1])[None, :] >= len_1[:, None]] = 5
+    seq_2 = _base_code[seq_2]
+    seq_2[np.arange(seq_2.shape[1])[None, :] >= len_2[:, None]] = 6
+    (qual_1, _) = _encode([pair[2] for pair in batch], 0)
+    (qual_2, _) = _encode(rc_quals, 0)
+
+    (overlap, mismatch) = best_overlap(seq_1, len_1, seq_2, len_2, min_overlap, perc_diff)
+    joined = np.nonzero(overlap)[0]
+    unjoined = np.nonzero(overlap == 0)[0]
+
+    ## joined reads: read 1, overlap and read 2 rest
+    joined_len = len_1[joined] + len_2[joined] - overlap[joined]
+    width = int(joined_len.max(initial=1))
+    pos = np.arange(width)[None, :]
+    pos_1 = np.broadcast_to(pos, (len(joined), width))
+    pos_2 = pos - (len_1[joined] - overlap[joined])[:, None]
+    in_1 = pos_1 < len_1[joined][:, None]
+    in_2 = (pos_2 >= 0) & (pos_2 < len_2[joined][:, None])
+
+    base_1 = np.take_along_axis(seq_1[joined], np.minimum(pos_1, seq_1.shape[1] - 1), axis=1)
+    q_1 = np.take_along_axis(qual_1[joined], np.minimum(pos_1, qual_1.shape[1] - 1), axis=1).astype(np.int64)
+    base_2 = np.take_along_axis(seq_2[joined], np.clip(pos_2, 0, seq_2.shape[1] - 1), axis=1)
+    q_2 = np.take_along_axis(qual_2[joined], np.clip(pos_2, 0, qual_2.shape[1] - 1), axis=1).astype(np.int64)
+
+    ## overlap: higher quality base; quality is the maximum if bases agree or the difference otherwise
+    use_2 = in_2 & (~in_1 | (q_2 > q_1))
+    base = np.where(use_2, base_2, base_1)
+    qual = np.where(use_2, q_2, q_1)
+    both = in_1 & in_2
+    agree = both & (base_1 == base_2) & (base_1 < 4)
+    qual = np.where(agree, np.maximum(q_1, q_2), qual)
+    qual = np.where(both & ~agree, np.maximum(np.abs(q_1 - q_2) + 33, 35), qual)
+
+    letters = _base_letter[np.minimum(base, 4)].tobytes()
+    quals = qual.astype(np.uint8).tobytes()
+
+    joined_text = []
+    for i, pair_number in enumerate(joined):
+        start = i * width
+        end = start + int(joined_len[i])
+        joined_text.append("%s\n%s\n+\n%s\n" %(batch[pair_number][0], letters[start:end].decode(),
+                                               quals[start:end].decode()))
+    unjoined_1 = ["%s\n%s\n+\n%s\n" %(batch[i][0], batch[i][1], batch[i][2]) for i in unjoined]
+    unjoined_2 = ["%s\n%s\n+\n%s\n" %(batch[i][3], batch[i][4], batch[i][5]) for i in unjoined]
+
+    stats = {'pairs': len(batch), 'joined': len(joined),
+             'overlap_length': np.bincount(overlap[joined]),
+             'mismatches': np.bincount(mismatch[joined]),
+             'joined_length': np.bincount(joined_len)}
+    return ("".join(joined_text), "".join(unjoined_1), "".join(unjoined_2), stats)
+
+###############
+def _add_counts(histogram, counts):
+    for value, count in enumerate(counts):
+        if count:
+            histogram[value] = histogram.get(value, 0) + int(count)
+
+def join_pairs(fastq_1, fastq_2, out_files, threads=1, min_overlap=6, perc_diff=0, compress='none', Debug=False, collapser=None):
+    """Joins overlapping paired-end reads.
+
+    :param fastq_1: read 1 fastq file (plain, gzip or zstd compressed) or text stream of interleaved pairs
+    :param fastq_2: read 2 fastq file (plain, gzip or zstd compressed) or None if interleaved
+    :param out_files: joined, unjoined R1 and unjoined R2 files to create (None: not saved)
+    :param threads: processes to use
+    :param min_overlap: minimum overlap length
+    :param perc_diff: maximum percentage of mismatches in the overlap
+    :param compress: none, gz or zstd
+    :param Debug: display complete log.
+    :param collapser: :class:`XICRA.scripts.collapse_reads.Collapser` counting joined reads, if any.
+
+    :returns: Dictionary with statistics: pairs, joined, merge_rate and histograms of overlap_length,
+        mismatches and joined_length.
+    """
+    stats = {'pairs': 0, 'joined': 0, 'overlap_length': {}, 'mismatches': {}, 'joined_length': {}}
+    tmp_files = [out_file + '.tmp' if out_file else None for out_file in out_files]
+    outputs = [intermediate.open_output(tmp_file, compress, max(1, threads // 2)) if tmp_file else None
+               for tmp_file in tmp_files]
+
+    def save(results):
+        for output, text in zip(outputs, results[:3]):
+            if output:
+                output.write(text)
+        if collapser:
+            collapser.add_fastq(results[0])
+        batch_stats = results[3]
+        stats['pairs'] += batch_stats['pairs']
+        stats['joined'] += batch_stats['joined']
+        for hist in ('overlap_length', 'mismatches', 'joined_length'):
+            _add_counts(stats[hist], batch_stats[hist])
+
+    try:
+        if threads < 2:
+            for batch in read_pairs(fastq_1, fastq_2):
+                save(merge_batch(batch, min_overlap, perc_diff))
+        else:
+            ## batches sent to processes: results saved in order
+            with concurrent.futures.ProcessPoolExecutor(max_workers=threads) as executor:
+                pending = []
+                for batch in read_pairs(fastq_1, fastq_2, threads):
+                    pending.append(executor.submit(merge_batch, batch, min_overlap, perc_diff))
+                    if len(pending) > 2 * threads:
+                        save(pending.pop(0).result())
+                for future in pending:
+                    save(future.result())
+    finally:
+        for output in outputs:
+            if output:
+                output.close()
+
+    for tmp_file, out_file in zip(tmp_files, out_files):
+        if out_file:
+            os.replace(tmp_file, out_file)
+
+    stats['merge_rate'] = round(100 * stats['joined'] / stats['pairs'], 2) if stats['pairs'] else 0
+    if Debug:
+        print (colored("**DEBUG: join_pairs %s: %s pairs, %s joined **" %(fastq_1, stats['pairs'], stats['joined']), 'yellow'))
+    return (stats)
+
+###############
+def fastqjoin_stats(logfile):
+    """Returns statistics (pairs, joined, merge_rate) reported by fastq-join in its log."""
+    stats = {}
+    with open(logfile) as log_hd:
+        log_text = log_hd.read()
+    for (key, regex) in (('pairs', r'Total reads:\s*(\d+)'), ('joined', r'Total joined:\s*(\d+)')):
+        match = re.search(regex, log_text)
+        if match:
+            stats[key] = int(match.group(1))
+    if stats.get('pairs'):
+        stats['merge_rate'] = round(100 * stats.get('joined', 0) / stats['pairs'], 2)
+    return (stats)
+
+def save_stats(stats, stats_file):
+    """Saves statistics of a sample in JSON format."""
+    with open(stats_file + '.tmp', 'w') as stats_hd:
+        json.dump(stats, stats_hd, indent=4)
+    os.replace(stats_file + '.tmp', stats_file)
+
+###############
+def main():
+    ## Join reads of a sample and compare with fastq-join, if available
+    parser = argparse.ArgumentParser(description="Join overlapping paired-end reads and compare results with fastq-join.")
+    parser.add_argument("--r1", required=True, help="Read 1 fastq file")
+    parser.add_argument("--r2", required=True, help="Read 2 fastq file")
+    parser.add_argument("-o", "--outdir", required=True)
+    parser.add_argument("-t", "--threads", type=int, default=2)
+    parser.add_argument("--perc_diff", type=int, default=0)
+    parser.add_argument("--min_overlap", type=int, default=6)
+    parser.add_argument("--compress", choices=list(intermediate.compress_ext), default='none')
+    parser.add_argument("--fastqjoin", help="fastq-join executable [Default: fastq-join in $PATH]")
+    args = parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    xicra_folder = os.path.join(args.outdir, 'XICRA')
+    os.makedirs(xicra_folder, exist_ok=True)
+
+    start = time.time()
+    out_files = output_names(xicra_folder, 'sample', args.compress)
+    stats = join_pairs(args.r1, args.r2, out_files, args.threads, args.min_overlap, args.perc_diff, args.compress)
+    print ("XICRA\t%.2f s\tpairs: %s\tjoined: %s (%s %%)" %(time.time() - start, stats['pairs'], stats['joined'], stats['merge_rate']))
+    save_stats(stats, os.path.join(xicra_folder, 'sample.join_stats.json'))
+
+    fastqjoin_exe = args.fastqjoin or shutil.which('fastq-join')
+    if not fastqjoin_exe:
+        print ("fastq-join not available: no comparison")
+        return ()
+
+    fastqjoin_folder = os.path.join(args.outdir, 'fastqjoin')
+    os.makedirs(fastqjoin_folder, exist_ok=True)
+    (joined, unjoined_1, unjoined_2) = output_names(fastqjoin_folder, 'sample')
+    logfile = os.path.join(fastqjoin_folder, 'sample.fastqjoin.log')
+    start = time.time()
+    subprocess.run('%s -p %s -m %s %s %s -o %s -o %s -o %s > %s' %(fastqjoin_exe, args.perc_diff, args.min_overlap,
+                                                               args.r1, args.r2, unjoined_1, unjoined_2, joined, logfile),
+                   shell=True, check=True)
+    fastqjoin_time = time.time() - start
+    fastqjoin = fastqjoin_stats(logfile)
+    print ("fastq-join\t%.2f s\tpairs: %s\tjoined: %s (%s %%)" %(fastqjoin_time, fastqjoin.get('pairs'),
+                                                               fastqjoin.get('joined'), fastqjoin.get('merge_rate')))
+
+    ## joined sequences of each read
+    def joined_seqs(fastq_file):
+        seqs = {}
+        with intermediate.open_reads(fastq_file) as reads_hd:
+            for line_number, line in enumerate(reads_hd):
+                if line_number % 4 == 0:
+                    name = line.split()[0]
+                elif line_number % 4 == 1:
+                    seqs[name] = line.rstrip()
+        return (seqs)
+    xicra_seqs = joined_seqs(out_files[0])
+    fastqjoin_seqs = joined_seqs(joined)
+    shared = set(xicra_seqs) & set(fastqjoin_seqs)
+    same = sum(1 for name in shared if xicra_seqs[name] == fastqjoin_seqs[name])
+    print ("Joined by both: %s\tsame sequence: %s\tonly XICRA: %s\tonly fastq-join: %s" %(
+        len(shared), same, len(xicra_seqs) - len(shared), len(fastqjoin_seqs) - len(shared)))
+
+######
+if __name__== "__main__":
+    main()
@@ -17,9 +17,10 @@ from io import open
 from termcolor import colored
 
 ## import my modules
-from HCGB.functions import fasta_functions
+from XICRA.scripts import collapse_reads
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, java_worker, scatter
 
 ###############       
 def miraligner_caller(reads, sample_folder, name, threads, database, species, Debug):
@@ -39,16 +40,20 @@ def miraligner_caller(reads, sample_folder, name, threads, database, species, De
 
     :returns: True/False
     """
-    # check if previously generated and succeeded
+    # check if previously generated and succeeded with same reads and options
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key(reads, [database, species], 'miraligner', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'miraligner'), 'yellow'))
     else:
-        # Call miralinger
-        code_returned = miraligner(reads, sample_folder, name, database, species, Debug)
+        # Call miralinger: split into shards if several threads
+        code_returned = scatter.scatter_gather(reads, sample_folder, name, threads, 
+                                               lambda shard_input, shard_folder: miraligner(shard_input, shard_folder, name, database, species, Debug),
+                                               lambda shard_folders, offsets, shard_reads: merge_shards(shard_folders, offsets, sample_folder), 
+                                               'rc', Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
@@ -61,7 +66,7 @@ def miraligner (reads, outpath, file_name, database, species, Debug):
 
     Checks if the reads are joined and builds the miraligner command to execute it. 
     
-    :param reads: file with sample reads
+    :param reads: file with sample reads or collapsed reads (.rc)
     :param outpath: output folder
     :param file_name: sample name
     :param database: path to store miRNA annotation files downloaded
@@ -81,13 +86,41 @@ def miraligner (reads, outpath, file_name, database, species, Debug):
         print (colored("** ERROR: Only 1 fastq file is allowed please joined reads before...", 'red'))
         exit()
     
-    ## create tabular information of reads
-    tabular_info = os.path.join(outpath, file_name + '-tab.freq.txt')
-    fasta_functions.reads2tabular(reads[0], tabular_info)
+    ## create tabular information of reads, if not collapsed before
+    if reads[0].endswith('.rc'):
+        tabular_info = reads[0]
+    else:
+        ## same format (sequence<tab>count) for plain and compressed reads
+        tabular_info = os.path.join(outpath, file_name + '-tab.freq.txt')
+        collapse_reads.collapse_reads(reads[0], tabular_info, 1, Debug)
+    
+    ## create command: heap according to the sample size
+    args = ['-db', database, '-sub', '1', '-add', '3', '-trim', '3', '-s', species, 
+            '-i', tabular_info, '-o', outpath_file]
+    heap_MB = java_worker.java_heap([tabular_info])
     
-    ## create command 
-    java_exe = set_config.get_exe('java', Debug=Debug)
-    cmd = '%s -jar %s -db %s -sub 1 -add 3 -trim 3 -s %s -i %s -o %s 2> %s' %(
-        java_exe, miraligner_exe, database, species, tabular_info, outpath_file, logfile)
+    return(java_worker.java_call(miraligner_exe, args, stderr_file=logfile, heap_MB=heap_MB, 
+                                 step='miraligner', sample=file_name, Debug=Debug))
+
+###############
+def merge_shards(shard_folders, offsets, outpath):
+    """Merges miraligner results of the shards of a sample.
+
+    Reads (``seq_<index>_x<count>``) are renamed with their index in the unsharded input.
+
+    :param shard_folders: output folder of each shard
+    :param offsets: index of the first sequence of each shard
+    :param outpath: output folder
+
+    :returns: True/False
+    """
+    rename = scatter.rename_seq(offsets)
+    merged = []
+    for output in sorted(os.listdir(shard_folders[0])):
+        shard_files = [os.path.join(shard_folder, output) for shard_folder in shard_folders]
+        if output.startswith('.') or not all(os.path.isfile(f) for f in shard_files):
+            continue
+        scatter.merge_text(shard_files, os.path.join(outpath, output), rename)
+        merged.append(output)
     
-    return(functions.system_call_functions.system_call(cmd))
+    return (any(output.endswith('.mirna') for output in merged))
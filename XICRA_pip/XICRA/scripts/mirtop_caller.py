@@ -19,11 +19,17 @@ from termcolor import colored
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.scripts import isomir_converter
+from XICRA.other_tools import step_cache, instrument
 
 ###############
-def miRTop_caller(results_folder, mirtop_folder, name, threads, miRNA_gff, hairpinFasta, format, species, Debug):
+def miRTop_caller(results_folder, mirtop_folder, name, threads, miRNA_gff, hairpinFasta, format, species, Debug, annotation=None):
     """Checks if the computation has already been performed. If not, it calls
     miRTop()
+    
+    If the annotation is provided, results are converted within XICRA into counts/mirtop.tsv
+    (see :func:`XICRA.scripts.isomir_converter.convert`) instead of calling miRTop.
+    
     :param results_folder: file with the output of the sample from each software 
     :param folder: output miRTop folder
     :param name: sample name
@@ -33,29 +39,73 @@ def miRTop_caller(results_folder, mirtop_folder, name, threads, miRNA_gff, hairp
     :param format: 'sRNAbench', 'optimir' or 'seqbuster'
     :param species: species tag ID. Default: hsa (Homo sapiens)
     :param Debug: display complete log.
+    :param annotation: miRNA annotation loaded with :func:`XICRA.scripts.isomir_converter.load_annotation`
     :returns: True/False
     """
+    if annotation:
+        return (isomiR_converter_caller(results_folder, mirtop_folder, name, miRNA_gff, hairpinFasta, 
+                                        format, species, annotation, Debug))
+    
     # check if previously generated and succeeded
     mirtop_folder_gff = functions.files_functions.create_subfolder('gff', mirtop_folder)
     mirtop_folder_stats = functions.files_functions.create_subfolder('stats', mirtop_folder)
     mirtop_folder_counts = functions.files_functions.create_subfolder('counts', mirtop_folder)
-    mirtop_folder_counts = functions.files_functions.create_subfolder('export', mirtop_folder)
+    mirtop_folder_export = functions.files_functions.create_subfolder('export', mirtop_folder)
 
-    filename_stamp = mirtop_folder_counts + '/.success'
-    if os.path.isfile(filename_stamp):
+    ## results of the software are identified by its time stamp
+    filename_stamp = mirtop_folder + '/.success'
+    key = step_cache.step_key([os.path.join(results_folder, '.success'), miRNA_gff, hairpinFasta], 
+                              [format, species], 'miRTop', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'miRTop'), 'yellow'))
     else:
         # Call miRTop
         code_returned = miRTop(results_folder, mirtop_folder, name, threads, format.lower(), miRNA_gff, hairpinFasta, species, Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
         
         return(True)
 
+###############
+def isomiR_converter_caller(results_folder, mirtop_folder, name, miRNA_gff, hairpinFasta, format, species, annotation, Debug):
+    """Converts results of the software into miRTop counts format within XICRA, if not done before.
+
+    :param results_folder: file with the output of the sample from each software 
+    :param mirtop_folder: output miRTop folder
+    :param name: sample name
+    :param miRNA_gff: miRNA gff3 annotation file
+    :param hairpinFasta: hairpin fasta file
+    :param format: 'sRNAbench', 'optimir' or 'seqbuster'
+    :param species: species tag ID. Default: hsa (Homo sapiens)
+    :param annotation: miRNA annotation loaded with :func:`XICRA.scripts.isomir_converter.load_annotation`
+    :param Debug: display complete log.
+    :returns: True/False
+    """
+    mirtop_folder_counts = functions.files_functions.create_subfolder('counts', mirtop_folder)
+    
+    ## results of the software are identified by its time stamp
+    filename_stamp = mirtop_folder + '/.success'
+    key = step_cache.step_key([os.path.join(results_folder, '.success'), miRNA_gff, hairpinFasta], 
+                              [format, species, 'isomir_converter'], None, Debug)
+    if step_cache.previous_results(filename_stamp, key):
+        stamp = functions.time_functions.read_time_stamp(filename_stamp)
+        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'miRTop counts'), 'yellow'))
+        return (True)
+    
+    print ('Creating isomiRs counts for sample %s [%s]' %(name, format))
+    counts_file = isomir_converter.convert(results_folder, os.path.join(mirtop_folder_counts, 'mirtop.tsv'), 
+                                           format, annotation, Debug)
+    if not counts_file:
+        print (colored("\tNo isomiRs detected for sample [%s -- %s]" %(name, format), 'yellow'))
+        return (False)
+    
+    step_cache.save_step(filename_stamp, key)
+    return (True)
+
 ###############
 def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hairpinFasta, species,Debug):
     """Checks if the computation has already been performed. If not, it calls
@@ -85,9 +135,10 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
     mirtop_folder_export = os.path.join(sample_folder, 'export')
     
     ## get info according to software
-    if format == "sRNAbench":
+    if format == "srnabench":
         ## get sRNAbench info
         reads_annot = os.path.join(results_folder, "reads.annotation")
+        results_file = reads_annot
         
         ## check non zero
         if not functions.files_functions.is_non_zero_file(reads_annot):
@@ -98,6 +149,7 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
         ## get optimir info
         gff3_file = functions.main_functions.retrieve_matching_files(os.path.join(results_folder, "OptimiR_Results"), "gff3", Debug)[0]
         results_folder = gff3_file
+        results_file = gff3_file
         
         ## check non zero
         if not functions.files_functions.is_non_zero_file(gff3_file):
@@ -108,6 +160,7 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
         ## get miraligner info
         mirna_file = functions.main_functions.retrieve_matching_files(results_folder, ".mirna", Debug)[0]
         results_folder = mirna_file
+        results_file = mirna_file
         
         ## check non zero
         if not functions.files_functions.is_non_zero_file(mirna_file):
@@ -117,7 +170,8 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
         
     ## miRTop analysis gff
     filename_stamp_gff = mirtop_folder_gff + '/.success'
-    if os.path.isfile(filename_stamp_gff):
+    key_gff = step_cache.step_key([results_file, miRNA_gff, hairpinFasta], [format, species], 'miRTop')
+    if step_cache.previous_results(filename_stamp_gff, key_gff):
         stamp = functions.time_functions.read_time_stamp(filename_stamp_gff)
         print (colored("\tA previous command generated results on: %s [%s -- %s - gff]" %(stamp, name, 'miRTop'), 'yellow'))
     else:
@@ -127,14 +181,15 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
                                                     mirtop_folder_gff, results_folder, logfile)
         
         ## execute
-        code_miRTop = functions.system_call_functions.system_call(cmd)
-        if code_miRTop:
-            functions.time_functions.print_time_stamp(filename_stamp_gff)
+        code_miRTop = instrument.system_call(cmd, step='miRTop', sample=name)
+        if step_cache.succeeded(code_miRTop):
+            step_cache.save_step(filename_stamp_gff, key_gff)
         else:
             return(False)
         
     ## miRTop stats
     mirtop_folder_gff_file = os.path.join(mirtop_folder_gff, 'mirtop.gff')
+    key_gff_file = step_cache.step_key([mirtop_folder_gff_file, miRNA_gff, hairpinFasta], [species], 'miRTop')
 
     #filename_stamp_stats = mirtop_folder_stats + '/.success'
     #if os.path.isfile(filename_stamp_stats):
@@ -151,33 +206,33 @@ def miRTop(results_folder, sample_folder, name, threads, format, miRNA_gff, hair
             
     ## miRTop counts
     filename_stamp_counts = mirtop_folder_counts + '/.success'
-    if os.path.isfile(filename_stamp_counts):
+    if step_cache.previous_results(filename_stamp_counts, key_gff_file):
         stamp = functions.time_functions.read_time_stamp(filename_stamp_counts)
         print (colored("\tA previous command generated results on: %s [%s -- %s - counts]" %(stamp, name, 'miRTop'), 'yellow'))
     else:
         print ('Creating isomiRs counts for sample %s' %name)
         ## if both succeeded
         cmd_stats = miRTop_exe + ' counts -o %s --gff %s --hairpin %s --gtf %s --sps %s 2>> %s' %(mirtop_folder_counts, mirtop_folder_gff_file, hairpinFasta, miRNA_gff, species, logfile)
-        code_miRTop_counts = functions.system_call_functions.system_call(cmd_stats)
+        code_miRTop_counts = instrument.system_call(cmd_stats, step='miRTop', sample=name)
         
-        if code_miRTop_counts:
-            functions.time_functions.print_time_stamp(filename_stamp_counts)
+        if step_cache.succeeded(code_miRTop_counts):
+            step_cache.save_step(filename_stamp_counts, key_gff_file)
         else:
             return(False)
     
     ## miRTop export
     filename_stamp_export = mirtop_folder_export + '/.success'
-    if os.path.isfile(filename_stamp_export):
+    if step_cache.previous_results(filename_stamp_export, key_gff_file):
         stamp = functions.time_functions.read_time_stamp(filename_stamp_export)
         print (colored("\tA previous command generated results on: %s [%s -- %s - export]" %(stamp, name, 'miRTop'), 'yellow'))
     else:
         print ('Creating isomiRs export information for sample %s' %name)
         ## if both succeeded
         cmd_export = miRTop_exe + ' export -o %s --hairpin %s --gtf %s --sps %s --format isomir %s 2> %s' %(mirtop_folder_export, hairpinFasta, miRNA_gff, species, mirtop_folder_gff_file, logfile)
-        code_miRTop_export = functions.system_call_functions.system_call(cmd_export)
+        code_miRTop_export = instrument.system_call(cmd_export, step='miRTop', sample=name)
         
-        if code_miRTop_export:
-            functions.time_functions.print_time_stamp(filename_stamp_export)
+        if step_cache.succeeded(code_miRTop_export):
+            step_cache.save_step(filename_stamp_export, key_gff_file)
         else:
             return(False)
     
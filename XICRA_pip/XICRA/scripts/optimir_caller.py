@@ -19,6 +19,7 @@ from termcolor import colored
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument, scatter
 
 ###############       
 def optimir (reads, outpath, file_name, num_threads, matureFasta, hairpinFasta, miRNA_gff, Debug):
@@ -50,7 +51,7 @@ def optimir (reads, outpath, file_name, num_threads, matureFasta, hairpinFasta,
     ## create command  
     cmd = "%s process --fq %s --gff_out -o %s --maturesFasta %s --hairpinsFasta %s --gff3 %s > %s 2> %s" %(
         optimir_exe, reads[0], outpath, matureFasta, hairpinFasta, miRNA_gff, logfile, errfile)
-    return(functions.system_call_functions.system_call(cmd))
+    return(instrument.system_call(cmd, step='optimir', sample=file_name))
 
 
 ###############       
@@ -73,19 +74,24 @@ def optimir_caller(reads, sample_folder, name, threads, matureFasta, hairpinFast
 
     :returns: True/False
     """
-    # check if previously generated and succeeded
+    # check if previously generated and succeeded with same reads and options
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key(reads + [matureFasta, hairpinFasta, miRNA_gff], [species], 'optimir', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'OptimiR'), 'yellow'))
     else:
-        # Call sRNAbench
-    ## no species option for OptimiR
-        code_returned = optimir(reads, sample_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff,  Debug)
+        # Call optimiR: no species option for OptimiR
+        ## not split into shards: ambiguous alignments are resolved using the 
+        ## expression of the whole sample. Zstd compressed reads are decompressed.
+        code_returned = scatter.scatter_gather(reads, sample_folder, name, 1, 
+                                               lambda shard_input, shard_folder: optimir(shard_input, shard_folder, name, threads, matureFasta, hairpinFasta, miRNA_gff, Debug),
+                                               None, 'fastq', Debug)
         if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
         
     return(True)
+
@@ -18,17 +18,18 @@ import pandas as pd
 from collections import defaultdict
 
 import numpy as np
+import bisect
 from operator import itemgetter
 import sys, csv, os, argparse
 
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument
 from XICRA.scripts import bedtools_caller
 from XICRA.scripts import BAMtoPILFER
 from XICRA.modules import database
 
 import HCGB.functions.aesthetics_functions as HCGB_aes
 import HCGB.functions.files_functions as HCGB_files
-import HCGB.functions.system_call_functions as HCGB_sys
 import HCGB.functions.fasta_functions as HCGB_fasta
 import HCGB.functions.time_functions as HCGB_time
 import HCGB.format_conversion
@@ -47,8 +48,8 @@ def pilfer_merge_samples_call(pilfer_results, pilfer_folder, debug):
     bedtools_exe = set_config.get_exe("bedtools", debug)
     system_merge = "cat %s | awk \'{print $1}\' | tr \':\' \'\\t\' | tr \'-\' \'\\t\' | sort -V -k1,1 -k2,2 | grep -v \'_\' | %s merge > %s" %(clusters_union, bedtools_exe, clusters_bed)
     
-    bed_merge_code = HCGB_sys.system_call(system_merge, False, True)
-    if not bed_merge_code:
+    bed_merge_code = instrument.system_call(system_merge, False, True, step='bedtools')
+    if not step_cache.succeeded(bed_merge_code):
         print(colored("** ERROR: Something happen while calling bedtools merge for piRNA results", "red"))
         exit()
     
@@ -70,16 +71,23 @@ def pilfer_code_merge(bed_file, cluster_file, sample_n, outfile):
     
     Modifications: November 2021
     - Add some comments to understand code and clarify it.
+    
+    Modifications: October 2026
+    - Merged clusters are indexed per chromosome sorted by start (see :func:`XICRA.scripts.pilfer_caller.cluster_index`)
+    - Sample counts are accumulated in a numpy array instead of checking every cluster for each row.
     """
     
-    empty = [0 for x in range(0,sample_n)]
-
     clusters=[]
     for line in open(bed_file, "r"):
         line = line.strip()
-        clusters.append(line.split() + empty)
+        clusters.append(line.split())
+    
+    ## index clusters by chromosome
+    index = cluster_index(clusters)
     
     header=[]
+    hits = []
+    values = []
     for row in open(cluster_file, "r"):
         if row.startswith("__"):
             header=row.strip().split("\t")
@@ -92,25 +100,100 @@ def pilfer_code_merge(bed_file, cluster_file, sample_n, outfile):
         field = row[0].split(":")
         pos = field[1].split("-")
         pos = [int(x) for x in pos]
-        for clust in clusters:
-            if field[0] == clust[0] and int(clust[1]) <= pos[0] and int(clust[2]) >= pos[1]:
-                for i in range(3, sample_n+3):
-                    clust[i] = float(clust[i]) + float(row[i-2])
+        
+        ## merged clusters containing this one
+        for clust in cluster_lookup(index, field[0], pos[0], pos[1]):
+            hits.append(clust)
+            values.append([float(x) for x in row[1:sample_n+1]])
+    
+    ## accumulate sample counts
+    counts = np.zeros((len(clusters), sample_n))
+    if hits:
+        np.add.at(counts, np.array(hits), np.array(values))
+    counts = counts.tolist()
+    
+    ## clusters without any hit keep an integer 0 count as before
+    found = set(hits)
     
     outfile_hd = open(outfile, "w")
     outfile_hd.write("\t".join(header))
     outfile_hd.write("\n")
-    for row in clusters:
-        row[0] = row[0] + ":" + str(row[1]) + "-" + str(row[2])
-        del row[1:3]
+    for idx, row in enumerate(clusters):
+        row_name = row[0] + ":" + str(row[1]) + "-" + str(row[2])
+        if idx in found:
+            row_values = counts[idx]
+        else:
+            row_values = [0 for x in range(0,sample_n)]
         
-        outfile_hd.write("\t".join(str(elem) for elem in row))
+        outfile_hd.write("\t".join(str(elem) for elem in [row_name] + row[3:] + row_values))
         outfile_hd.write("\n")
     
     outfile_hd.close()
 
     return(True)
 
+###########################################
+def cluster_index(clusters):
+    """
+    Indexes merged clusters by chromosome.
+    
+    For each chromosome, returns cluster starts sorted, the cluster ends and 
+    positions in the same order, and the running maximum of the ends, so that
+    :func:`XICRA.scripts.pilfer_caller.cluster_lookup` can stop as soon as no 
+    previous cluster reaches the end of the query.
+    
+    :param clusters: List of clusters as [chromosome, start, end].
+    :type clusters: list
+    
+    :returns: Dictionary of chromosome: (starts, ends, max_ends, positions)
+    """
+    by_chrom = defaultdict(list)
+    for idx, clust in enumerate(clusters):
+        by_chrom[clust[0]].append((int(clust[1]), int(clust[2]), idx))
+    
+    index = {}
+    for chrom, intervals in by_chrom.items():
+        intervals.sort()
+        starts = [x[0] for x in intervals]
+        ends = [x[1] for x in intervals]
+        positions = [x[2] for x in intervals]
+        max_ends = np.maximum.accumulate(ends).tolist()
+        index[chrom] = (starts, ends, max_ends, positions)
+    
+    return (index)
+
+###########################################
+def cluster_lookup(index, chrom, start, end):
+    """
+    Returns positions of the clusters containing the interval given.
+    
+    :param index: Clusters index generated by :func:`XICRA.scripts.pilfer_caller.cluster_index`.
+    :param chrom: Chromosome.
+    :param start: Start of the interval.
+    :param end: End of the interval.
+    
+    :type index: dict
+    :type chrom: string
+    :type start: int
+    :type end: int
+    
+    :returns: List of cluster positions, in input order.
+    """
+    if chrom not in index:
+        return ([])
+    
+    starts, ends, max_ends, positions = index[chrom]
+    
+    ## clusters starting before or at start
+    found = []
+    i = bisect.bisect_right(starts, start) - 1
+    while i >= 0 and max_ends[i] >= end:
+        if ends[i] >= end:
+            found.append(positions[i])
+        i -= 1
+    
+    return (sorted(found))
+
 ##########################################################3
 def pilfer_code_union(list_samples_dict, outfile):
     """
@@ -164,6 +247,11 @@ def pilfer_code(infile, outfile):
     - Add some comments to understand code and clarify it.
     - Add to read BED file 
     
+    Modifications: October 2026
+    - Reads are stored as arrays per chromosome, sorted by start coordinate as string (as before).
+    - Initial 100 kb window is scored with numpy masks instead of a python loop over the whole chromosome.
+    - Row indexes are precomputed instead of using list.index().
+    
     """
     
     ## Input example
@@ -180,6 +268,7 @@ def pilfer_code(infile, outfile):
     
     #Variables
     sd_factor=3 ## "The factor by which the read should be away from standard deviation to be called a peak"
+    window=100000 ## 100 kb window
     count_reads = []
     chrom_dict = {}
     results = []
@@ -197,57 +286,67 @@ def pilfer_code(infile, outfile):
             chrom_dict[field[0]].append(field)
         else:
             chrom_dict[field[0]] = [field]
+    infile_pt.close()
         
     #Mean and SD calculations
     mean = np.mean(count_reads)
     sd = np.std(count_reads)
     
-    #Sorting the dictionary
-    for key in chrom_dict:
-        chrom_dict[key] = sorted(chrom_dict[key],key=itemgetter(1))
-    #del chrom_dict['chrY']
-    
-    #print "Chromosome\tStart\tEnd\tScore"
     #Cluster calculation
-    
-    ## Fix error when I changed row -> field
-    ##if (row[4] - mean)/sd >= sd_factor:
-    ##    numpy.core._exceptions.UFuncTypeError: ufunc 'subtract' did not contain a loop with signature matching types (dtype('<U1'), dtype('float64')) -> None
-
     for key in chrom_dict:
+        
+        ## Sorting by start coordinate as string (stable: ties keep input order)
+        rows = sorted(chrom_dict[key], key=itemgetter(1))
+        starts = np.array([int(field[1]) for field in rows], dtype=np.int64)
+        counts = np.array([int(field[4]) for field in rows], dtype=np.int64)
+        n_rows = len(rows)
+        
+        ## peaks: reads away from mean by sd_factor
+        with np.errstate(divide='ignore', invalid='ignore'):
+            peaks = ((counts - mean)/sd >= sd_factor).tolist()
+        
+        ## first index of each row (as list.index(row) in original code)
+        first_index = {}
+        row_index = [first_index.setdefault(tuple(field), i) for i, field in enumerate(rows)]
+        
+        start_list = starts.tolist()
+        count_list = counts.tolist()
+        
         j = 0
-        while j < len(chrom_dict[key]):
-            row = chrom_dict[key][j]
-            if ((int(row[4]) - mean)/sd >= sd_factor):
-                start_bp = int(row[2]) - 100000
+        while j < n_rows:
+            if peaks[j]:
+                start_bp = int(rows[j][2]) - window
                 if start_bp < 0:
                     start_bp = 0
-                end_bp = int(row[2])
-                score = 0
-                new_score = 0
-                start_read_index = -1
-                end_read_index = 0
                 
-                cur_read_index = chrom_dict[key].index(row)
-    
-                #Calculate the initial score and start index
-                for read in chrom_dict[key]:
-                    if int(read[1]) >= int(start_bp) and int(read[1]) <= int(start_bp) + 100000:
-                        score += int(read[4])
-                        if start_read_index == -1:
-                            start_read_index = chrom_dict[key].index(read)
-                            start_bp = int(read[1])
-                        end_read_index = chrom_dict[key].index(read)
-    
+                cur_read_index = row_index[j]
+                
+                #Calculate the initial score and start index: window starts 
+                #at the first read found within start_bp and start_bp + window
+                in_window = (starts >= start_bp) & (starts <= start_bp + window)
+                if in_window.any():
+                    first_read = int(np.argmax(in_window))
+                    start_bp = start_list[first_read]
+                    in_window = (starts[first_read+1:] >= start_bp) & (starts[first_read+1:] <= start_bp + window)
+                    score = count_list[first_read] + int(counts[first_read+1:][in_window].sum())
+                    last_read = first_read
+                    if in_window.any():
+                        last_read = first_read + 1 + int(np.flatnonzero(in_window)[-1])
+                    start_read_index = row_index[first_read]
+                    end_read_index = row_index[last_read]
+                else:
+                    score = 0
+                    start_read_index = -1
+                    end_read_index = 0
+                
                 new_score = score
                 max_start = start_read_index
                 max_end = end_read_index
                 #calculating optimum 100KB window
-                ##for i in xrange(start_read_index+1,cur_read_index+1): ## xrange not available in python3
                 for i in range(start_read_index+1,cur_read_index+1): 
-                    new_score = score - int(chrom_dict[key][i-1][4])
-                    while  end_read_index+1 < len(chrom_dict[key]) and int(chrom_dict[key][end_read_index +1][1]) <= int(chrom_dict[key][i][1]) + 100000 :
-                        new_score += int(chrom_dict[key][end_read_index+1][4])
+                    new_score = score - count_list[i-1]
+                    while end_read_index+1 < n_rows and start_list[end_read_index+1] <= start_list[i] + window:
+                        new_score += count_list[end_read_index+1]
                         end_read_index += 1
                     
                     if new_score > score:
@@ -255,11 +354,11 @@ def pilfer_code(infile, outfile):
                         max_start = i
                         max_end = end_read_index
     
-                #print (key + ":" + str(chrom_dict[key][max_start][1]) + "-" + str(chrom_dict[key][max_end][2]) + "\t" + str(score)) ## pilfer default format
-                if int(chrom_dict[key][max_start][1]) < int(chrom_dict[key][max_end][2]):
-                    string2print = "chr" + key + ":" + str(chrom_dict[key][max_start][1]) + "-" + str(chrom_dict[key][max_end][2]) + "\t" + str(score) + '\t+\n' ## bed format
+                #print (key + ":" + str(rows[max_start][1]) + "-" + str(rows[max_end][2]) + "\t" + str(score)) ## pilfer default format
+                if int(rows[max_start][1]) < int(rows[max_end][2]):
+                    string2print = "chr" + key + ":" + str(rows[max_start][1]) + "-" + str(rows[max_end][2]) + "\t" + str(score) + '\t+\n' ## bed format
                 else:
-                    string2print = "chr" + key + ":" + str(chrom_dict[key][max_end][1]) + "-" + str(chrom_dict[key][max_start][2]) + "\t" + str(score) + '\t-\n' ## bed format
+                    string2print = "chr" + key + ":" + str(rows[max_end][1]) + "-" + str(rows[max_start][2]) + "\t" + str(score) + '\t-\n' ## bed format
                     
                 results.append(string2print)
                 j = max_end
@@ -285,6 +384,10 @@ def annotate_sam(seq_id, sam_file, Debug):
     - Add some comments to understand code and clarify it.
     - Add to read fasta file as dict and not as list as provided. 
     
+    Modifications: October 2026
+    - seq_id is a set of gold piRNA sequences (see :func:`XICRA.modules.database.piRNA_gold_index`)
+    - Each record is annotated using :func:`XICRA.scripts.pilfer_caller.annotate_sam_record`
+    
     This particular scripts uses input in sam format and a file with gold piRNA sequences to identify putative and well-knonw piRNAs.
     
     """
@@ -293,49 +396,119 @@ def annotate_sam(seq_id, sam_file, Debug):
     sam_file_out = sam_file + ".parsed"
     sam_file_write = open(sam_file_out, "w")
     
-    fileReader = open(sam_file, 'r')
+    #csvin = csv.reader(fileReader, delimiter="\t")
+    #csvout = csv.writer(sam_file_write, delimiter="\t")
+    for row in open(sam_file):
+        record = annotate_sam_record(row, seq_id)
+        if record:
+            sam_file_write.write(record)
+        
+    ## close files
+    sam_file_write.close()
+
+##########################################################3
+def annotate_sam_record(row, seq_id):
+    """
+    Annotates a single SAM record as known piRNA (PI), putative piRNA (PU) or none.
     
+    See original code and details in :func:`XICRA.scripts.pilfer_caller.annotate_sam`.
+    
+    :param row: SAM record (line)
+    :param seq_id: Set of gold piRNA sequences
+    
+    :returns: Annotated SAM record (line) or None for SAM header lines.
+    """
+    ## Original
+    #f = row[0].split(":")
+    #row[0] = f[1]
+    field=row.strip().split('\t')
+
+    ## take into account sam header
+    if (field[0].startswith('@')):
+        #sam_file_write.write(row)
+        return None
+
+    ## Set putative (PU), known piRNA (PI) or none
+    tag = piRNA_tag(field[9], int(field[1]) & (0x10), seq_id)
+    if tag:
+        field.append("XP:Z:" + tag)
+        field[9] = field[9] + '::' + tag
+    
+    ## append length in all
+    field.append("XC:i:"+str(len(field[9].split('::')[0])))
+
+    return ("\t".join(field) + "\n")
+
+##########################################################3
+def piRNA_tag(seq, reverse, seq_id):
+    """
+    Returns known piRNA (PI), putative piRNA (PU) or None for a read sequence.
+    
+    :param seq: Read sequence as stored in SAM/BAM (reverse complemented if mapped in reverse strand)
+    :param reverse: True if read mapped in reverse strand (flag 0x10)
+    :param seq_id: Set of gold piRNA sequences
+    
+    :returns: PI, PU or None
+    """
     ## Give a minimum and maximum length
     mini = 26
     maxi = 33
     
-    #csvin = csv.reader(fileReader, delimiter="\t")
-    #csvout = csv.writer(sam_file_write, delimiter="\t")
-    for row in open(sam_file):
-        ## Original
-        #f = row[0].split(":")
-        #row[0] = f[1]
-        field=row.strip().split('\t')
+    if reverse:
+        seq_known = HCGB_fasta.ReverseComplement(seq)
+    else:
+        seq_known = seq
 
-        ## take into account sam header
-        if (field[0].startswith('@')):
-            #sam_file_write.write(row)
-            continue
+    if seq_known in seq_id:
+        return ('PI')
+    
+    #elif len(row[9])>=mini and len(field[9])<=maxi and int(f[0])>=100:
+    if len(seq)>=mini and len(seq)<=maxi:
+        return ('PU')
+    
+    #else:
+    ## too big or not known piRNA 
+    return None
 
-        seq = field[9]
-        
-        if (int(field[1]) & (0x10)):
-            seq = HCGB_fasta.ReverseComplement(seq)
-        
-        ## Set putative (PU), known piRNA (PI) or none
-        if seq in seq_id:
-            field.append("XP:Z:PI")
-            field[9] = field[9] + '::PI'
-        #elif len(row[9])>=mini and len(field[9])<=maxi and int(f[0])>=100:
-        elif len(field[9])>=mini and len(field[9])<=maxi:
-            field.append("XP:Z:PU")
-            field[9] = field[9] + '::PU'
-        #else:
-        ## too big or not known piRNA 
-        
-        ## append length in all
-        field.append("XC:i:"+str(len(seq)))
+##########################################################3
+## gold piRNA sequences for annotate_sam_chunk process workers.
+## Set once per worker by init_annotate_worker: when processes are forked 
+## it is shared copy-on-write with the main process.
+gold_seq_id = set()
+
+def init_annotate_worker(seq_id):
+    """
+    Initializes each process worker with the gold piRNA sequences set.
+    """
+    global gold_seq_id
+    gold_seq_id = seq_id
+
+##########################################################3
+def annotate_sam_chunk(sam_file, start, end):
+    """
+    Annotates SAM records within a byte range of the SAM file provided.
     
-        sam_file_write.write("\t".join(field) + "\n")
-        
-    ## close files
-    sam_file_write.close()
-    fileReader.close()
+    Byte range must be aligned to line boundaries (see :func:`XICRA.scripts.BAMtoPILFER.sam_byte_ranges`).
+    Gold piRNA sequences are retrieved from the process worker (see :func:`XICRA.scripts.pilfer_caller.init_annotate_worker`).
+    
+    :param sam_file: Absolute path to SAM file.
+    :param start: First byte of the range.
+    :param end: Last byte (not included) of the range.
+    
+    :returns: String containing annotated SAM records.
+    """
+    records = []
+    with open(sam_file, 'rb') as sam_hd:
+        sam_hd.seek(start)
+        while sam_hd.tell() < end:
+            row = sam_hd.readline()
+            if not row:
+                break
+            record = annotate_sam_record(row.decode(), gold_seq_id)
+            if record:
+                records.append(record)
+    
+    return ("".join(records))
 
 ##########################################################
 
@@ -374,9 +547,10 @@ def pilfer_caller(sample_folder, name, bam_file, annot_info, threads, Debug):
 #######################################################
 def pilfer_module_call(sample_folder, name, bam_file, database_folder, threads, species, Debug):
     
-    ## check if previously trimmed and succeeded
+    ## check if previously done and succeeded with same BAM and database
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key([bam_file], [database_folder, species], None, Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = HCGB_time.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'pilfer'), 'yellow'))
         return(True)
@@ -386,7 +560,7 @@ def pilfer_module_call(sample_folder, name, bam_file, database_folder, threads,
         annot_info = database.piRNA_info(database_folder, species, Debug)
         code_returned = pilfer_caller(sample_folder, name, bam_file, annot_info, threads, Debug)
         if code_returned:
-            HCGB_time.print_time_stamp(filename_stamp)
+            step_cache.save_step(filename_stamp, key)
         else:
             print ('** Sample %s failed...' %name)
 
@@ -19,6 +19,7 @@ from termcolor import colored
 ## import my modules
 from HCGB import functions
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, java_worker
 
 
 ###############
@@ -38,16 +39,17 @@ def sRNAbench_caller(reads, sample_folder, name, threads, species, Debug):
 
     :returns: True/False
     """
-    # check if previously generated and succeeded
+    # check if previously generated and succeeded with same reads and options
     filename_stamp = sample_folder + '/.success'
-    if os.path.isfile(filename_stamp):
+    key = step_cache.step_key(reads, [species], 'sRNAbench', Debug)
+    if step_cache.previous_results(filename_stamp, key):
         stamp = functions.time_functions.read_time_stamp(filename_stamp)
         print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, name, 'sRNAbench'), 'yellow'))
     else:
         # Call sRNAbench
         code_returned = sRNAbench(reads, sample_folder, name, threads, species, Debug)
-        if code_returned:
-            functions.time_functions.print_time_stamp(filename_stamp)
+        if step_cache.succeeded(code_returned):
+            step_cache.save_step(filename_stamp, key)
         else:
             print ('** Sample %s failed...' %name)
             return(False)
@@ -60,7 +62,7 @@ def sRNAbench (reads, outpath, file_name, num_threads, species, Debug):
 
     Checks if the reads are joined and builds the sRNAbench command to execute it. 
     
-    :param reads: file with sample reads
+    :param reads: file with sample reads or collapsed reads (.rc, sequence<tab>count)
     :param outpath: output folder
     :param file_name: sample name
     :param num_threads: selected threads (by defoult 2)
@@ -85,11 +87,12 @@ def sRNAbench (reads, outpath, file_name, num_threads, species, Debug):
         print (colored("** ERROR: Only 1 fastq file is allowed please joined reads before...", 'red'))
         exit()
     
-    ## create command    
-    java_exe = set_config.get_exe('java', Debug=Debug)
-    cmd = '%s -jar %s dbPath=%s input=%s output=%s' %(java_exe, sRNAbench_exe, sRNAbench_db, reads[0], outpath)  
-    cmd = cmd + ' microRNA=%s isoMiR=true plotLibs=true graphics=true' %species 
-    cmd = cmd + ' plotMiR=true bedGraphMode=true writeGenomeDist=true'
-    cmd = cmd + ' chromosomeLevel=true chrMappingByLength=true > ' + logfile 
+    ## create command: heap according to the sample size
+    args = ['dbPath=' + sRNAbench_db, 'input=' + reads[0], 'output=' + outpath]
+    args += ['microRNA=' + species, 'isoMiR=true', 'plotLibs=true', 'graphics=true']
+    args += ['plotMiR=true', 'bedGraphMode=true', 'writeGenomeDist=true']
+    args += ['chromosomeLevel=true', 'chrMappingByLength=true']
+    heap_MB = java_worker.java_heap(reads)
     
-    return(functions.system_call_functions.system_call(cmd))
+    return(java_worker.java_call(sRNAbench_exe, args, stdout_file=logfile, heap_MB=heap_MB, 
+                                 step='sRNAbench', sample=file_name, Debug=Debug))
@@ -15,9 +15,9 @@ import argparse
 from termcolor import colored
 
 from XICRA.config import set_config
+from XICRA.other_tools import step_cache, instrument
 import HCGB.functions.aesthetics_functions as HCGB_aes
 import HCGB.functions.files_functions as HCGB_files
-import HCGB.functions.system_call_functions as HCGB_sys
 import HCGB.functions.time_functions as HCGB_time
 
 ###################################################
@@ -36,8 +36,14 @@ def bam2sam(sample, input_file, path_given, ncpu, options, sam2bam=False, Debug=
     if not path_given:
         path_given = os.path.dirname(bam_file)
     
-    filename_stamp = path_given + '/.convert_bam2sam_success'
-    if os.path.isfile(filename_stamp):
+    ## files given in options (e.g. -N list of reads) are also inputs
+    if sam2bam:
+        filename_stamp = path_given + '/.' + sample + '_convert_sam2bam_success'
+    else:
+        filename_stamp = path_given + '/.' + sample + '_convert_bam2sam_success'
+    inputs = [input_file] + [x for x in str(options).split() if os.path.isfile(x)]
+    key = step_cache.step_key(inputs, [options, sam2bam], 'samtools')
+    if step_cache.previous_results(filename_stamp, key):
         if HCGB_files.is_non_zero_file(outfile):
             stamp = HCGB_time.read_time_stamp(filename_stamp)
             print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, sample, 'samtools view conversion'), 'yellow'))
@@ -54,11 +60,11 @@ def bam2sam(sample, input_file, path_given, ncpu, options, sam2bam=False, Debug=
         cmd_samtools = cmd_samtools + " -b"
     
     cmd_samtools = cmd_samtools + " " + input_file
-    samtools_code = HCGB_sys.system_call(cmd_samtools, False, True)
+    samtools_code = instrument.system_call(cmd_samtools, False, True, step='samtools', sample=sample)
 
-    if samtools_code:
+    if step_cache.succeeded(samtools_code):
         ## print time stamp
-        HCGB_time.print_time_stamp(filename_stamp)
+        step_cache.save_step(filename_stamp, key)
     
         return (outfile)
 
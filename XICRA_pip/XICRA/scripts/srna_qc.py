@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+##########################################################
+## Jose F. Sanchez                                        ##
+## Copyright (C) 2019 Lauro Sumoy Lab, IGTP, Spain        ##
+##########################################################
+'''
+Quality check of small RNA reads.
+
+Statistics are accumulated using NumPy over batches of reads: read length distribution,
+per-position quality, base and N content, GC content, adapter and poly-A content. Duplication
+levels and overrepresented sequences are computed on the collapsed reads
+(see :class:`XICRA.scripts.collapse_reads.Collapser`).
+
+Results are saved as FastQC does (``<file>_fastqc/fastqc_data.txt`` and ``summary.txt``,
+FastQC 0.11.9 format) so MultiQC reports them as FastQC results.
+'''
+## useful imports
+import os
+import re
+import itertools
+import concurrent.futures
+import numpy as np
+from termcolor import colored
+
+## import my modules
+from HCGB import functions
+from XICRA.other_tools import step_cache, intermediate
+from XICRA.scripts import collapse_reads
+
+## reads processed in each batch
+batch_size = 50000
+
+## adapters searched by default: first bases of each adapter are searched (as FastQC)
+adapter_kmer = 12
+default_adapters = [("Illumina Universal Adapter", "AGATCGGAAGAG"),
+                    ("Illumina Small RNA 3' Adapter", "TGGAATTCTCGG"),
+                    ("Illumina Small RNA 5' Adapter", "GATCGTCGGACT"),
+                    ("Nextera Transposase Sequence", "CTGTCTCTTATA"),
+                    ("PolyA", "AAAAAAAAAAAA"),
+                    ("PolyG", "GGGGGGGGGGGG")]
+
+## index of each base: G, A, T, C (order of FastQC report) and N or other
+_bases = 'GATC'
+_base_index = np.full(256, 4, dtype=np.intp)
+for i, base in enumerate(_bases.encode()):
+    _base_index[base] = i
+
+## duplication levels reported (as FastQC)
+_duplication_levels = [(str(level), level) for level in range(1, 10)] + [
+    ('>10', 10), ('>50', 50), ('>100', 100), ('>500', 500), ('>1k', 1000), ('>5k', 5000), ('>10k+', 10000)]
+
+###############
+def adapters_list(adapters=None):
+    """Returns adapters to search: default adapters and adapters provided, if not included.
+
+    :param adapters: adapter sequences provided (e.g. trimmed adapters)
+
+    :returns: List of (name, sequence).
+    """
+    search = list(default_adapters)
+    for i, adapter in enumerate(adapters or []):
+        if adapter and adapter[:adapter_kmer] not in [seq for name, seq in search]:
+            search.append(("Adapter %s" %(i+1), adapter[:adapter_kmer].upper()))
+    return (search)
+
+def _grow(array, length):
+    ## pads first axis of array with zeros up to length
+    if array.shape[0] >= length:
+        return (array)
+    return (np.concatenate((array, np.zeros((length - array.shape[0],) + array.shape[1:], dtype=array.dtype))))
+
+###############
+class ReadStats():
+    """Statistics of reads, accumulated for each batch of reads.
+
+    Quality values are counted as ASCII characters: the encoding is set once all reads are processed.
+
+    :param adapters: list of (name, sequence) to search
+    :param tmp_dir: folder for temporary files of the collapsed reads
+    """
+    def __init__(self, adapters, tmp_dir):
+        self.adapters = adapters
+        self.patterns = [re.compile(re.escape(seq)) for name, seq in adapters]
+        self.total_reads = 0
+        self.min_qual = 255
+        self.length_counts = np.zeros(1, dtype=np.int64)
+        self.qual_counts = np.zeros((0, 128), dtype=np.int64)            ## position x quality
+        self.base_counts = np.zeros((0, 5), dtype=np.int64)              ## position x G, A, T, C, N
+        self.adapter_counts = np.zeros((0, len(adapters)), dtype=np.int64) ## start position x adapter
+        self.gc_counts = np.zeros(101, dtype=np.int64)
+        self.mean_qual_counts = np.zeros(128, dtype=np.int64)
+        self.collapser = collapse_reads.Collapser(tmp_dir)
+
+    def add(self, seq_lines, qual_lines):
+        """Adds a batch of reads: sequence and quality lines (ending with newline)."""
+        seq_text = ''.join(seq_lines)
+        seqs = np.frombuffer(seq_text.encode('ascii'), dtype=np.uint8)
+        quals = np.frombuffer(''.join(qual_lines).encode('ascii'), dtype=np.uint8)
+
+        ## reads delimited by newlines: same layout for sequences and qualities
+        ends = np.flatnonzero(seqs == 10)
+        if quals.size != seqs.size or np.any(quals[ends] != 10):
+            raise ValueError("Sequence and quality lengths differ")
+        lengths = np.diff(ends, prepend=-1) - 1
+        starts = ends - lengths
+        in_read = seqs != 10
+        positions = (np.arange(seqs.size) - np.repeat(starts, lengths + 1))[in_read]
+        bases = _base_index[seqs[in_read]]
+        qual = quals[in_read] & 127
+        max_len = int(lengths.max())
+        if qual.size:
+            self.min_qual = min(self.min_qual, int(qual.min()))
+
+        ## counts by read length and position
+        self.length_counts = _grow(self.length_counts, max_len + 1)
+        self.length_counts[:max_len + 1] += np.bincount(lengths, minlength=max_len + 1)
+        self.qual_counts = _grow(self.qual_counts, max_len)
+        self.qual_counts[:max_len] += np.bincount(positions * 128 + qual, minlength=max_len * 128).reshape(max_len, 128)
+        self.base_counts = _grow(self.base_counts, max_len)
+        self.base_counts[:max_len] += np.bincount(positions * 5 + bases, minlength=max_len * 5).reshape(max_len, 5)
+
+        ## GC content and mean quality of each read
+        read_ends = np.cumsum(lengths)
+        read_starts = read_ends - lengths
+        with_bases = lengths > 0
+        gc_sum = np.concatenate(([0], np.cumsum((bases == 0) | (bases == 3))))
+        gc = (gc_sum[read_ends] - gc_sum[read_starts])[with_bases]
+        self.gc_counts += np.bincount(np.rint(100 * gc / lengths[with_bases]).astype(np.intp), minlength=101)
+        qual_sum = np.concatenate(([0], np.cumsum(qual, dtype=np.int64)))
+        mean_qual = (qual_sum[read_ends] - qual_sum[read_starts])[with_bases] // lengths[with_bases]
+        self.mean_qual_counts += np.bincount(mean_qual, minlength=128)
+
+        ## adapters: first match in each read
+        self.adapter_counts = _grow(self.adapter_counts, max_len)
+        for i, pattern in enumerate(self.patterns):
+            matches = np.fromiter((match.start() for match in pattern.finditer(seq_text)), dtype=np.intp)
+            if not matches.size:
+                continue
+            reads = np.searchsorted(ends, matches)
+            (reads, first) = np.unique(reads, return_index=True)
+            self.adapter_counts[:max_len, i] += np.bincount(matches[first] - starts[reads], minlength=max_len)
+
+        self.collapser.add(seq_text[:-1].split('\n'))
+        self.total_reads += lengths.size
+
+###############
+def read_batches(fastq_file):
+    """Yields batches of reads: sequence and quality lines.
+
+    :param fastq_file: fastq file (plain, gzip or zstd compressed)
+    """
+    reads_hd = intermediate.open_reads(fastq_file)
+    try:
+        while True:
+            lines = list(itertools.islice(reads_hd, 4 * batch_size))
+            if not lines:
+                break
+            if len(lines) % 4:
+                raise ValueError("Truncated fastq file: %s" %fastq_file)
+            if not lines[-1].endswith('\n'):
+                lines[-1] += '\n'
+            yield (lines[1::4], lines[3::4])
+    finally:
+        reads_hd.close()
+
+def qc_name(fastq_file):
+    """Returns the name of the report of a file (as FastQC: file name without extensions)."""
+    return (re.sub(r'(\.fastq|\.fq)?(\.gz|\.zst)?$', '', os.path.basename(fastq_file), count=1))
+
+def qc_file(fastq_file, path, adapters=None):
+    """Quality check of a fastq file. Creates ``<name>_fastqc/fastqc_data.txt`` and ``summary.txt``.
+
+    :param fastq_file: fastq file (plain, gzip or zstd compressed)
+    :param path: output folder
+    :param adapters: adapter sequences to search, in addition to default adapters
+
+    :returns: Folder with results
+    """
+    folder = functions.files_functions.create_subfolder(qc_name(fastq_file) + '_fastqc', path)
+    stats = ReadStats(adapters_list(adapters), folder)
+    try:
+        for (seq_lines, qual_lines) in read_batches(fastq_file):
+            stats.add(seq_lines, qual_lines)
+        modules = report(stats, os.path.basename(fastq_file))
+    finally:
+        stats.collapser.clear()
+
+    with open(os.path.join(folder, 'fastqc_data.txt'), 'w') as data_hd:
+        data_hd.write("##FastQC\t0.11.9\n")
+        for (module, status, header, rows) in modules:
+            data_hd.write(">>%s\t%s\n" %(module, status))
+            data_hd.write("".join("\t".join(str(value) for value in row) + "\n" for row in header + rows))
+            data_hd.write(">>END_MODULE\n")
+    with open(os.path.join(folder, 'summary.txt'), 'w') as summary_hd:
+        for (module, status, header, rows) in modules:
+            summary_hd.write("%s\t%s\t%s\n" %(status.upper(), module, os.path.basename(fastq_file)))
+    return (folder)
+
+###############
+def _status(value, warn, fail, lower=False):
+    ## pass/warn/fail for a value higher (or lower) than thresholds
+    if lower:
+        (value, warn, fail) = (-value, -warn, -fail)
+    if value > fail:
+        return ('fail')
+    if value > warn:
+        return ('warn')
+    return ('pass')
+
+def _worst(*status):
+    return (max(status, key=['pass', 'warn', 'fail'].index))
+
+def _round(values):
+    return ([round(float(value), 2) for value in values])
+
+def report(stats, file_name):
+    """Returns modules of the report as FastQC: list of (module, status, header rows, rows).
+
+    Thresholds for warnings and failures are the default thresholds of FastQC.
+
+    :param stats: :class:`ReadStats` of a file
+    :param file_name: name of the file
+    """
+    modules = []
+    total = stats.total_reads
+    lengths = np.flatnonzero(stats.length_counts)
+    offset = 64 if stats.min_qual >= 64 else 33
+    bases = stats.base_counts.sum(axis=0)
+
+    ## basic statistics
+    seq_length = "%s-%s" %(lengths.min(), lengths.max()) if lengths.size > 1 else str(lengths.max() if lengths.size else 0)
+    rows = [['Filename', file_name], ['File type', 'Conventional base calls'],
+            ['Encoding', 'Sanger / Illumina 1.9' if offset == 33 else 'Illumina 1.5'],
+            ['Total Sequences', total], ['Sequences flagged as poor quality', 0],
+            ['Sequence length', seq_length],
+            ['%GC', int(100 * (bases[0] + bases[3]) / max(1, bases[:4].sum()))]]
+    modules.append(('Basic Statistics', 'pass', [['#Measure', 'Value']], rows))
+
+    ## per base sequence quality: percentiles from counts of each quality
+    quals = np.arange(128) - offset
+    counts = stats.qual_counts
+    depth = np.maximum(counts.sum(axis=1), 1)
+    cumulative = np.cumsum(counts, axis=1)
+    percentile = {p: quals[np.argmax(cumulative >= p * depth[:, None], axis=1)] for p in (0.1, 0.25, 0.5, 0.75, 0.9)}
+    mean = (counts * quals).sum(axis=1) / depth
+    rows = [[i + 1] + _round(values) for i, values in
+            enumerate(zip(mean, percentile[0.5], percentile[0.25], percentile[0.75], percentile[0.1], percentile[0.9]))]
+    status = 'pass'
+    if counts.size:
+        status = _worst(_status(percentile[0.25].min(), 10, 5, lower=True), _status(percentile[0.5].min(), 25, 20, lower=True))
+    modules.append(('Per base sequence quality', status,
+                    [['#Base', 'Mean', 'Median', 'Lower Quartile', 'Upper Quartile', '10th Percentile', '90th Percentile']], rows))
+
+    ## per sequence quality scores
+    mean_quals = np.flatnonzero(stats.mean_qual_counts)
+    rows = [[quals[q], stats.mean_qual_counts[q]] for q in mean_quals]
+    status = _status(quals[np.argmax(stats.mean_qual_counts)], 27, 20, lower=True) if mean_quals.size else 'pass'
+    modules.append(('Per sequence quality scores', status, [['#Quality', 'Count']], rows))
+
+    ## per base sequence content (G, A, T, C) and N content
+    called = np.maximum(stats.base_counts[:, :4].sum(axis=1), 1)
+    content = 100 * stats.base_counts[:, :4] / called[:, None]
+    rows = [[i + 1] + _round(values) for i, values in enumerate(content)]
+    difference = max(np.abs(content[:, 0] - content[:, 3]).max(), np.abs(content[:, 1] - content[:, 2]).max()) if rows else 0
+    modules.append(('Per base sequence content', _status(difference, 10, 20), [['#Base'] + list(_bases)], rows))
+
+    ## per sequence GC content: deviation from a normal distribution
+    gc = np.arange(101)
+    gc_total = max(1, stats.gc_counts.sum())
+    gc_mean = (stats.gc_counts * gc).sum() / gc_total
+    gc_sd = np.sqrt((stats.gc_counts * (gc - gc_mean) ** 2).sum() / gc_total)
+    theoretical = np.exp(-0.5 * ((gc - gc_mean) / max(gc_sd, 1)) ** 2)
+    theoretical = theoretical * gc_total / theoretical.sum()
+    deviation = 100 * np.abs(stats.gc_counts - theoretical).sum() / gc_total
+    rows = [[i, float(count)] for i, count in enumerate(stats.gc_counts)]
+    modules.append(('Per sequence GC content', _status(deviation, 15, 30), [['#GC Content', 'Count']], rows))
+
+    n_content = 100 * stats.base_counts[:, 4] / np.maximum(stats.base_counts.sum(axis=1), 1)
+    rows = [[i + 1] + _round([value]) for i, value in enumerate(n_content)]
+    modules.append(('Per base N content', _status(n_content.max() if rows else 0, 5, 20), [['#Base', 'N-Count']], rows))
+
+    ## sequence length distribution
+    rows = [[length, float(stats.length_counts[length])] for length in lengths]
+    status = 'fail' if stats.length_counts[0] else ('warn' if lengths.size > 1 else 'pass')
+    modules.append(('Sequence Length Distribution', status, [['#Length', 'Count']], rows))
+
+    ## duplication levels and overrepresented sequences on collapsed reads
+    unique_levels = np.zeros(len(_duplication_levels), dtype=np.int64)
+    reads_levels = np.zeros(len(_duplication_levels), dtype=np.int64)
+    lowest = [low for (label, low) in _duplication_levels]
+    overrepresented = []
+    unique_seqs = 0
+    for seq, count in stats.collapser.items():
+        level = np.searchsorted(lowest, count, side='right') - 1
+        unique_levels[level] += 1
+        reads_levels[level] += count
+        unique_seqs += 1
+        if count * 1000 > total:
+            overrepresented.append((count, seq))
+
+    dedup = 100 * unique_seqs / max(1, total)
+    rows = [[label] + _round([100 * unique_levels[i] / max(1, unique_seqs), 100 * reads_levels[i] / max(1, total)])
+            for i, (label, low) in enumerate(_duplication_levels)]
+    modules.append(('Sequence Duplication Levels', _status(dedup, 80, 50, lower=True),
+                    [['#Total Deduplicated Percentage', round(dedup, 2)],
+                     ['#Duplication Level', 'Percentage of deduplicated', 'Percentage of total']], rows))
+
+    rows = []
+    for count, seq in sorted(overrepresented, reverse=True):
+        source = [name for name, adapter in stats.adapters if adapter in seq]
+        rows.append([seq, count, round(100 * count / total, 4), source[0] if source else 'No Hit'])
+    status = 'pass'
+    if rows:
+        status = _status(rows[0][2], 0.1, 1)
+    modules.append(('Overrepresented sequences', status, [['#Sequence', 'Count', 'Percentage', 'Possible Source']], rows))
+
+    ## adapter content: cumulative percentage of reads with adapter started at each position
+    content = 100 * np.cumsum(stats.adapter_counts, axis=0) / max(1, total)
+    rows = [[i + 1] + _round(values) for i, values in enumerate(content)]
+    modules.append(('Adapter Content', _status(content.max() if rows else 0, 5, 10),
+                    [['#Position'] + [name for name, seq in stats.adapters]], rows))
+    return (modules)
+
+###############
+def qc_caller(path, files, sample, threads, adapters=None, Debug=False):
+    """Quality check of the files of a sample, if not previously done with same files.
+
+    Files are checked in parallel using a process pool.
+
+    :param path: output folder
+    :param files: fastq files of the sample
+    :param sample: sample name
+    :param threads: number of processes to use
+    :param adapters: adapter sequences to search, in addition to default adapters
+    :param Debug: display complete log.
+
+    :returns: True/False
+    """
+    filename_stamp = path + '/.success'
+    key = step_cache.step_key(files, ['XICRA_qc', adapters], None, Debug)
+    if step_cache.previous_results(filename_stamp, key):
+        stamp = functions.time_functions.read_time_stamp(filename_stamp)
+        print (colored("\tA previous command generated results on: %s [%s -- %s]" %(stamp, sample, 'XICRA qc'), 'yellow'))
+        return (True)
+
+    try:
+        if threads > 1 and len(files) > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(threads, len(files))) as executor:
+                folders = list(executor.map(qc_file, files, itertools.repeat(path), itertools.repeat(adapters)))
+        else:
+            folders = [qc_file(fastq_file, path, adapters) for fastq_file in files]
+    except (OSError, ValueError) as err:
+        print (colored("** ERROR: Quality check failed for sample %s: %s" %(sample, err), 'red'))
+        return (False)
+
+    if Debug:
+        print (colored("**DEBUG: qc_caller %s: %s **" %(sample, folders), 'yellow'))
+    step_cache.save_step(filename_stamp, key)
+    return (True)
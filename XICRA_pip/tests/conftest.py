@@ -0,0 +1,19 @@
+## useful imports
+import os
+import sys
+
+import pytest
+
+## use XICRA from this folder
+xicra_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, xicra_folder)
+
+## example data: see subset2test/test_subset.sh
+subset_folder = os.path.join(os.path.dirname(xicra_folder), "subset2test")
+
+@pytest.fixture
+def subset_data():
+    """Absolute path to subset2test folder, tests are skipped if not available."""
+    if not os.path.isdir(subset_folder):
+        pytest.skip("subset2test data not available")
+    return subset_folder
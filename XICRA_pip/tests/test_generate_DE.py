@@ -0,0 +1,57 @@
+## useful imports
+import os
+
+import pandas as pd
+import pytest
+
+from XICRA.scripts import generate_DE, expression_store
+
+pytestmark = pytest.mark.skipif(not expression_store.parquet_available(), reason="pyarrow not available")
+
+##########################################################
+def miraligner_results(folder, samples):
+    """Creates a mirtop table for each sample as generated by miraligner and returns the dataframe of results."""
+    rows = []
+    for n, sample in enumerate(samples):
+        this_file = os.path.join(folder, sample + ".tsv")
+        table = pd.DataFrame({'UID': ['iso-22-A', 'iso-22-B', 'iso-21-C'],
+                              'Read': ['ACGTACGTACGTACGTACGTAC', 'TTGTACGTACGTACGTACGTAC', 'ACGTACGTACGTACGTACGTA'],
+                              'miRNA': ['hsa-let-7a-5p', 'hsa-let-7a-5p', 'hsa-miR-21-5p'],
+                              'Variant': [None, 'iso_3p:+1', None],
+                              sample: [10 + n, 0 + n, 5]})
+        if n % 2:
+            table = table.iloc[:2]
+        table.to_csv(this_file, sep='\t', index=False)
+        rows.append({'name': sample, 'soft': 'miraligner', 'filename': this_file})
+    return (pd.DataFrame(rows).set_index('name'))
+
+def read_matrix(outfolder):
+    store_prefix = os.path.join(outfolder, 'miRNA_expression-miraligner')
+    return (expression_store.long2matrix(expression_store.read_store(store_prefix + '.parquet'),
+                                         keys=['miRNA', 'variant', 'UID']))
+
+##########################################################
+def test_matrix2long_empty():
+    """An expression matrix with no data returns an empty long table."""
+    all_data = pd.DataFrame(index=pd.Index(['hsa-let-7a-5p&NA&iso-22-A'], name='ID'))
+    long_data = expression_store.matrix2long(all_data, keys=['miRNA', 'variant', 'UID'])
+    assert long_data.empty
+    assert long_data.columns.to_list() == ['miRNA', 'variant', 'UID', 'sample', 'count']
+
+def test_generate_DE_incremental_rerun(tmp_path):
+    """Running twice with no new samples keeps the expression store."""
+    samples = ['s1', 's2', 's3']
+    results = miraligner_results(str(tmp_path), samples)
+    outfolder = str(tmp_path)
+    
+    generate_DE.generate_DE(results, False, outfolder, expression_format='parquet', incremental=True)
+    first = read_matrix(outfolder)
+    assert first.columns.to_list() == samples
+    
+    ## nothing changed
+    generate_DE.generate_DE(results, False, outfolder, expression_format='parquet', incremental=True)
+    pd.testing.assert_frame_equal(read_matrix(outfolder), first)
+    
+    ## a sample removed is discarded from the store
+    generate_DE.generate_DE(results.drop('s2'), False, outfolder, expression_format='parquet', incremental=True)
+    pd.testing.assert_frame_equal(read_matrix(outfolder), first.drop(columns='s2').dropna(how='all'))
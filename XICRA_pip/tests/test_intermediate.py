@@ -0,0 +1,55 @@
+## useful imports
+import os
+from argparse import Namespace
+
+import pytest
+
+from XICRA.other_tools import intermediate
+
+##########################################################
+@pytest.fixture
+def project(tmp_path):
+    """Project with trimmed reads: zstd (s1, lane L001) and gzip (s2) compressed, and files to discard."""
+    files = ["s1/trim/s1_L001_trim_R1.fastq.zst", "s1/trim/s1_L001_trim_R2.fastq.zst",
+             "s1/trim/s1_L001_trim_orphan.fastq.zst", "s1/trim/fastqc_s1_trim_R1.fastq.zst",
+             "s1/join/s1_L001_trim_joined.fastq.zst", "s1/join/s1_L001_trim_unjoin_R1.fastq.zst",
+             "s2/trim/s2_trim_R1.fastq.gz", "s2/trim/s2_trim_R2.fastq.gz",
+             "s2/join/s2_trim_joined.fastq.gz"]
+    for f in files:
+        os.makedirs(os.path.dirname(str(tmp_path / f)), exist_ok=True)
+        (tmp_path / f).touch()
+    return (tmp_path)
+
+def get_options(**kwargs):
+    options = dict(project=True, batch=False, pair=True, include_all=False, include_lane=False,
+                   in_sample=None, ex_sample=None, debug=False)
+    options.update(kwargs)
+    return (Namespace(**options))
+
+def files_retrieved(pd_samples_retrieved):
+    assert not pd_samples_retrieved.astype(str).apply(lambda column: column.str.contains(r'\.zst\.gz')).any().any()
+    return (sorted(os.path.basename(f) for f in pd_samples_retrieved['sample']))
+
+##########################################################
+def test_get_files_trim(project):
+    pd_samples_retrieved = intermediate.get_files(get_options(), str(project), "trim", ['_trim'], False)
+    assert files_retrieved(pd_samples_retrieved) == ["s1_L001_trim_R1.fastq.zst", "s1_L001_trim_R2.fastq.zst",
+                                                     "s2_trim_R1.fastq.gz", "s2_trim_R2.fastq.gz"]
+    assert set(pd_samples_retrieved['gz']) == {'.zst', '.gz'}
+
+    ## lane and samples selected as HCGB
+    pd_samples_retrieved = intermediate.get_files(get_options(include_lane=True, in_sample="s1"), str(project), "trim", ['_trim'], False)
+    assert files_retrieved(pd_samples_retrieved) == ["s1_L001_trim_R1.fastq.zst", "s1_L001_trim_R2.fastq.zst"]
+    assert all(name.startswith('s1_L001') for name in pd_samples_retrieved['name'])
+
+def test_get_files_join(project):
+    pd_samples_retrieved = intermediate.get_files(get_options(pair=False), str(project), "join", ['_joined.fastq', '_joined.fastq.gz'], False)
+    assert files_retrieved(pd_samples_retrieved) == ["s1_L001_trim_joined.fastq.zst", "s2_trim_joined.fastq.gz"]
+
+def test_get_files_batch(project):
+    ## project and batch options: list of folders
+    batch_file = project / "batch.txt"
+    batch_file.write_text("%s\n%s\n" %(project / "s1" / "trim", project / "s2" / "trim"))
+    pd_samples_retrieved = intermediate.get_files(get_options(batch=True), str(batch_file), "trim", ['_trim'], False)
+    assert files_retrieved(pd_samples_retrieved) == ["s1_L001_trim_R1.fastq.zst", "s1_L001_trim_R2.fastq.zst",
+                                                     "s2_trim_R1.fastq.gz", "s2_trim_R2.fastq.gz"]
@@ -0,0 +1,156 @@
+## useful imports
+import os
+import re
+import gzip
+import random
+import shutil
+import subprocess
+from collections import Counter
+
+import pytest
+
+from XICRA.scripts import isomir_converter
+
+##########################################################
+def mirtop_version():
+    """Returns the version of mirtop available, if any."""
+    if not shutil.which("mirtop"):
+        return (None)
+    proc = subprocess.run(["mirtop", "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    found = re.search(r"mirtop ([0-9\.]+)", proc.stdout)
+    return (found.group(1) if found else None)
+
+## conversion follows the miRTop version required by XICRA
+pytestmark = pytest.mark.skipif(mirtop_version() != "0.4.23", reason="mirtop 0.4.23 not available")
+
+##########################################################
+def subset_miRNAs(subset_data, n=40):
+    """Returns the most abundant sequences (18-26 nt) of subset_PE reads."""
+    counts = Counter()
+    folder = os.path.join(subset_data, "subset_PE")
+    for fastq in sorted(os.listdir(folder)):
+        if not fastq.endswith("_R1.fq.gz"):
+            continue
+        with gzip.open(os.path.join(folder, fastq), "rt") as fastq_hd:
+            for i, line in enumerate(fastq_hd):
+                read = line.strip()
+                if i % 4 == 1 and 18 <= len(read) <= 26 and "N" not in read:
+                    counts[read] += 1
+    return (counts.most_common(n))
+
+def subset_results(subset_data, folder):
+    """
+    Creates a miRBase like annotation (hairpin fasta and GFF3) with the most abundant 
+    sequences of subset2test data as 5p matures and, using isomiRs of them, the results 
+    of miraligner, sRNAbench and OptimiR for a sample.
+    """
+    rand = random.Random(7)
+    random_seq = lambda n: ''.join(rand.choice('ACGT') for _ in range(n))
+    
+    precursors = {}
+    matures = []
+    gff = ['##gff-version 3', '# microRNAs:               miRBase v22', '# genome-build-id:    GRCh38']
+    pos = 1000
+    for i, (mature, count) in enumerate(subset_miRNAs(subset_data)):
+        name = 'hsa-mir-%d' %i
+        seq = random_seq(5) + mature + random_seq(rand.randint(10, 30)) + random_seq(22) + random_seq(7)
+        precursors[name] = seq
+        strand = rand.choice('+-')
+        start, end = pos, pos + len(seq) - 1
+        gff.append('chr1\t.\tmiRNA_primary_transcript\t%d\t%d\t.\t%s\t.\tID=MI%05d;Alias=MI%05d;Name=%s' %(start, end, strand, i, i, name))
+        for arm, (a, b) in (('5p', (5, 5 + len(mature))), ('3p', (len(seq) - 29, len(seq) - 7))):
+            if strand == '+':
+                mature_start, mature_end = start + a, start + b - 1
+            else:
+                mature_start, mature_end = end - b + 1, end - a
+            mature_name = 'hsa-miR-%d-%s' %(i, arm)
+            gff.append('chr1\t.\tmiRNA\t%d\t%d\t.\t%s\t.\tID=MIMAT%05d%s;Alias=MIMAT%05d%s;Name=%s;Derives_from=MI%05d' %(
+                mature_start, mature_end, strand, i, arm, i, arm, mature_name, i))
+            matures.append((name, mature_name, a, b, count))
+        pos += 200
+    
+    hairpin = os.path.join(folder, 'hairpin.fa')
+    with open(hairpin, 'w') as hairpin_hd:
+        for name, seq in precursors.items():
+            hairpin_hd.write('>%s MI0000000 Homo sapiens %s stem-loop\n%s\n' %(name, name, seq.replace('T', 'U')))
+    miRNA_gff = os.path.join(folder, 'hsa.gff3')
+    with open(miRNA_gff, 'w') as gff_hd:
+        gff_hd.write('\n'.join(gff) + '\n')
+    
+    ## isomiRs: trimmed/extended ends, SNVs and non-template additions
+    reads = {}
+    for k in range(600):
+        name, mature_name, a, b, count = rand.choice(matures)
+        start = max(0, a + rand.randint(-3, 3))
+        seq = list(precursors[name][start:b + rand.randint(-3, 3)])
+        if rand.random() < .3:
+            seq[rand.randrange(len(seq))] = rand.choice('ACGT')
+        seq = ''.join(seq)
+        if rand.random() < .3:
+            seq += rand.choice(['A', 'T', 'AA', 'TT', 'G', 'C'])
+        reads.setdefault(seq, (name, mature_name, start, max(1, count // rand.randint(1, 20))))
+    
+    ## miraligner
+    rows = ['seq\tname\tfreq\tmir\tstart\tend\tmism\tadd\tt5\tt3\ts5\ts3\tDB\tprecursor\tambiguity']
+    for i, (seq, (name, mature_name, start, count)) in enumerate(reads.items()):
+        rows.append('\t'.join([seq, 'seq_%d_x%d' %(i, count), str(count), mature_name, str(start + 1), str(start + len(seq)),
+                               '0', '0', '0', '0', 'NA', 'NA', 'miRNA', name, '1']))
+        if rand.random() < .1:
+            name2, mature2, a2, b2, count2 = rand.choice(matures)
+            rows.append('\t'.join([seq, 'seq_%d_x%d' %(i, count), str(count), mature2, str(a2 + 1), str(a2 + len(seq)),
+                                   '0', '0', '0', '0', 'NA', 'NA', 'miRNA', name2, '1']))
+    os.makedirs(os.path.join(folder, 'miraligner'))
+    with open(os.path.join(folder, 'miraligner', 'S1.mirna'), 'w') as out_hd:
+        out_hd.write('\n'.join(rows) + '\n')
+    
+    ## sRNAbench
+    annotation = ['seq\tcount\tRPM\ttype\thits']
+    isomiRs = ['seq\tname\tx\tisoClass\tNucVar']
+    labels = ['exact', 'lv3p|lv3pE#1', 'lv3p|lv3pT#-2', 'lv5p|lv5pE#1', 'lv5p|lv5pT#-1', 
+              'nta#A|nta#1', 'NucVar', 'mv', 'lv3p|lv3pE#1@nta#A|nta#1']
+    for seq, (name, mature_name, start, count) in list(reads.items())[:300]:
+        hits = ['miRNA#%s#x#%s,%d,%d,+' %(mature_name, name, start + 1, start + len(seq))]
+        names = [mature_name]
+        if rand.random() < .1:
+            name2, mature2, a2, b2, count2 = rand.choice(matures)
+            hits.append('miRNA#%s#x#%s,%d,%d,+' %(mature2, name2, a2 + 1, a2 + len(seq)))
+            names.append(mature2)
+        annotation.append('\t'.join([seq, str(count), '1.0', 'mature#hairpin', '$'.join(hits)]))
+        isomiRs.append('\t'.join([seq, '$'.join(names), 'x', rand.choice(labels), 
+                                  rand.choice(['3:A>G', '12:C>T', 'NA', '19:G>A,5:T>C'])]))
+    os.makedirs(os.path.join(folder, 'sRNAbench'))
+    with open(os.path.join(folder, 'sRNAbench', 'reads.annotation'), 'w') as out_hd:
+        out_hd.write('\n'.join(annotation) + '\n')
+    with open(os.path.join(folder, 'sRNAbench', 'microRNAannotation.txt'), 'w') as out_hd:
+        out_hd.write('\n'.join(isomiRs) + '\n')
+    
+    ## OptimiR
+    rows = ['## mirGFF3. VERSION 1.0', '## source-ontology: miRBasev22', '## COLDATA: S1_trim_joined']
+    for seq, (name, mature_name, start, count) in list(reads.items())[:200]:
+        variant = rand.choice(['NA', 'iso_3p:+1', 'iso_5p:-1,iso_snv_seed', 'iso_add3p:2,iso_3p:-1'])
+        parent = name + (',hsa-mir-99' if rand.random() < .1 else '')
+        rows.append('%s\tOptimiR\tisomiR\t%d\t%d\t.\t+\t.\tRead=%s; UID=%s; Name=%s; Parent=%s; Variant=%s; Cigar=%dM; Expression=%d; Filter=Pass; Hits=1' %(
+            name if rand.random() < .5 else 'chrX', start + 1, start + len(seq), seq, isomir_converter.make_uid(seq), 
+            mature_name, parent, variant, len(seq), count))
+    os.makedirs(os.path.join(folder, 'OptimiR', 'OptimiR_Results'))
+    with open(os.path.join(folder, 'OptimiR', 'OptimiR_Results', 'S1_trim_joined.gff3'), 'w') as out_hd:
+        out_hd.write('\n'.join(rows) + '\n')
+    
+    return (hairpin, miRNA_gff)
+
+##########################################################
+@pytest.mark.parametrize("format, software", [("seqbuster", "miraligner"), ("sRNAbench", "sRNAbench"), ("optimir", "OptimiR")])
+def test_parity_mirtop(subset_data, tmp_path, format, software):
+    """Count tables generated by XICRA and miRTop are equal."""
+    (hairpin, miRNA_gff) = subset_results(subset_data, str(tmp_path))
+    outdir = str(tmp_path / ("parity_" + software))
+    
+    assert isomir_converter.parity_test(str(tmp_path / software), format, hairpin, miRNA_gff, 'hsa', outdir)
+    
+    ## rows are also generated in the same order
+    with open(os.path.join(outdir, 'miRTop', 'counts', 'mirtop.tsv')) as mirtop_hd:
+        mirtop_rows = [line.split('\t')[0] for line in mirtop_hd]
+    with open(os.path.join(outdir, 'mirtop_XICRA.tsv')) as xicra_hd:
+        xicra_rows = [line.split('\t')[0] for line in xicra_hd]
+    assert len(xicra_rows) > 50
+    assert mirtop_rows == xicra_rows
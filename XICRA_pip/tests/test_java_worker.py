@@ -0,0 +1,110 @@
+## useful imports
+import os
+import re
+import shutil
+import zipfile
+import subprocess
+
+import pytest
+
+from XICRA.other_tools import java_worker, instrument, scheduler
+
+pytestmark = pytest.mark.skipif(not (shutil.which("java") and shutil.which("javac")), reason="java and javac not available")
+
+## tool keeping the number of calls in a static field and calling System.exit() if a status is given
+tool_source = '''
+public class CountCalls {
+    static int calls = 0;
+
+    public static void main(String[] args) throws Exception {
+        calls++;
+        java.io.PrintWriter out = new java.io.PrintWriter(new java.io.FileWriter(args[0]));
+        out.println(calls);
+        out.close();
+        System.out.println("calls: " + calls);
+        if (args.length > 1) {
+            System.exit(Integer.parseInt(args[1]));
+        }
+    }
+}
+'''
+
+##########################################################
+@pytest.fixture
+def tool_jar(tmp_path):
+    """Compiles the tool and returns its jar file."""
+    with open(str(tmp_path / "CountCalls.java"), 'w') as source_hd:
+        source_hd.write(tool_source)
+    subprocess.run(["javac", "-d", str(tmp_path / "classes"), str(tmp_path / "CountCalls.java")], check=True)
+    
+    jar = str(tmp_path / "CountCalls.jar")
+    with zipfile.ZipFile(jar, 'w') as jar_hd:
+        jar_hd.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\nMain-Class: CountCalls\n")
+        jar_hd.write(str(tmp_path / "classes" / "CountCalls.class"), "CountCalls.class")
+    return (jar)
+
+@pytest.fixture
+def workers():
+    """Enables java workers and returns the workers pid of the calls recorded."""
+    pids = []
+    def observer(info_call):
+        found = re.match(r"java_worker\[(\d+)\]", info_call['cmd'])
+        pids.append(int(found.group(1)) if found else None)
+    
+    java_worker.enable(True)
+    instrument.add_observer(observer)
+    yield (pids)
+    instrument.remove_observer(observer)
+    java_worker.enable(False)
+    java_worker.shutdown()
+    java_worker._exit_jars.clear()
+
+def read_file(this_file):
+    with open(this_file) as file_hd:
+        return (file_hd.read().strip())
+
+##########################################################
+def test_two_samples_one_worker(tool_jar, workers, tmp_path):
+    """Two jobs run in the same worker and static fields are not shared."""
+    for sample in ("s1", "s2"):
+        code = java_worker.java_call(tool_jar, [str(tmp_path / (sample + ".txt"))], 
+                                     stdout_file=str(tmp_path / (sample + ".log")), heap_MB=256)
+        assert code == 'OK'
+        assert read_file(str(tmp_path / (sample + ".txt"))) == "1"
+        assert read_file(str(tmp_path / (sample + ".log"))) == "calls: 1"
+    
+    assert len(workers) == 2
+    assert workers[0] is not None and workers[0] == workers[1]
+    assert len(java_worker._workers) == 1
+
+def test_exit(tool_jar, workers, tmp_path):
+    """System.exit() of the tool returns its status as the status of the job."""
+    assert java_worker.java_call(tool_jar, [str(tmp_path / "s1.txt"), "0"], heap_MB=256) == 'OK'
+    assert java_worker.java_call(tool_jar, [str(tmp_path / "s2.txt"), "3"], heap_MB=256) == 'FAIL'
+    assert java_worker.java_call(tool_jar, [str(tmp_path / "s3.txt")], heap_MB=256) == 'OK'
+    for sample in ("s1", "s2", "s3"):
+        assert read_file(str(tmp_path / (sample + ".txt"))) == "1"
+    
+    if java_worker._workers and java_worker._workers[0].exit_trap:
+        ## trapped: the same worker ran all jobs
+        assert len(set(workers)) == 1 and workers[0] is not None
+    else:
+        ## worker finished by the first job: the rest are executed in a new JVM
+        assert tool_jar in java_worker._exit_jars
+        assert workers[0] is not None and workers[1:] == [None, None]
+
+def test_scheduler_idle_workers(tool_jar, workers, tmp_path):
+    """Heap of idle workers is not available for jobs of the scheduler."""
+    assert java_worker.java_call(tool_jar, [str(tmp_path / "s1.txt")], heap_MB=256) == 'OK'
+    assert java_worker.idle_RAM() == 256 * 1024**2
+    
+    ## job fits with the idle worker
+    with scheduler.ResourceScheduler(1, 1, job_RAM=100 * 1024**2, max_RAM=400 * 1024**2) as executor:
+        executor.submit(lambda: None).result()
+    assert len(java_worker._workers) == 1
+    
+    ## job does not fit with the idle worker: it is closed
+    with scheduler.ResourceScheduler(1, 1, job_RAM=200 * 1024**2, max_RAM=400 * 1024**2) as executor:
+        executor.submit(lambda: None).result()
+    assert not java_worker._workers
+    assert java_worker.idle_RAM() == 0
@@ -0,0 +1,34 @@
+## useful imports
+import os
+import sys
+import subprocess
+
+from conftest import xicra_folder
+
+main_script = os.path.join(xicra_folder, "main", "XICRA")
+
+##########################################################
+def imported_modules(*args):
+    """Returns modules imported by XICRA main script with the arguments given (python -X importtime)."""
+    env = dict(os.environ, PYTHONPATH=xicra_folder)
+    proc = subprocess.run([sys.executable, "-X", "importtime", main_script] + list(args),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
+    assert proc.returncode == 0
+    modules = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            modules.append(line.split("|")[2].strip())
+    return (modules)
+
+def test_help_imports():
+    """XICRA -h does not import pandas, HCGB or XICRA modules."""
+    modules = imported_modules("-h")
+    assert modules
+    for module in modules:
+        root = module.split(".")[0]
+        assert root not in ("pandas", "numpy", "HCGB", "XICRA"), module
+
+def test_module_help_imports():
+    """Help of a module does not import it."""
+    modules = imported_modules("miRNA", "-h")
+    assert not [x for x in modules if x.split(".")[0] in ("pandas", "HCGB", "XICRA")]
@@ -0,0 +1,126 @@
+## useful imports
+import os
+import random
+from collections import Counter
+from operator import itemgetter
+
+import numpy as np
+
+from XICRA.scripts import pilfer_caller
+
+##########################################################
+def pilfer_code_original(infile, outfile):
+    """
+    pilfer_code as it was before the October 2026 modifications (XICRA v1.x).
+    """
+    sd_factor=3
+    count_reads = []
+    chrom_dict = {}
+    results = []
+
+    infile_pt = open(infile, "r")
+    for row in infile_pt:
+        field=row.strip().split('\t')
+        count_reads.append(float(field[4]))
+        if field[0] in chrom_dict:
+            chrom_dict[field[0]].append(field)
+        else:
+            chrom_dict[field[0]] = [field]
+    infile_pt.close()
+        
+    mean = np.mean(count_reads)
+    sd = np.std(count_reads)
+    
+    for key in chrom_dict:
+        chrom_dict[key] = sorted(chrom_dict[key],key=itemgetter(1))
+
+    for key in chrom_dict:
+        j = 0
+        while j < len(chrom_dict[key]):
+            row = chrom_dict[key][j]
+            if ((int(row[4]) - mean)/sd >= sd_factor):
+                start_bp = int(row[2]) - 100000
+                if start_bp < 0:
+                    start_bp = 0
+                score = 0
+                new_score = 0
+                start_read_index = -1
+                end_read_index = 0
+                
+                cur_read_index = chrom_dict[key].index(row)
+    
+                for read in chrom_dict[key]:
+                    if int(read[1]) >= int(start_bp) and int(read[1]) <= int(start_bp) + 100000:
+                        score += int(read[4])
+                        if start_read_index == -1:
+                            start_read_index = chrom_dict[key].index(read)
+                            start_bp = int(read[1])
+                        end_read_index = chrom_dict[key].index(read)
+    
+                new_score = score
+                max_start = start_read_index
+                max_end = end_read_index
+                for i in range(start_read_index+1,cur_read_index+1): 
+                    new_score = score - int(chrom_dict[key][i-1][4])
+                    while  end_read_index+1 < len(chrom_dict[key]) and int(chrom_dict[key][end_read_index +1][1]) <= int(chrom_dict[key][i][1]) + 100000 :
+                        new_score += int(chrom_dict[key][end_read_index+1][4])
+                        end_read_index += 1
+                    
+                    if new_score > score:
+                        score = new_score
+                        max_start = i
+                        max_end = end_read_index
+    
+                if int(chrom_dict[key][max_start][1]) < int(chrom_dict[key][max_end][2]):
+                    string2print = "chr" + key + ":" + str(chrom_dict[key][max_start][1]) + "-" + str(chrom_dict[key][max_end][2]) + "\t" + str(score) + '\t+\n'
+                else:
+                    string2print = "chr" + key + ":" + str(chrom_dict[key][max_end][1]) + "-" + str(chrom_dict[key][max_start][2]) + "\t" + str(score) + '\t-\n'
+                    
+                results.append(string2print)
+                j = max_end
+            j += 1
+
+    outfile_pt = open(outfile, "w")
+    for l in results:
+        outfile_pt.write(l)
+    outfile_pt.close()
+    return (results)
+
+##########################################################
+def subset_bed(subset_data, bed_file, seed):
+    """
+    Creates a PILFER input BED file using the reads of subset_SE samples.
+    
+    Each unique sequence is placed at a random position (1 to 9 digits, so 
+    string and integer sorting differ) of a few chromosomes.
+    """
+    counts = Counter()
+    folder = os.path.join(subset_data, "subset_SE")
+    for fastq in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, fastq)) as fastq_hd:
+            for i, line in enumerate(fastq_hd):
+                if i % 4 == 1:
+                    counts[line.strip()[:32]] += 1
+    
+    rand = random.Random(seed)
+    with open(bed_file, "w") as bed_hd:
+        for seq, count in sorted(counts.items()):
+            chrom = rand.choice(["1", "2", "X"])
+            start = rand.choice([rand.randint(1, 9999), rand.randint(1, 300000), rand.randint(1, 999999999)])
+            strand = rand.choice(["+", "-"])
+            bed_hd.write("\t".join([chrom, str(start), str(start + len(seq)), seq + "::PU", str(count), strand]) + "\n")
+
+##########################################################
+def test_pilfer_code_original(subset_data, tmp_path):
+    """pilfer_code returns the same clusters as the original implementation."""
+    for seed in range(5):
+        bed_file = str(tmp_path / ("subset_%s.bed" %seed))
+        subset_bed(subset_data, bed_file, seed)
+        
+        new = pilfer_caller.pilfer_code(bed_file, str(tmp_path / "new.bed"))
+        old = pilfer_code_original(bed_file, str(tmp_path / "old.bed"))
+        
+        assert new
+        assert new == old
+        with open(str(tmp_path / "new.bed")) as new_hd, open(str(tmp_path / "old.bed")) as old_hd:
+            assert new_hd.read() == old_hd.read()
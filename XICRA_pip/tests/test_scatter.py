@@ -0,0 +1,142 @@
+## useful imports
+import os
+import gzip
+import shutil
+from collections import Counter
+
+import pytest
+
+from XICRA.other_tools import scatter
+from XICRA.scripts import collapse_reads, miraligner_caller, optimir_caller, MINTMap_caller
+
+##########################################################
+def read_records(fastq_file):
+    """Returns records (name, sequence, quality) of a fastq file."""
+    open_fn = gzip.open if fastq_file.endswith('.gz') else open
+    with open_fn(fastq_file, 'rt') as fastq_hd:
+        lines = fastq_hd.read().splitlines()
+    return ([(lines[i], lines[i + 1], lines[i + 3]) for i in range(0, len(lines), 4)])
+
+def installed(prog, exe_name):
+    """Returns executable of a tool (as set_config.get_exe), tests are skipped if not available."""
+    exe = shutil.which(os.environ.get(prog, exe_name))
+    if not exe:
+        pytest.skip("%s not available" %prog)
+    return (exe)
+
+def mirna_db():
+    """miRBase files for miRNA tools: XICRA_TEST_MIRNA_DB (see database.miRNA_db)."""
+    db = os.environ.get("XICRA_TEST_MIRNA_DB", "")
+    if not all(os.path.isfile(os.path.join(db, f)) for f in ["hsa.gff3", "hairpin.fa", "mature.fa", "miRNA.str"]):
+        pytest.skip("miRBase files not available: set XICRA_TEST_MIRNA_DB")
+    return (db)
+
+def run_sharded(monkeypatch, caller, sample_folder, threads):
+    """Executes a caller with small shards: at least 10 unique sequences for each shard."""
+    monkeypatch.setattr(scatter, "min_shard_sequences", 10)
+    os.makedirs(sample_folder)
+    assert caller(sample_folder, threads)
+
+def results(folder, ending):
+    """Content of files of a folder (recursive) ending as given."""
+    contents = {}
+    for root, dirs, files in os.walk(folder):
+        for f in files:
+            if f.endswith(ending):
+                with open(os.path.join(root, f)) as file_hd:
+                    contents[os.path.relpath(os.path.join(root, f), folder)] = file_hd.read()
+    return (contents)
+
+##########################################################
+def test_split_fastq(subset_data, tmp_path):
+    fastq_file = os.path.join(subset_data, "subset_tRNA", "s1.fastq.gz")
+    collapsed_file = str(tmp_path / "s1.rc")
+    collapse_reads.collapse_reads(fastq_file, collapsed_file)
+
+    shard_files = [str(tmp_path / ("shard_%s.fastq" %i)) for i in range(3)]
+    (offsets, shard_reads) = scatter.split_fastq(fastq_file, collapsed_file, shard_files)
+
+    ## original records, same order, each sequence in a single shard
+    records = read_records(fastq_file)
+    shard_records = [read_records(f) for f in shard_files]
+    assert shard_reads == [len(r) for r in shard_records]
+    assert Counter(records) == Counter(sum(shard_records, []))
+    for shard in shard_records:
+        assert shard == [record for record in records if record in set(shard)]
+    seqs = [set(record[1] for record in shard) for shard in shard_records]
+    assert not (seqs[0] & seqs[1]) and not (seqs[0] & seqs[2]) and not (seqs[1] & seqs[2])
+
+    ## same shards as collapsed reads
+    rc_files = [str(tmp_path / ("shard_%s.rc" %i)) for i in range(3)]
+    assert scatter.split_collapsed(collapsed_file, rc_files) == (offsets, shard_reads)
+    for rc_file, shard_seqs in zip(rc_files, seqs):
+        with open(rc_file) as rc_hd:
+            assert set(line.split('\t')[0] for line in rc_hd) == shard_seqs
+
+def test_scatter_gather_fallback(subset_data, tmp_path, monkeypatch):
+    ## outputs of the shards not merged: all reads analyzed at once
+    monkeypatch.setattr(scatter, "min_shard_sequences", 10)
+    fastq_file = os.path.join(subset_data, "subset_tRNA", "s1.fastq.gz")
+    runs = []
+    def run_shard(reads, folder):
+        runs.append(read_records(reads[0]))
+        return (True)
+
+    assert scatter.scatter_gather([fastq_file], str(tmp_path), "s1", 4, run_shard, lambda *args: False, 'fastq')
+    assert len(runs) == 5
+    assert runs[-1] == read_records(fastq_file)
+    assert not os.path.exists(str(tmp_path / "shards"))
+
+def test_scatter_gather_failed(subset_data, tmp_path):
+    ## system calls return 'FAIL': not sharded (single thread, small sample) or sharded
+    fastq_file = os.path.join(subset_data, "subset_PE", "rep_1_R1.fq.gz")
+    run_shard = lambda reads, folder: 'FAIL'
+    assert scatter.scatter_gather([fastq_file], str(tmp_path), "rep_1", 1, run_shard, None, 'fastq') is False
+    assert scatter.scatter_gather([fastq_file], str(tmp_path), "rep_1", 4, run_shard, None, 'rc') is False
+    assert scatter.scatter_gather([fastq_file], str(tmp_path), "rep_1", 4, lambda reads, folder: 'OK', None, 'rc') is True
+
+##########################################################
+def test_miraligner_parity(subset_data, tmp_path, monkeypatch):
+    installed("miraligner", "miraligner.jar")
+    database = mirna_db()
+    reads = [os.path.join(subset_data, "subset_SE", "sample_1.fastq")]
+    caller = lambda folder, threads: miraligner_caller.miraligner_caller(reads, folder, "sample_1", threads, database, "hsa", False)
+
+    run_sharded(monkeypatch, caller, str(tmp_path / "unsharded"), 1)
+    run_sharded(monkeypatch, caller, str(tmp_path / "sharded"), 4)
+
+    unsharded = results(str(tmp_path / "unsharded"), ".mirna")
+    assert unsharded
+    assert results(str(tmp_path / "sharded"), ".mirna") == unsharded
+
+def test_optimir_parity(subset_data, tmp_path, monkeypatch):
+    installed("optimir", "optimir")
+    database = mirna_db()
+    reads = [os.path.join(subset_data, "subset_SE", "sample_1.fastq")]
+    caller = lambda folder, threads: optimir_caller.optimir_caller(reads, folder, "sample_1", threads,
+                                                                 os.path.join(database, "mature.fa"), os.path.join(database, "hairpin.fa"),
+                                                                 os.path.join(database, "hsa.gff3"), "hsa", False)
+
+    run_sharded(monkeypatch, caller, str(tmp_path / "unsharded"), 1)
+    run_sharded(monkeypatch, caller, str(tmp_path / "sharded"), 4)
+
+    ## GFF3 and summary tables
+    for ending in ("gff3", ".annot"):
+        unsharded = results(str(tmp_path / "unsharded"), ending)
+        assert unsharded
+        assert results(str(tmp_path / "sharded"), ending) == unsharded
+
+def test_mintmap_parity(subset_data, tmp_path, monkeypatch):
+    installed("MINTmap", "MINTmap")
+    reads = [os.path.join(subset_data, "subset_tRNA", "s1.fastq.gz")]
+    caller = lambda folder, threads: MINTMap_caller.MINTmap_caller(folder, reads, "s1", threads, "hsa", "", False)
+
+    run_sharded(monkeypatch, caller, str(tmp_path / "unsharded"), 1)
+    run_sharded(monkeypatch, caller, str(tmp_path / "sharded"), 4)
+
+    ## same rows: order of rows with the same counts is not relevant
+    unsharded = results(str(tmp_path / "unsharded"), "expression.txt")
+    sharded = results(str(tmp_path / "sharded"), "expression.txt")
+    assert unsharded and sorted(sharded) == sorted(unsharded)
+    for output in unsharded:
+        assert sorted(sharded[output].splitlines()) == sorted(unsharded[output].splitlines())
@@ -0,0 +1,30 @@
+## useful imports
+import sys
+
+from HCGB.functions import main_functions
+
+from XICRA.other_tools import scheduler, instrument
+
+##########################################################
+def allocate_call(MB):
+    """Calls a python process allocating the MB given."""
+    cmd = "%s -c \"x = bytearray(%s * 1024 * 1024); import time; time.sleep(1)\"" %(sys.executable, MB)
+    return (instrument.system_call(cmd, message=False, step='python'))
+
+def test_scheduler_peak_RAM(tmp_path):
+    """Peak RAM saved for each step is the peak of its own tool calls."""
+    info_dir = str(tmp_path)
+    
+    with scheduler.ResourceScheduler(2, 1, step="big", info_dir=info_dir) as executor:
+        assert executor.submit(allocate_call, 300).result() == 'OK'
+    
+    with scheduler.ResourceScheduler(2, 1, step="small", info_dir=info_dir) as executor:
+        assert executor.submit(allocate_call, 10).result() == 'OK'
+    
+    resources = main_functions.read_json_file(str(tmp_path / "resources.json"))
+    assert resources['big']['RAM'] > 300 * 1024 * 1024
+    assert resources['small']['RAM'] < 100 * 1024 * 1024
+    assert scheduler.RAM_estimate(info_dir, "small") == resources['small']['RAM']
+    
+    ## no observers left
+    assert not instrument._observers
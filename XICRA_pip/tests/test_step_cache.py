@@ -0,0 +1,40 @@
+## useful imports
+import os
+import json
+
+from XICRA.other_tools import step_cache, instrument
+from XICRA.scripts import sRNAbench_caller
+
+##########################################################
+def test_succeeded():
+    assert step_cache.succeeded('OK') and step_cache.succeeded(True) and step_cache.succeeded('/path/file.bed')
+    assert not step_cache.succeeded('FAIL') and not step_cache.succeeded(False) and not step_cache.succeeded(None)
+    assert not step_cache.succeeded(instrument.system_call('exit 1', message=False))
+
+def test_failed_step_not_saved(tmp_path, monkeypatch):
+    ## a failed call is executed again on the next run
+    info_dir = tmp_path / "info"
+    info_dir.mkdir()
+    monkeypatch.setattr(step_cache, "_manifest_file", None)
+    monkeypatch.setattr(step_cache, "_manifest", {'files': {}, 'steps': {}})
+    step_cache.set_manifest(str(info_dir))
+    reads = tmp_path / "reads.fastq"
+    reads.write_text("@r1\nACGT\n+\nIIII\n")
+
+    calls = []
+    def sRNAbench(*args):
+        calls.append(args)
+        return ('FAIL' if len(calls) == 1 else 'OK')
+    monkeypatch.setattr(sRNAbench_caller, "sRNAbench", sRNAbench)
+    monkeypatch.setattr(step_cache.set_config, "get_exe", lambda prog, Debug=False, Return_Version=False: ('/bin/' + prog, '1.0'))
+
+    sample_folder = str(tmp_path / "sample")
+    os.makedirs(sample_folder)
+    assert not sRNAbench_caller.sRNAbench_caller([str(reads)], sample_folder, "sample", 1, "hsa", False)
+    assert not os.path.isfile(os.path.join(sample_folder, ".success"))
+
+    assert sRNAbench_caller.sRNAbench_caller([str(reads)], sample_folder, "sample", 1, "hsa", False)
+    assert sRNAbench_caller.sRNAbench_caller([str(reads)], sample_folder, "sample", 1, "hsa", False)
+    assert len(calls) == 2
+    with open(str(info_dir / "step_cache.json")) as manifest_hd:
+        assert os.path.join(sample_folder, ".success") in json.load(manifest_hd)['steps']